@@ -5,14 +5,25 @@ import os
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 import json
 from code.search.engine import SearchEngine  # Sin el punto inicial
+from code.search.hydration import hydrate_businesses, iter_hydrated_businesses
+from code.search.snapshot import get_snapshot
+from code.search.db_pool import get_pool
+from code.search.diagnostics import diagnostics_enabled
+from code.search.result_cache import invalidation_enabled, invalidation_authorized
+from code.search.serialization import dumps
+from code.search.pagination import InvalidCursorError
+from code.search.capture import TrafficCapture
+from code.search.query_profile import PROFILER as query_profiler, SORT_KEYS, top_shapes
+from code.search import stages, metrics, tracing
 from dotenv import load_dotenv
 import logging
 import traceback
 import datetime
+import time
 import mysql.connector
 
 log_dir = os.environ.get('LOG_DIR', os.path.join(os.path.expanduser("~"), "logs"))
@@ -67,6 +78,19 @@ class CustomJSONEncoder(json.JSONEncoder):
 
 app.json_encoder = CustomJSONEncoder
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Cuenta cada petición por endpoint y estado para /metrics"""
+    if 'request_started' in g:
+        metrics.observe_request(request.endpoint or 'unknown', request.method, response.status_code, g.request_started)
+    # La traza de /search se cierra aquí, ya con el código de estado
+    tracing.finish(**{'http.status_code': response.status_code})
+    return response
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     """Manejador global de excepciones para la aplicación"""
@@ -102,23 +126,31 @@ for key, value in db_config.items():
 
 # Inicializar motor de búsqueda
 try:
-    import socket
-
-    # Logging de información de red
-    logging.info(f"Hostname: {socket.gethostname()}")
-    logging.info(f"IP Local: {socket.gethostbyname(socket.gethostname())}")
-
     search_engine = SearchEngine(db_config)
 
     if not search_engine.test_database_connection():
         raise Exception("No se pudo establecer conexión con la base de datos")
     print("Motor de búsqueda inicializado correctamente")
+
+    # Sonda de diagnóstico de arranque (solo en modo diagnóstico, en segundo plano)
+    if diagnostics_enabled():
+        search_engine.diagnostics.start()
 except Exception as e:
     logging.error(f"Error al inicializar el motor de búsqueda: {str(e)}")
     logging.error(f"Detalles del error: {traceback.format_exc()}")
     print(f"Error al inicializar el motor de búsqueda: {str(e)}")
 
 
+# Captura muestreada de peticiones de /search para benchmarks.replay (opt-in)
+traffic_capture = TrafficCapture()
+# Cabecera Server-Timing con los tiempos por etapa de /search
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'True').lower() == 'true'
+
+# Radio máximo de búsqueda (el índice geoespacial permite radios mayores sin cargar la BD)
+MAX_SEARCH_RADIUS_KM = float(os.environ.get('SEARCH_MAX_RADIUS_KM', 50))
+# Resultados máximos por página (las vistas de mapa piden cientos en streaming)
+MAX_PER_PAGE = int(os.environ.get('SEARCH_MAX_PER_PAGE', 500))
+
 #Funcion para serializar objetos datetime
 def json_serializer(obj):
     '''JSON serializer para objetos datetime y otros tipos no serializables'''
@@ -146,222 +178,83 @@ def convert_datetime_objects(obj):
         return [convert_datetime_objects(item) for item in obj]
     return obj
 
-# En api.py - Función para obtener detalles de servicios por IDs:
-def get_services_by_ids(service_ids, db_config):
-    """
-    Obtiene los detalles de servicios basado en una lista de IDs
+def wants_ndjson(data: dict) -> bool:
+    """Modo streaming opt-in: Accept: application/x-ndjson o stream=true"""
+    if any(mimetype == 'application/x-ndjson' and quality > 0 for mimetype, quality in request.accept_mimetypes):
+        return True
+    stream = data.get('stream', request.args.get('stream', False))
+    return str(stream).lower() == 'true'
+
+def get_search_filters(data: dict) -> dict:
+    """Filtros de categoría/servicio del cuerpo: ids sueltos o listas, servicios con AND (all) u OR (any)"""
+    filters = {}
+    for key in ('category_id', 'service_id'):
+        if data.get(key) is not None:
+            filters[key] = int(data[key])
+    for key in ('category_ids', 'service_ids'):
+        if data.get(key):
+            filters[key] = [int(value) for value in data[key]]
+    if data.get('service_match'):
+        filters['service_match'] = str(data['service_match']).lower()
+    return filters
+
+def generate_ndjson(results: list, timer=None):
     """
-    if not service_ids or not isinstance(service_ids, list) or len(service_ids) == 0:
-        return []
-
-    try:
-        # Conectar a la base de datos
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        # Convertir lista de IDs a string para consulta SQL
-        ids_str = ','.join([str(id) for id in service_ids])
-
-        # Consulta para obtener detalles de servicios
-        query = f"SELECT id, service_uuid, service_name FROM services WHERE id IN ({ids_str})"
-
-        print(f"Consulta de servicios: {query}")
-
-        cursor.execute(query)
-        services = cursor.fetchall()
-
-        print(f"Servicios encontrados: {len(services)}")
-
-        return services
-    except Exception as e:
-        print(f"Error obteniendo servicios: {e}")
-        return []
-    finally:
-        if 'conn' in locals() and conn and conn.is_connected():
-            cursor.close()
-            conn.close()
-
-#Funcion para obtener horarios de apertura e cierre de un negocio
-def get_business_hours(business_id, db_config):
-    """"
-    Obtiene los horarios de apertura y cierre de un negocio dado su ID
+    Una línea JSON por negocio, en cuanto su lote está hidratado. Corre después
+    del handler: reactiva su temporizador para que la hidratación cuente en
+    las etapas, y las vuelca a /metrics al terminar el stream.
     """
+    stages.activate(timer)
+    count = 0
     try:
-        #Conectar a la base de datos
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        #Consulta para obtener horarios
-        query = '''
-            SELECT day,
-                   open_a,
-                   close_a,
-                   open_b,
-                   close_b
-            FROM business_hours
-            WHERE business_id = %s
-            '''
-
-        cursor.execute(query, (business_id,))
-        hours = cursor.fetchall()
-
-        #Formatear los horarios en el formato esperado
-        formatted_hours = {}
-        for hour in hours:
-            day_key = f'day_{hour["day"]}'
-            day_data = {}
-
-            if hour['open_a']:
-                day_data['open_a'] = hour['open_a'].strftime('%H:%M') if isinstance(hour['open_a'], datetime.time) else hour['open_a']
-            if hour['close_a']:
-                day_data['close_a'] = hour['close_a'].strftime('%H:%M') if isinstance(hour['close_a'], datetime.time) else hour['close_a']
-            if hour['open_b']:
-                day_data['open_b'] = hour['open_b'].strftime('%H:%M') if isinstance(hour['open_b'], datetime.time) else hour['open_b']
-            if hour['close_b']:
-                day_data['close_b'] = hour['close_b'].strftime('%H:%M') if isinstance(hour['close_b'], datetime.time) else hour['close_b']
-
-            formatted_hours[day_key] = day_data
-
-        #Asegurarse de que todos los dias esten presentes
-        for i in range(7):
-            day_key = f'day_{i}'
-            if day_key not in formatted_hours:
-                formatted_hours[day_key] = {}
-
-        return formatted_hours
+        businesses = iter_hydrated_businesses(results, db_config)
+        while True:
+            # Solo se mide la hidratación, no el tiempo que el cliente tarda en leer
+            started = time.perf_counter()
+            business = next(businesses, None)
+            stages.record('hydrate', started)
+            if business is None:
+                break
+            count += 1
+            yield dumps(business) + b'\n'
     except Exception as e:
-        print(f'Error obteniendo horarios: {e}')
-        return {}
+        logging.error(f"Error en búsqueda (streaming): {str(e)}\n{traceback.format_exc()}")
+        yield dumps({'success': False, 'message': f'Error: {str(e)}'}) + b'\n'
     finally:
-        if 'conn' in locals() and conn and conn.is_connected():
-            cursor.close()
-            conn.close()
-
-#Funcion para obtener la categoria de un negocio
-def get_business_category(category_id, db_config):
-    '''
-    Obtiene la categoria de un negocio dado su ID
-    '''
-    try:
-        #Conectar a la base de datos
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        #Consulta para obtener la categoria
-        query = """
-            SELECT id, category_uuid, category_name
-            FROM categories
-            WHERE id = %s
-        """
-
-        cursor.execute(query, (category_id,))
-        category = cursor.fetchone()
-
-        if not category:
-            return None
-
-        #Añadir subcategorias vacias como en el ejemplo
-        category['subcategories'] = []
-
-        #Añadir campos adicionales si son necesarios
-        category['category_image_path'] = "https://foodly.s3.amazonaws.com/public/categories_images/default.jpg"
-
-        return category
-    except Exception as e:
-        print(f'Error obteniendo categoria: {e}')
-        return None
-    finally:
-        if 'conn' in locals() and conn and conn.is_connected():
-            cursor.close()
-            conn.close()
-
-#Funcion para obtener los menús de un negocio
-def get_business_menus(business_id, db_config):
-    '''
-    Obtiene los menús de un negocio dado su ID
-    '''
-    try:
-        #Conectar a la base de datos
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        #Consulta para obtener los menús
-        query = """
-            SELECT id, uuid, business_id
-            FROM business_menus
-            WHERE business_id = %s
-        """
-
-        cursor.execute(query, (business_id,))
-        menus = cursor.fetchall()
-
-        #Obtener el UUID del negocio para incluirlo en la respuesta
-        business_uuid_query = '''SELECT business_uuid FROM businesses WHERE id = %s'''
-        cursor.execute(business_uuid_query, (business_id,))
-        business_result = cursor.fetchone()
-        business_uuid = business_result['business_uuid'] if business_result else None
-
-        #Formatesar los menus en el formato esperado
-        formatted_menus = []
-
-        for menu in menus:
-            formatted_menus.append({
-                'id': menu['id'],
-                'uuid': menu['uuid'],
-                'business_uuid': business_uuid,
-            })
-
-        return formatted_menus
-    except Exception as e:
-        print(f'Error obteniendo menus: {e}')
-        return []
-    finally:
-        if 'conn' in locals() and conn and conn.is_connected():
-            cursor.close()
-            conn.close()
-
-#Funcion para obtener las imagenes de portada de un negocio
-def get_business_cover_images(business_id, db_config):
-    '''
-    Obtiene las imagenes de portada de un negocio dado su ID
-    '''
-    try:
-        #Conectar a la base de datos
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor(dictionary=True)
-
-        #Consulta para obtener las imagenes
-        query = """
-            SELECT id, business_image_uuid, business_image_path
-            FROM business_cover_images
-            WHERE business_id = %s
-        """
-
-        cursor.execute(query, (business_id,))
-        images = cursor.fetchall()
-
-        return images
-    except Exception as e:
-        print(f"Error obteniendo imágenes de portada: {e}")
-        return []
-    finally:
-        if 'conn' in locals() and conn and conn.is_connected():
-            cursor.close()
-            conn.close()
-
+        metrics.observe_stages(timer)
+        stages.finish()
+    logging.info(f"Respuesta enviada (streaming): {count} negocios encontrados")
 
 @app.route('/search', methods=['POST'])
 def search():
     print("========== NUEVA BÚSQUEDA INICIADA ==========")
+    streaming = False
     try:
         data = request.json
         logging.info(f"Solicitud de búsqueda recibida: {data}")
+        traffic_capture.record(data)
+        timer = stages.start()
+        tracing.start('POST /search', **{
+            'http.method': 'POST',
+            'http.route': '/search',
+            'search.voice_text': data.get('voice_text') or None,
+            'search.radius': data.get('radius'),
+            'search.page': data.get('page'),
+            'search.per_page': data.get('per_page')
+        })
 
         # Obtener parámetros de la solicitud
         latitude = data.get('latitude')
         longitude = data.get('longitude')
-        radius = min(float(data.get('radius', 5)), 50)
+        radius = min(float(data.get('radius', 5)), MAX_SEARCH_RADIUS_KM)
         voice_text = data.get('voice_text', '')
+        page = max(int(data.get('page', 1)), 1)
+        per_page = min(max(int(data.get('per_page', 20)), 1), MAX_PER_PAGE)
+        cursor = data.get('cursor') or None
+        # Usuario que busca (opcional): solo para search_logs y las estadísticas de usuarios únicos
+        user_id = str(data['user_id']) if data.get('user_id') not in (None, '') else None
+        stream = wants_ndjson(data)
+        filters = get_search_filters(data)
 
         print(f"Parámetros procesados: lat={latitude}, lon={longitude}, radius={radius}, text='{voice_text}'")
 
@@ -375,8 +268,6 @@ def search():
 
         print(f"Coordenadas: {coordinates}")
 
-        print(f"Configuración DB: {db_config}")
-
         results = {}
 
         # Si hay texto de voz, usar el procesador de voz
@@ -384,7 +275,12 @@ def search():
             logging.info(f"Procesando búsqueda por voz: '{voice_text}'")
             search_result = search_engine.process_voice_search(
                 voice_text=voice_text,
-                coordinates=coordinates
+                coordinates=coordinates,
+                page=page,
+                per_page=per_page,
+                cursor=cursor,
+                filters=filters,
+                user_id=user_id
             )
             print(f"Resultados del procesamiento de voz: {search_result.get('search_params', {})}")
             results = search_result['results']
@@ -393,127 +289,81 @@ def search():
             logging.info("Procesando búsqueda por ubicación")
             search_result = search_engine.search_businesses(
                 query="",  # Búsqueda vacía para obtener todos los negocios en el radio
+                filters=filters,
                 coordinates=coordinates,
-                radius=radius
+                radius=radius,
+                page=page,
+                per_page=per_page,
+                cursor=cursor,
+                user_id=user_id
             )
             results = search_result
 
         print(f"Resultados obtenidos: {results}")
 
+        # Paginación por cursor: total (exacto o estimado) y cursor de la página siguiente
+        stats = results.get('stats', {})
+        total = stats.get('total', 0) or 0
+        next_cursor = stats.get('next_cursor')
+        facets = stats.get('facets')
+
+        if stream:
+            # NDJSON: el cliente recibe cada negocio sin esperar a la página entera
+            headers = {
+                'X-Accel-Buffering': 'no',
+                'Cache-Control': 'no-cache',
+                'X-Total-Count': str(total),
+                'X-Next-Cursor': next_cursor or ''
+            }
+            if SERVER_TIMING_ENABLED:
+                headers['Server-Timing'] = timer.server_timing()
+            streaming = True
+            return app.response_class(
+                generate_ndjson(results.get('results', []), timer),
+                mimetype='application/x-ndjson',
+                headers=headers
+            )
 
-        # Transformar los resultados al formato esperado por Laravel
+        # Transformar los resultados al formato esperado por Laravel.
+        # La hidratación se hace por lotes: una consulta por tabla para toda la página
         businesses = []
 
         if 'results' in results:
-            for business in results['results']:
-                try:
-                    # Imprimir el business crudo para depuración
-                    print(f"Business raw: {json.dumps(business, default=str)}")
-
-                    # Procesar IDs de servicios
-                    business_services = []
-                    # Procesar IDs de servicios SOLO si existen y no son null
-                    if 'service_ids' in business and business['service_ids']:
-                        try:
-                            # Convertir service_ids de string a lista de enteros
-                            service_ids = [int(id.strip()) for id in business['service_ids'].split(',') if id.strip()]
-
-                            if service_ids:  # Solo procesar si hay IDs válidos
-                                # Obtener detalles de servicios desde la base de datos
-                                services = get_services_by_ids(service_ids, db_config)
-
-                                # Preparar la lista de servicios para la respuesta
-                                for service in services:
-                                    business_services.append({
-                                        "id": service['id'],
-                                        "service_uuid": service.get('service_uuid', f"service-{service['id']}"),
-                                        "service_name": service.get('service_name', f"Service {service['id']}")
-                                    })
-                        except Exception as service_error:
-                            print(f"Error procesando service_ids: {service_error}")
-                            # Continuar con business_services como lista vacía si hay error
-
-                     # Obtener categoría completa
-                    category = convert_datetime_objects(get_business_category(business.get('category_id'), db_config))
-
-                    # Obtener horarios de apertura
-                    business_hours = convert_datetime_objects(get_business_hours(business['id'], db_config))
-
-                    # Obtener menús del negocio
-                    business_menus = convert_datetime_objects(get_business_menus(business.get('id', ''), db_config))
-
-                    # Obtener imágenes de portada
-                    cover_images = convert_datetime_objects(get_business_cover_images(business['id'], db_config))
-
-                    # Crear estructura del negocio según el formato esperado
-                    business_data = {
-                        'id': business['id'],
-                        'user_id': business.get('user_id', 1),
-                        'business_uuid': business.get('business_uuid', f"business-{business['id']}"),
-                        'business_logo': business.get('business_logo', ''),
-                        'business_name': business['name'],
-                        'business_email': business.get('email', ''),
-                        'business_phone': business.get('phone', ''),
-                        'business_about_us': business.get('business_about_us', ''),
-                        'business_services': business_services,
-                        'business_additional_info': business.get('business_additional_info', ''),
-                        'business_address': business.get('address', ''),
-                        'business_zipcode': business.get('business_zipcode', ''),
-                        'business_city': business.get('business_city', ''),
-                        'business_country': business.get('business_country', ''),
-                        'business_website': business.get('business_website', ''),
-                        'business_latitude': business.get('latitude', 0),
-                        'business_longitude': business.get('longitude', 0),
-                        'business_menus': business_menus,
-                        'category_id': business.get('category_id', 0),
-                        'category': category or {},
-                        'business_opening_hours': business_hours,
-                        #'created_at': business.get('created_at', datetime.datetime.now()).strftime('%Y-%m-%d %H:%M:%S') if isinstance(business.get('created_at'), datetime.datetime) else business.get('created_at', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-                        #'updated_at': business.get('updated_at', datetime.datetime.now()).strftime('%Y-%m-%d %H:%M:%S') if isinstance(business.get('updated_at'), datetime.datetime) else business.get('updated_at', datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-                        'cover_images': cover_images or [],
-                        'business_promotions': [],
-                        'business_branches': []
-                    }
-
-                    if 'distance_km' in business:
-                        business_data['distance'] = round(business['distance_km'], 2)
-                    elif 'distance' in business:
-                        business_data['distance'] = round(business['distance'], 2)
-                    else:
-                        business_data['distance'] = 0.0
-
-                    if 'relevance' in business:
-                        business_data['score'] = float(business['relevance'])
-                    else:
-                        business_data['score'] = 1.0
-
-                    businesses.append(business_data)
-                except Exception as e:
-                    print(f'Error procesando negocio {business.get("id", "unknown")}: {e}')
-                    logging.error(f"Error procesando negocio {business.get('id', 'unknown')}: {e}")
+            with stages.stage('hydrate'):
+                businesses = hydrate_businesses(results['results'], db_config)
 
         logging.info(f"Respuesta enviada: {len(businesses)} negocios encontrados")
 
-        # Convertir todos los objetos datetime a strings
-        businesses = convert_datetime_objects(businesses)
-
         # Estructura de respuesta esperada por Laravel
         response = {
              "success": True,
              "business": {
                  "data": businesses,
                  "count": len(businesses),
-                 "page": 1,
-                 "total_pages": 1
+                 "page": stats.get('page', page),
+                 "total_pages": max(1, -(-total // per_page)),
+                 "total": total,
+                 "next_cursor": next_cursor,
+                 "facets": facets
              }
          }
 
-        response_json_string = json.dumps(response, default=lambda o: o.isoformat() if isinstance(o, (datetime.datetime, datetime.date, datetime.time)) else str(o))
-        parsed_response = json.loads(response_json_string)
+        # Una sola serialización (orjson si está instalado); fechas, Decimal y
+        # demás tipos se convierten durante la propia codificación
+        with stages.stage('serialize'):
+            body = dumps(response)
+        http_response = app.response_class(body, mimetype='application/json')
+        if SERVER_TIMING_ENABLED:
+            http_response.headers['Server-Timing'] = timer.server_timing()
+        return http_response
 
 
-        return jsonify(parsed_response)
-
+    except InvalidCursorError as e:
+        logging.warning(f"Cursor inválido en búsqueda: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 400
 
     except Exception as e:
         import traceback
@@ -525,23 +375,161 @@ def search():
             'message': f'Error: {str(e)}'
         }), 500
 
+    finally:
+        # En streaming las etapas se vuelcan al terminar generate_ndjson
+        if not streaming:
+            metrics.observe_stages(stages.current())
+        stages.finish()
+
+@app.route('/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """
+    Invalida la caché de resultados. Con {"business_id": id} lo hace como
+    hook de negocio modificado (además fuerza el refresco de los índices).
+    Solo con CACHE_INVALIDATION_ENABLED=true y la cabecera
+    Authorization: Bearer <CACHE_INVALIDATION_TOKEN>.
+    """
+    if not invalidation_enabled():
+        return jsonify({'success': False, 'message': 'Cache invalidation disabled'}), 404
+
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not invalidation_authorized(token.strip()):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True) or {}
+    business_id = data.get('business_id')
+    if business_id is not None:
+        search_engine.invalidate_business(int(business_id))
+    else:
+        search_engine.result_cache.invalidate('solicitud explícita')
+
+    return jsonify({
+        'success': True,
+        'result_cache': search_engine.result_cache.stats()
+    })
+
+@app.route('/debug/diagnostics', methods=['GET'])
+def debug_diagnostics():
+    """
+    Diagnóstico de red y base de datos (solo con DIAGNOSTICS_ENABLED=true).
+    Devuelve el resultado cacheado de la sonda de arranque; ?refresh=true la
+    vuelve a ejecutar y ?latitude=&longitude=&radius= ejecuta además el
+    diagnóstico de búsqueda por radio.
+    """
+    if not diagnostics_enabled():
+        return jsonify({'success': False, 'message': 'Diagnostics disabled'}), 404
+
+    probe = search_engine.diagnostics
+    result = probe.get_cached()
+    if result is None or request.args.get('refresh', 'false').lower() == 'true':
+        result = probe.run()
+
+    response = {'success': True, 'diagnostics': result}
+
+    if request.args.get('latitude') and request.args.get('longitude'):
+        coordinates = {
+            'latitude': float(request.args.get('latitude')),
+            'longitude': float(request.args.get('longitude'))
+        }
+        radius = float(request.args.get('radius', 5))
+        filters = {}
+        if request.args.get('category_id'):
+            filters['category_id'] = int(request.args.get('category_id'))
+        businesses = search_engine._diagnose_business_search(coordinates, radius, filters)
+        response['business_search'] = {
+            'coordinates': coordinates,
+            'radius': radius,
+            'filters': filters,
+            'total': len(businesses),
+            'businesses': businesses
+        }
+
+    return jsonify(convert_datetime_objects(response))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Métricas en formato de texto de Prometheus. Con METRICS_MULTIPROC_DIR
+    suma las de todos los workers de gunicorn.
+    """
+    if not metrics.REGISTRY.enabled:
+        return jsonify({'success': False, 'message': 'Metrics disabled'}), 404
+    return app.response_class(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/debug/slow', methods=['GET'])
+def debug_slow_requests():
+    """
+    Últimas búsquedas que superaron TRACE_SLOW_MS en este worker, con su
+    árbol de spans y las consultas agrupadas por huella. ?format=otlp las
+    devuelve en OTLP/JSON y ?limit=N limita el número de trazas. Expone
+    consultas y parámetros: solo con DIAGNOSTICS_ENABLED=true.
+    """
+    if not diagnostics_enabled():
+        return jsonify({'success': False, 'message': 'Diagnostics disabled'}), 404
+    if not tracing.tracing_enabled():
+        return jsonify({'success': False, 'message': 'Tracing disabled'}), 404
+
+    traces = tracing.SLOW_TRACES.traces(request.args.get('limit', type=int))
+    if request.args.get('format') == 'otlp':
+        return jsonify(tracing.to_otlp(traces))
+    return jsonify({
+        'success': True,
+        'threshold_ms': tracing.SLOW_TRACE_MS,
+        'recorded': tracing.SLOW_TRACES.recorded,
+        'traces': [trace.to_dict() for trace in traces]
+    })
+
+@app.route('/debug/queries', methods=['GET'])
+def debug_queries():
+    """
+    Formas de consulta más costosas con sus percentiles, el plan de EXPLAIN
+    de las que superaron QUERY_SLOW_MS y pistas de índices. Con
+    QUERY_PROFILE_DIR suma las de todos los workers.
+    ?sort=total|p95|max|mean|count|slow, ?limit=N, ?plans=true
+    Solo con DIAGNOSTICS_ENABLED=true.
+    """
+    if not diagnostics_enabled():
+        return jsonify({'success': False, 'message': 'Diagnostics disabled'}), 404
+    if not query_profiler.enabled:
+        return jsonify({'success': False, 'message': 'Query profile disabled'}), 404
+
+    sort = request.args.get('sort', 'total')
+    if sort not in SORT_KEYS:
+        return jsonify({'success': False, 'message': f"sort debe ser uno de {', '.join(SORT_KEYS)}"}), 400
+    include_plan = request.args.get('plans', 'false').lower() == 'true'
+    return jsonify({
+        'success': True,
+        'slow_ms': query_profiler.slow_ms,
+        'queries': top_shapes(query_profiler.collect(), request.args.get('limit', 20, type=int), sort, include_plan)
+    })
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificar que la API está funcionando"""
     try:
-        # Verificar conexión a la base de datos
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        cursor.close()
-        conn.close()
+        # Verificar conexión a la base de datos con una conexión del pool
+        pool = get_pool(db_config)
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
         
         return jsonify({
             'status': 'healthy',
             'version': '1.0.0',
             'database': 'connected',
-            'search_engine': 'available' if search_engine else 'unavailable'
+            'search_engine': 'available' if search_engine else 'unavailable',
+            'db_pool': pool.stats(),
+            'parse_cache': search_engine.text_processor.parse_cache.stats() if search_engine else None,
+            'result_cache': search_engine.result_cache.stats() if search_engine else None,
+            'single_flight': search_engine.single_flight.stats() if search_engine else None,
+            'traffic_capture': traffic_capture.stats(),
+            'trace_exporter': tracing.EXPORTER.stats(),
+            'query_profile': query_profiler.stats(),
+            'search_log': search_engine.search_log.stats() if search_engine else None,
+            'analytics': search_engine.analytics.stats() if search_engine else None,
+            'business_snapshot': get_snapshot().stats() if get_snapshot() else None
         })
     except Exception as e:
         logging.error(f"Health check failed: {str(e)}")
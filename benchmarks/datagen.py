@@ -0,0 +1,388 @@
+"""
+Generador de datos sintéticos para los benchmarks de búsqueda.
+
+Crea y rellena businesses, categories, services, business_service,
+business_hours, business_menus y business_cover_images (más search_logs y
+las tablas de analítica) a escala 1k/10k/100k, en un fichero SQLite (el
+sustituto de benchmarks.standin) o en un MySQL/MariaDB local. Las categorías
+y servicios salen de code/cfg/search_map.json para que las consultas de voz
+de los benchmarks se resuelvan contra ids reales. Los datos son
+deterministas para una misma semilla.
+
+Uso:
+    python -m benchmarks.datagen --scale 10k --sqlite /tmp/foodly-bench.db
+    python -m benchmarks.datagen --scale 100k --mysql-host 127.0.0.1 --mysql-database foodly_bench
+
+Nunca escribe en un MySQL remoto salvo con --allow-remote.
+"""
+from typing import Dict, List, Optional
+import argparse
+import datetime
+import random
+import sqlite3
+import json
+import time
+import uuid
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from code.search.querys import ROLLUP_TABLES_DDL, SKETCH_TABLES_DDL
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+# Ciudades con su centro; los negocios se reparten alrededor (~15 km)
+CITIES = [
+    ('Covilhã', 40.2806, -7.5040),
+    ('Lisboa', 38.7223, -9.1393),
+    ('Porto', 41.1579, -8.6291),
+    ('Coimbra', 40.2033, -8.4103),
+    ('Braga', 41.5454, -8.4265),
+    ('Faro', 37.0194, -7.9304),
+    ('Madrid', 40.4168, -3.7038),
+    ('Salamanca', 40.9701, -5.6635),
+    ('Sevilla', 37.3891, -5.9845),
+    ('Guarda', 40.5373, -7.2658),
+]
+
+NAME_WORDS = ['Casa', 'Cantinho', 'Tasca', 'Sabores', 'Jardim', 'Mercado', 'Estrela', 'Aldeia', 'Porto', 'Sol']
+
+# Una columna id autoincremental en cada dialecto
+ID_COLUMN = {
+    'mysql': 'id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY',
+    'sqlite': 'id INTEGER PRIMARY KEY'
+}
+
+TABLES = {
+    'categories': """
+        CREATE TABLE IF NOT EXISTS categories (
+            {id},
+            category_uuid VARCHAR(64) NOT NULL,
+            category_name VARCHAR(255) NOT NULL
+        )
+    """,
+    'services': """
+        CREATE TABLE IF NOT EXISTS services (
+            {id},
+            service_uuid VARCHAR(64) NOT NULL,
+            service_name VARCHAR(255) NOT NULL
+        )
+    """,
+    'businesses': """
+        CREATE TABLE IF NOT EXISTS businesses (
+            {id},
+            user_id BIGINT NOT NULL,
+            business_uuid VARCHAR(64) NOT NULL,
+            business_name VARCHAR(255) NOT NULL,
+            business_about_us TEXT,
+            business_address VARCHAR(255),
+            business_email VARCHAR(255),
+            business_phone VARCHAR(64),
+            business_latitude DECIMAL(10,7),
+            business_longitude DECIMAL(10,7),
+            business_logo VARCHAR(255),
+            business_additional_info TEXT,
+            business_zipcode VARCHAR(32),
+            business_city VARCHAR(128),
+            business_country VARCHAR(128),
+            business_website VARCHAR(255),
+            category_id BIGINT,
+            created_at DATETIME,
+            updated_at DATETIME,
+            deleted_at DATETIME NULL
+        )
+    """,
+    'business_service': """
+        CREATE TABLE IF NOT EXISTS business_service (
+            business_id BIGINT NOT NULL,
+            service_id BIGINT NOT NULL
+        )
+    """,
+    'business_hours': """
+        CREATE TABLE IF NOT EXISTS business_hours (
+            {id},
+            business_id BIGINT NOT NULL,
+            day INT NOT NULL,
+            open_a TIME NULL,
+            close_a TIME NULL,
+            open_b TIME NULL,
+            close_b TIME NULL
+        )
+    """,
+    'business_menus': """
+        CREATE TABLE IF NOT EXISTS business_menus (
+            {id},
+            uuid VARCHAR(64) NOT NULL,
+            business_id BIGINT NOT NULL
+        )
+    """,
+    'business_cover_images': """
+        CREATE TABLE IF NOT EXISTS business_cover_images (
+            {id},
+            business_id BIGINT NOT NULL,
+            business_image_uuid VARCHAR(64) NOT NULL,
+            business_image_path VARCHAR(255) NOT NULL
+        )
+    """,
+    'search_logs': """
+        CREATE TABLE IF NOT EXISTS search_logs (
+            {id},
+            query VARCHAR(255),
+            filters TEXT,
+            results_count INT,
+            execution_time_ms INT,
+            user_id VARCHAR(64),
+            created_at DATETIME
+        )
+    """,
+}
+
+INDEXES = [
+    ('idx_businesses_category', 'businesses', 'category_id'),
+    ('idx_businesses_updated', 'businesses', 'updated_at'),
+    ('idx_businesses_city', 'businesses', 'business_city'),
+    ('idx_business_service_business', 'business_service', 'business_id'),
+    ('idx_business_service_service', 'business_service', 'service_id'),
+    ('idx_business_hours_business', 'business_hours', 'business_id'),
+    ('idx_business_menus_business', 'business_menus', 'business_id'),
+    ('idx_business_cover_images_business', 'business_cover_images', 'business_id'),
+    ('idx_search_logs_created', 'search_logs', 'created_at'),
+]
+
+
+def load_mappings() -> Dict:
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'code', 'cfg', 'search_map.json')
+    with open(path, 'r') as mappings_file:
+        return json.load(mappings_file)
+
+
+def parse_scale(scale: str) -> int:
+    """'10k' o un número de negocios"""
+    return SCALES.get(scale.lower()) or int(scale)
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _time(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def generate_hours(rng: random.Random, business_id: int) -> List[tuple]:
+    """
+    Horario semanal: la mayoría con turno partido (comida y cena), algunos
+    continuos y algunos que cierran después de medianoche; ~1 día libre
+    """
+    rows = []
+    style = rng.random()
+    closed_day = rng.randrange(7) if rng.random() < 0.8 else None
+    for day in range(7):
+        if day == closed_day:
+            continue
+        if style < 0.6:
+            open_a, close_a = rng.choice([660, 690, 720]), rng.choice([900, 930, 960])
+            open_b, close_b = rng.choice([1140, 1170]), rng.choice([1380, 1410, 0])
+            rows.append((business_id, day, _time(open_a), _time(close_a), _time(open_b), _time(close_b)))
+        elif style < 0.85:
+            open_a, close_a = rng.choice([420, 480, 540]), rng.choice([1080, 1140, 1200])
+            rows.append((business_id, day, _time(open_a), _time(close_a), None, None))
+        else:
+            open_a, close_a = rng.choice([1200, 1260]), rng.choice([60, 120, 180])
+            rows.append((business_id, day, _time(open_a), _time(close_a), None, None))
+    return rows
+
+
+def generate(businesses: int, seed: int = 42) -> Dict[str, List[tuple]]:
+    """Filas de todas las tablas para el número de negocios indicado"""
+    rng = random.Random(seed)
+    mappings = load_mappings()
+    now = datetime.datetime(2024, 6, 1, 12, 0, 0)
+
+    categories = sorted(mappings['categories'].items(), key=lambda item: item[1]['id'])
+    services = sorted(mappings['services'].items(), key=lambda item: item[1]['id'])
+
+    rows: Dict[str, List[tuple]] = {table: [] for table in TABLES if table != 'search_logs'}
+    for name, category in categories:
+        rows['categories'].append((category['id'], _uuid(rng), name.replace('_', ' ').title()))
+    for name, service in services:
+        rows['services'].append((service['id'], _uuid(rng), name.replace('_', ' ').title()))
+
+    service_ids = [service['id'] for _, service in services]
+    for business_id in range(1, businesses + 1):
+        category_name, category = rng.choice(categories)
+        keyword = rng.choice(category['keywords'])
+        city, latitude, longitude = rng.choice(CITIES)
+        updated_at = now - datetime.timedelta(minutes=rng.randrange(60 * 24 * 365))
+        rows['businesses'].append((
+            business_id,
+            rng.randrange(1, businesses // 10 + 2),
+            _uuid(rng),
+            f"{rng.choice(NAME_WORDS)} {keyword.title()} {business_id}",
+            f"{keyword.title()} in {city}. {rng.choice(NAME_WORDS)} kitchen since {rng.randrange(1950, 2024)}.",
+            f"Rua {rng.randrange(1, 400)}, {city}",
+            f"business{business_id}@foodly.test",
+            f"+351 2{rng.randrange(10000000, 99999999)}",
+            round(latitude + rng.gauss(0, 0.06), 7),
+            round(longitude + rng.gauss(0, 0.06), 7),
+            f"https://foodly.s3.amazonaws.com/public/logos/{business_id}.jpg",
+            '',
+            f"{rng.randrange(1000, 9999)}-{rng.randrange(100, 999)}",
+            city,
+            'Spain' if city in ('Madrid', 'Salamanca', 'Sevilla') else 'Portugal',
+            f"https://business{business_id}.foodly.test",
+            category['id'],
+            (updated_at - datetime.timedelta(days=rng.randrange(1, 400))).isoformat(' '),
+            updated_at.isoformat(' '),
+            updated_at.isoformat(' ') if rng.random() < 0.02 else None
+        ))
+        for service_id in rng.sample(service_ids, rng.randrange(2, 8)):
+            rows['business_service'].append((business_id, service_id))
+        rows['business_hours'].extend(generate_hours(rng, business_id))
+        for _ in range(rng.randrange(0, 4)):
+            rows['business_menus'].append((_uuid(rng), business_id))
+        for image in range(rng.randrange(0, 4)):
+            rows['business_cover_images'].append((
+                business_id,
+                _uuid(rng),
+                f"https://foodly.s3.amazonaws.com/public/{business_id}/{image}.jpg"
+            ))
+    return rows
+
+
+COLUMNS = {
+    'categories': ('id', 'category_uuid', 'category_name'),
+    'services': ('id', 'service_uuid', 'service_name'),
+    'businesses': (
+        'id', 'user_id', 'business_uuid', 'business_name', 'business_about_us', 'business_address',
+        'business_email', 'business_phone', 'business_latitude', 'business_longitude', 'business_logo',
+        'business_additional_info', 'business_zipcode', 'business_city', 'business_country',
+        'business_website', 'category_id', 'created_at', 'updated_at', 'deleted_at'
+    ),
+    'business_service': ('business_id', 'service_id'),
+    'business_hours': ('business_id', 'day', 'open_a', 'close_a', 'open_b', 'close_b'),
+    'business_menus': ('uuid', 'business_id'),
+    'business_cover_images': ('business_id', 'business_image_uuid', 'business_image_path'),
+}
+
+
+def create_schema(conn, dialect: str, reset: bool = False):
+    """Tablas del benchmark (borrándolas antes con reset)"""
+    cursor = conn.cursor()
+    for table, ddl in TABLES.items():
+        if reset:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(ddl.format(id=ID_COLUMN[dialect]))
+    for ddl in ROLLUP_TABLES_DDL + SKETCH_TABLES_DDL:
+        cursor.execute(ddl)
+    for name, table, column in INDEXES:
+        if dialect == 'sqlite':
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})")
+        else:
+            cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (name,))
+            if not cursor.fetchall():
+                cursor.execute(f"CREATE INDEX {name} ON {table} ({column})")
+    if dialect == 'mysql':
+        # MATCH AGAINST del camino SQL
+        cursor.execute("SHOW INDEX FROM businesses WHERE Key_name = 'ft_businesses_name'")
+        if not cursor.fetchall():
+            cursor.execute("CREATE FULLTEXT INDEX ft_businesses_name ON businesses (business_name)")
+    cursor.close()
+
+
+def insert_rows(conn, dialect: str, rows: Dict[str, List[tuple]], batch_size: int = 2000):
+    placeholder = '?' if dialect == 'sqlite' else '%s'
+    cursor = conn.cursor()
+    for table, columns in COLUMNS.items():
+        sql = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join([placeholder] * len(columns))})"
+        )
+        table_rows = rows[table]
+        for start in range(0, len(table_rows), batch_size):
+            cursor.executemany(sql, table_rows[start:start + batch_size])
+        conn.commit()
+    cursor.close()
+
+
+def populate(conn, dialect: str, businesses: int, seed: int = 42, reset: bool = True) -> Dict:
+    """Crea el esquema y lo rellena; devuelve las filas por tabla"""
+    cursor = conn.cursor()
+    create_schema(conn, dialect, reset=reset)
+    cursor.execute("SELECT COUNT(*) FROM businesses")
+    existing = cursor.fetchall()[0][0]
+    cursor.close()
+    if existing:
+        raise RuntimeError(f"La tabla businesses ya tiene {existing} filas: usa --reset para regenerar")
+
+    rows = generate(businesses, seed)
+    insert_rows(conn, dialect, rows)
+    return {table: len(table_rows) for table, table_rows in rows.items()}
+
+
+def connect_sqlite(path: str, reset: bool = False):
+    if reset and os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    return conn
+
+
+def connect_mysql(host: str, port: int, user: str, password: Optional[str], database: str, allow_remote: bool = False):
+    if host not in LOCAL_HOSTS and not allow_remote:
+        raise SystemExit(f"Host {host} no es local: los benchmarks no escriben en bases remotas sin --allow-remote")
+    import mysql.connector
+    return mysql.connector.connect(host=host, port=port, user=user, password=password or '', database=database)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos para los benchmarks de búsqueda")
+    parser.add_argument('--scale', default='10k', help="1k, 10k, 100k o un número de negocios")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sqlite', help="fichero SQLite del sustituto de MySQL")
+    parser.add_argument('--mysql-host', default=os.environ.get('BENCHMARK_MYSQL_HOST'))
+    parser.add_argument('--mysql-port', type=int, default=int(os.environ.get('BENCHMARK_MYSQL_PORT', 3306)))
+    parser.add_argument('--mysql-user', default=os.environ.get('BENCHMARK_MYSQL_USER', 'root'))
+    parser.add_argument('--mysql-password', default=os.environ.get('BENCHMARK_MYSQL_PASSWORD'))
+    parser.add_argument('--mysql-database', default=os.environ.get('BENCHMARK_MYSQL_DATABASE', 'foodly_bench'))
+    parser.add_argument('--allow-remote', action='store_true', help="permite un host MySQL no local")
+    parser.add_argument('--reset', action='store_true', help="borra las tablas (o el fichero SQLite) antes de generar")
+    args = parser.parse_args(argv)
+
+    if bool(args.sqlite) == bool(args.mysql_host):
+        parser.error("indica --sqlite o --mysql-host")
+
+    businesses = parse_scale(args.scale)
+    start_time = time.time()
+    if args.sqlite:
+        conn, dialect = connect_sqlite(args.sqlite, reset=args.reset), 'sqlite'
+    else:
+        conn, dialect = connect_mysql(
+            args.mysql_host, args.mysql_port, args.mysql_user, args.mysql_password,
+            args.mysql_database, args.allow_remote
+        ), 'mysql'
+
+    try:
+        counts = populate(conn, dialect, businesses, seed=args.seed, reset=args.reset)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    print(json.dumps({
+        'backend': dialect,
+        'businesses': businesses,
+        'seed': args.seed,
+        'rows': counts,
+        'elapsed_ms': int((time.time() - start_time) * 1000)
+    }))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Histograma de latencias al estilo HdrHistogram: cubetas log-lineales con
+error relativo acotado por las cifras significativas, memoria constante
+respecto al número de muestras y combinable (merge) entre hilos o ejecuciones.
+Los valores se registran como enteros (microsegundos en los benchmarks).
+"""
+from typing import Dict, Iterable, List, Tuple
+import math
+
+DEFAULT_PERCENTILES = (50.0, 75.0, 90.0, 95.0, 99.0, 99.9, 99.99)
+
+
+class LatencyHistogram:
+    """
+    Con significant_digits=3 cada valor se guarda con un error relativo
+    menor de 1/1024 (~0,1 %). Los percentiles devuelven el mayor valor
+    equivalente de su cubeta, como HdrHistogram.
+    """
+
+    def __init__(self, significant_digits: int = 3):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits debe estar entre 1 y 5")
+        self.significant_digits = significant_digits
+        self.sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.counts: Dict[int, int] = {}
+        self.total_count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return (shift + 1) * self.half_count + (value >> shift) - self.half_count
+
+    def _range(self, index: int) -> Tuple[int, int]:
+        """Valores [menor, mayor] que caen en la cubeta index"""
+        if index < self.sub_bucket_count:
+            return index, index
+        shift = index // self.half_count - 1
+        sub = index % self.half_count + self.half_count
+        return sub << shift, ((sub + 1) << shift) - 1
+
+    def record(self, value: float, count: int = 1):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def record_corrected(self, value: float, expected_interval: float):
+        """
+        Registra value y, si supera el intervalo esperado entre peticiones,
+        las muestras que se habrían medido mientras tanto (corrección de
+        omisión coordinada en bucle cerrado)
+        """
+        self.record(value)
+        if expected_interval <= 0:
+            return
+        missing = value - expected_interval
+        while missing >= expected_interval:
+            self.record(missing)
+            missing -= expected_interval
+
+    def merge(self, other: 'LatencyHistogram'):
+        if other.significant_digits != self.significant_digits:
+            raise ValueError("Solo se combinan histogramas con las mismas cifras significativas")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += other.total_count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def mean(self) -> float:
+        return self.total / self.total_count if self.total_count else 0.0
+
+    def value_at_percentile(self, percentile: float) -> int:
+        if not self.total_count:
+            return 0
+        target = max(math.ceil(percentile / 100.0 * self.total_count), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._range(index)[1], self.max)
+        return self.max
+
+    def percentiles(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, int]:
+        return {f"p{percentile:g}": self.value_at_percentile(percentile) for percentile in percentiles}
+
+    def distribution(self, ticks_per_half: int = 5) -> List[Tuple[int, float, int]]:
+        """
+        Distribución de percentiles como la salida .hgrm de HdrHistogram:
+        (valor, percentil, muestras acumuladas). Cada mitad de la distancia
+        que queda hasta el 100 % (0-50, 50-75, 75-87,5...) tiene ticks_per_half
+        puntos, de modo que la cola sale con más detalle.
+        """
+        if not self.total_count:
+            return []
+        ordered = sorted(self.counts)
+        rows = []
+        for level in range(max(self.total_count.bit_length(), 1) + 1):
+            start, end = 100.0 * (1 - 0.5 ** level), 100.0 * (1 - 0.5 ** (level + 1))
+            for tick in range(ticks_per_half):
+                percentile = start + (end - start) * tick / ticks_per_half
+                value = self.value_at_percentile(percentile)
+                cumulative = sum(self.counts[index] for index in ordered if self._range(index)[0] <= value)
+                rows.append((value, percentile, cumulative))
+        rows.append((self.max, 100.0, self.total_count))
+        return rows
+
+    def to_dict(self) -> Dict:
+        return {
+            'significant_digits': self.significant_digits,
+            'count': self.total_count,
+            'min': self.min or 0,
+            'max': self.max,
+            'mean': round(self.mean(), 2),
+            'percentiles': self.percentiles(),
+            # Cubetas no vacías: [menor valor de la cubeta, muestras]
+            'buckets': [[self._range(index)[0], self.counts[index]] for index in sorted(self.counts)]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencyHistogram':
+        histogram = cls(data.get('significant_digits', 3))
+        for value, count in data.get('buckets', []):
+            histogram.record(value, count)
+        if histogram.total_count:
+            histogram.min, histogram.max = data.get('min', histogram.min), data.get('max', histogram.max)
+            histogram.total = int(data.get('mean', 0) * histogram.total_count)
+        return histogram
@@ -0,0 +1,409 @@
+"""
+Reproductor de tráfico y generador de carga para POST /search.
+
+Lee cuerpos de /search en JSONL (uno por línea: voice_text, latitude,
+longitude, radius...; el formato que escribe la captura de SEARCH_CAPTURE_PATH)
+y los envía contra una instancia en marcha:
+
+- closed: --concurrency clientes que envían la siguiente petición al
+  recibir la respuesta (con --think-ms opcional)
+- open: llegadas a --rate peticiones/s (constantes o de Poisson) con
+  independencia de lo que tarde el servidor; la latencia se mide desde el
+  instante previsto de envío, así que las colas del cliente no esconden la
+  lentitud del servidor (omisión coordinada)
+
+Las peticiones del --warmup no se registran. El informe JSON incluye
+histogramas de latencia estilo HdrHistogram (respuesta y servicio), el
+desglose por etapas de la cabecera Server-Timing y la tasa de errores.
+
+Uso:
+    python -m benchmarks.replay capture.jsonl --url http://localhost:8000 --mode closed --concurrency 8 --duration 60
+    python -m benchmarks.replay capture.jsonl --mode open --rate 50 --warmup 10 --output replay.json --hgrm replay.hgrm
+"""
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import argparse
+import datetime
+import random
+import json
+import time
+import sys
+import re
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from benchmarks.histogram import LatencyHistogram
+
+# Campos que identifican una línea como cuerpo de /search
+SEARCH_FIELDS = ('voice_text', 'latitude', 'longitude')
+# Metadatos de la captura que no se envían
+METADATA_FIELDS = ('captured_at',)
+
+SERVER_TIMING = re.compile(r'([\w.-]+)(?:;[^,]*?dur=([\d.]+))?')
+
+
+def load_payloads(path: str, limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+    """Cuerpos de /search del fichero y número de líneas ignoradas"""
+    payloads, skipped = [], 0
+    with open(path, 'r', encoding='utf-8') as payload_file:
+        for line in payload_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(record, dict) or not any(field in record for field in SEARCH_FIELDS):
+                skipped += 1
+                continue
+            payloads.append({key: value for key, value in record.items() if key not in METADATA_FIELDS})
+            if limit and len(payloads) >= limit:
+                break
+    return payloads, skipped
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'parse;dur=1.2, search;dur=3.4' -> {'parse': 1.2, 'search': 3.4}"""
+    stages = {}
+    for entry in (header or '').split(','):
+        match = SERVER_TIMING.match(entry.strip())
+        if match and match.group(2):
+            stages[match.group(1)] = float(match.group(2))
+    return stages
+
+
+class Recorder:
+    """Histogramas y contadores de un hilo (se combinan al final)"""
+
+    def __init__(self, significant_digits: int):
+        self.significant_digits = significant_digits
+        self.response = LatencyHistogram(significant_digits)
+        self.service = LatencyHistogram(significant_digits)
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.statuses: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes = 0
+
+    def record(self, response_ms: float, service_ms: float, status: Optional[int], stages: Dict[str, float],
+               size: int, error: Optional[str] = None, expected_interval_ms: float = 0.0):
+        if expected_interval_ms:
+            self.response.record_corrected(response_ms * 1000, expected_interval_ms * 1000)
+        else:
+            self.response.record(response_ms * 1000)
+        self.service.record(service_ms * 1000)
+        for name, elapsed in stages.items():
+            if name not in self.stages:
+                self.stages[name] = LatencyHistogram(self.significant_digits)
+            self.stages[name].record(elapsed * 1000)
+        if status is not None:
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if error is None and status is not None and status >= 400:
+            error = f"http_{status}"
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        self.bytes += size
+
+    def merge(self, other: 'Recorder'):
+        self.response.merge(other.response)
+        self.service.merge(other.service)
+        for name, histogram in other.stages.items():
+            if name not in self.stages:
+                self.stages[name] = LatencyHistogram(self.significant_digits)
+            self.stages[name].merge(histogram)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        for error, count in other.errors.items():
+            self.errors[error] = self.errors.get(error, 0) + count
+        self.bytes += other.bytes
+
+
+class Replayer:
+    def __init__(self, url: str, payloads: List[Dict], timeout: float = 10.0, shuffle: bool = False,
+                 seed: int = 42, significant_digits: int = 3):
+        self.url = url.rstrip('/') + '/search'
+        self.payloads = list(payloads)
+        if shuffle:
+            random.Random(seed).shuffle(self.payloads)
+        self.timeout = timeout
+        self.significant_digits = significant_digits
+
+        self._next = itertools.cycle(self.payloads)
+        self._next_lock = threading.Lock()
+        self._local = threading.local()
+        self._recorders: List[Recorder] = []
+        self._recorders_lock = threading.Lock()
+
+        self.sent = 0
+        self.backlog_max = 0
+        self.skipped_overload = 0
+
+    def next_payload(self) -> Dict:
+        with self._next_lock:
+            return next(self._next)
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _recorder(self) -> Recorder:
+        recorder = getattr(self._local, 'recorder', None)
+        if recorder is None:
+            recorder = self._local.recorder = Recorder(self.significant_digits)
+            with self._recorders_lock:
+                self._recorders.append(recorder)
+        return recorder
+
+    def send(self, payload: Dict, intended_start: float, record: bool, expected_interval_ms: float = 0.0):
+        """Envía una petición y registra su latencia desde intended_start"""
+        start = time.perf_counter()
+        status, stages, size, error = None, {}, 0, None
+        try:
+            response = self._session().post(self.url, json=payload, timeout=self.timeout)
+            status = response.status_code
+            size = len(response.content)
+            stages = parse_server_timing(response.headers.get('Server-Timing'))
+        except requests.Timeout:
+            error = 'timeout'
+        except requests.ConnectionError:
+            error = 'connection_error'
+        except requests.RequestException as e:
+            error = type(e).__name__
+        end = time.perf_counter()
+        if record:
+            self._recorder().record(
+                (end - intended_start) * 1000, (end - start) * 1000, status, stages, size, error,
+                expected_interval_ms
+            )
+
+    def run_closed(self, concurrency: int, duration: float, warmup: float, max_requests: Optional[int] = None,
+                   think_ms: float = 0.0, expected_interval_ms: float = 0.0):
+        """Bucle cerrado: cada cliente espera su respuesta antes de la siguiente petición"""
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+        counter = itertools.count()
+
+        def client():
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    return
+                record = now >= measure_from
+                if record and max_requests is not None and next(counter) >= max_requests:
+                    return
+                self.send(self.next_payload(), now, record, expected_interval_ms)
+                with self._next_lock:
+                    self.sent += 1
+                if think_ms:
+                    time.sleep(think_ms / 1000.0)
+
+        threads = [threading.Thread(target=client, name=f'replay-client-{n}', daemon=True) for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def arrivals(self, rate: float, arrival: str, seed: int) -> Iterator[float]:
+        """Desfases (s) de cada llegada desde el inicio"""
+        rng = random.Random(seed)
+        offset = 0.0
+        while True:
+            yield offset
+            offset += rng.expovariate(rate) if arrival == 'poisson' else 1.0 / rate
+
+    def run_open(self, rate: float, concurrency: int, duration: float, warmup: float,
+                 max_requests: Optional[int] = None, arrival: str = 'constant', seed: int = 42,
+                 max_backlog: Optional[int] = None):
+        """
+        Bucle abierto: las peticiones salen a su hora prevista. Si todos los
+        clientes están ocupados esperan en cola y ese tiempo cuenta en la
+        latencia; con más de max_backlog en cola se descartan (y se cuentan)
+        """
+        max_backlog = max_backlog or concurrency * 100
+        started = time.perf_counter()
+        measure_from = started + warmup
+        deadline = measure_from + duration
+        backlog = [0]
+        backlog_lock = threading.Lock()
+        measured = 0
+
+        def task(payload: Dict, intended_start: float, record: bool):
+            try:
+                self.send(payload, intended_start, record)
+            finally:
+                with backlog_lock:
+                    backlog[0] -= 1
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay-client') as executor:
+            for offset in self.arrivals(rate, arrival, seed):
+                intended_start = started + offset
+                if intended_start >= deadline:
+                    break
+                record = intended_start >= measure_from
+                if record:
+                    if max_requests is not None and measured >= max_requests:
+                        break
+                    measured += 1
+                delay = intended_start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                with backlog_lock:
+                    if backlog[0] >= max_backlog:
+                        self.skipped_overload += 1
+                        continue
+                    backlog[0] += 1
+                    self.backlog_max = max(self.backlog_max, backlog[0])
+                executor.submit(task, self.next_payload(), intended_start, record)
+                self.sent += 1
+        return time.perf_counter() - started
+
+    def collect(self) -> Recorder:
+        total = Recorder(self.significant_digits)
+        for recorder in self._recorders:
+            total.merge(recorder)
+        return total
+
+
+def histogram_report(histogram: LatencyHistogram, include_buckets: bool = False) -> Dict:
+    """Resumen en milisegundos de un histograma registrado en microsegundos"""
+    report = {
+        'count': histogram.total_count,
+        'mean_ms': round(histogram.mean() / 1000, 3),
+        'min_ms': round((histogram.min or 0) / 1000, 3),
+        'max_ms': round(histogram.max / 1000, 3),
+        'percentiles_ms': {
+            name: round(value / 1000, 3) for name, value in histogram.percentiles().items()
+        }
+    }
+    if include_buckets:
+        report['histogram_us'] = histogram.to_dict()
+    return report
+
+
+def write_hgrm(histogram: LatencyHistogram, path: str):
+    """Distribución de percentiles en el formato de texto de HdrHistogram (valores en ms)"""
+    with open(path, 'w') as hgrm:
+        hgrm.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+        for value, percentile, cumulative in histogram.distribution():
+            fraction = percentile / 100.0
+            inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1 else f"{'inf':>14}"
+            hgrm.write(f"{value / 1000:12.3f} {fraction:14.12f} {cumulative:10d} {inverse}\n")
+        hgrm.write(
+            f"#[Mean    = {histogram.mean() / 1000:12.3f}, Max     = {histogram.max / 1000:12.3f}]\n"
+            f"#[Total count    = {histogram.total_count:12d}]\n"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduce tráfico de /search y genera carga")
+    parser.add_argument('input', help="JSONL con un cuerpo de /search por línea")
+    parser.add_argument('--url', default=os.environ.get('REPLAY_URL', 'http://localhost:8000'))
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--concurrency', type=int, default=8, help="clientes (closed) o máximo en vuelo (open)")
+    parser.add_argument('--rate', type=float, help="peticiones por segundo (modo open)")
+    parser.add_argument('--arrival', choices=('constant', 'poisson'), default='constant')
+    parser.add_argument('--duration', type=float, default=30.0, help="segundos medidos tras el calentamiento")
+    parser.add_argument('--warmup', type=float, default=5.0, help="segundos iniciales que no se registran")
+    parser.add_argument('--requests', type=int, help="máximo de peticiones medidas")
+    parser.add_argument('--think-ms', type=float, default=0.0, help="pausa entre peticiones de un cliente (closed)")
+    parser.add_argument('--expected-interval-ms', type=float, default=0.0,
+                        help="corrige la omisión coordinada en closed con este intervalo esperado")
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--shuffle', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--limit', type=int, help="usa solo las primeras N líneas válidas")
+    parser.add_argument('--significant-digits', type=int, default=3)
+    parser.add_argument('--output', help="fichero JSON del informe (por defecto, salida estándar)")
+    parser.add_argument('--hgrm', help="distribución de la latencia de respuesta en formato HdrHistogram")
+    parser.add_argument('--buckets', action='store_true', help="incluye las cubetas del histograma en el JSON")
+    args = parser.parse_args(argv)
+
+    if args.mode == 'open' and not args.rate:
+        parser.error("el modo open necesita --rate")
+
+    payloads, skipped = load_payloads(args.input, args.limit)
+    if not payloads:
+        print(f"{args.input} no contiene cuerpos de /search ({skipped} líneas ignoradas)")
+        return 1
+
+    replayer = Replayer(args.url, payloads, args.timeout, args.shuffle, args.seed, args.significant_digits)
+    print(
+        f"Reproduciendo {len(payloads)} peticiones ({skipped} líneas ignoradas) contra {replayer.url} "
+        f"en modo {args.mode}: {args.warmup:g}s de calentamiento + {args.duration:g}s medidos"
+    )
+    if args.mode == 'closed':
+        elapsed = replayer.run_closed(
+            args.concurrency, args.duration, args.warmup, args.requests, args.think_ms, args.expected_interval_ms
+        )
+    else:
+        elapsed = replayer.run_open(
+            args.rate, args.concurrency, args.duration, args.warmup, args.requests, args.arrival, args.seed
+        )
+
+    recorder = replayer.collect()
+    completed = recorder.service.total_count
+    errors = sum(recorder.errors.values())
+    measured_seconds = max(min(args.duration, elapsed - args.warmup), 1e-9)
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'url': replayer.url,
+            'input': os.path.abspath(args.input),
+            'payloads': len(payloads),
+            'skipped_lines': skipped,
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'rate': args.rate,
+            'arrival': args.arrival if args.mode == 'open' else None,
+            'warmup_seconds': args.warmup,
+            'duration_seconds': args.duration
+        },
+        'sent': replayer.sent,
+        'completed': completed,
+        'throughput_rps': round(completed / measured_seconds, 2),
+        'errors': recorder.errors,
+        'error_rate': round(errors / completed, 6) if completed else 0.0,
+        'status_codes': recorder.statuses,
+        'mean_response_bytes': int(recorder.bytes / completed) if completed else 0,
+        'client_backlog_max': replayer.backlog_max,
+        'skipped_overload': replayer.skipped_overload,
+        # Respuesta: desde el envío previsto (incluye la cola del cliente en open); servicio: desde el envío real
+        'latency': {
+            'response': histogram_report(recorder.response, args.buckets),
+            'service': histogram_report(recorder.service, args.buckets)
+        },
+        'stages': {name: histogram_report(histogram) for name, histogram in sorted(recorder.stages.items())}
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+    if args.hgrm:
+        write_hgrm(recorder.response, args.hgrm)
+
+    percentiles = report['latency']['response']['percentiles_ms']
+    print(
+        f"{completed} respuestas, {report['throughput_rps']} req/s, errores {report['error_rate'] * 100:.2f}% | "
+        f"p50 {percentiles['p50']}ms p95 {percentiles['p95']}ms p99 {percentiles['p99']}ms "
+        f"máx {report['latency']['response']['max_ms']}ms"
+    )
+    for name, stage in report['stages'].items():
+        print(f"  {name:<10} p50 {stage['percentiles_ms']['p50']:>8}ms  p99 {stage['percentiles_ms']['p99']:>8}ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,470 @@
+"""
+Benchmarks del pipeline de búsqueda contra un sustituto local de MySQL.
+
+Micro-benchmarks (parseo de voz, construcción de SQL, búsqueda por índices y
+por SQL, hidratación y serialización) sobre SearchEngine, y un recorrido
+extremo a extremo de POST /search con el test client de Flask. Cada caso
+informa de p50/p95/p99 y de las consultas a la base de datos por llamada.
+El resultado es un JSON para comparar entre commits (--baseline).
+
+Uso:
+    python -m benchmarks.datagen --scale 10k --sqlite /tmp/foodly-bench.db --reset
+    python -m benchmarks.search --sqlite /tmp/foodly-bench.db --output bench.json
+    python -m benchmarks.search --sqlite /tmp/foodly-bench.db --baseline bench.json
+
+Con --mysql-host se usa un MySQL/MariaDB local (relleno con datagen) en lugar
+de SQLite. La aplicación nunca ve code/cfg/config.json: su configuración de
+base de datos se fija por variables de entorno antes de importarla.
+"""
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager, redirect_stdout
+import importlib
+import subprocess
+import platform
+import argparse
+import datetime
+import tempfile
+import logging
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import standin
+from benchmarks.datagen import CITIES, LOCAL_HOSTS
+
+# Peticiones de /search del recorrido extremo a extremo: (nombre, cuerpo)
+E2E_SCENARIOS = [
+    ('location', {'radius': 10}),
+    ('location_wide', {'radius': 30, 'per_page': 50}),
+    ('voice_category', {'voice_text': 'pizza near me'}),
+    ('voice_service', {'voice_text': 'sushi with wifi'}),
+    ('voice_city', {'voice_text': 'coffee in Porto'}),
+    ('voice_meal', {'voice_text': 'breakfast near me'}),
+    ('voice_time', {'voice_text': 'pizza open after 9 pm'}),
+    ('filters', {'radius': 15, 'category_ids': [3, 16], 'service_ids': [1, 5], 'service_match': 'any'}),
+    ('page_2', {'radius': 10, 'page': 2}),
+]
+
+VOICE_QUERIES = [
+    'pizza near me',
+    'sushi with wifi',
+    'coffee in Porto',
+    'vegan lunch with outdoor seating',
+    'burger open after 9 pm',
+    'breakfast near me',
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not values:
+        return 0.0
+    rank = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies_ms: List[float], queries: List[int]) -> Dict:
+    ordered = sorted(latencies_ms)
+    return {
+        'calls': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 4) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50), 4),
+        'p95_ms': round(percentile(ordered, 0.95), 4),
+        'p99_ms': round(percentile(ordered, 0.99), 4),
+        'max_ms': round(ordered[-1], 4) if ordered else 0.0,
+        'queries_per_call': round(sum(queries) / len(queries), 2) if queries else 0.0
+    }
+
+
+def measure(function: Callable, repeat: int, warmup: int) -> Dict:
+    """Latencia de pared y consultas a la base de datos de cada llamada"""
+    for _ in range(warmup):
+        function()
+    latencies, queries = [], []
+    for _ in range(repeat):
+        before = standin.query_count()
+        start = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(standin.query_count() - before)
+    return summarize(latencies, queries)
+
+
+class _RecordingCursor:
+    """Cursor que no ejecuta nada: aísla la construcción de SQL de su ejecución"""
+
+    def __init__(self):
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self._rows = [{'total': 0}] if sql.lstrip().startswith('SELECT COUNT') else []
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        pass
+
+
+class _RecordingConnection:
+    in_transaction = False
+
+    def cursor(self, *args, **kwargs):
+        return _RecordingCursor()
+
+
+class _RecordingPool:
+    def acquire(self):
+        return _RecordingConnection()
+
+    def release(self, conn, discard: bool = False):
+        pass
+
+
+@contextmanager
+def indexes_disabled(engine):
+    """Fuerza el camino SQL completo marcando los índices en memoria como no cargados"""
+    indexes = [engine.geo_index, engine.columns, engine.text_index, engine.hours_index, engine.facets]
+    previous = [index.loaded for index in indexes]
+    for index in indexes:
+        index.loaded = False
+    try:
+        yield
+    finally:
+        for index, loaded in zip(indexes, previous):
+            index.loaded = loaded
+
+
+@contextmanager
+def swapped_pool(engine, pool):
+    previous = engine.pool
+    engine.pool = pool
+    try:
+        yield
+    finally:
+        engine.pool = previous
+
+
+def run_micro(engine, db_config: Dict, repeat: int, warmup: int, page_size: int) -> Dict:
+    from code.search.hydration import hydrate_businesses
+    from code.search.serialization import dumps, backend
+    from code.search import snapshot as snapshot_module
+
+    _, latitude, longitude = CITIES[0]
+    coordinates = {'latitude': latitude, 'longitude': longitude}
+    processor = engine.text_processor
+    results = {}
+
+    def parse_cold():
+        processor.parse_cache.clear()
+        for text in VOICE_QUERIES:
+            processor.process_voice_query(text, coordinates)
+
+    results['parse.cold'] = measure(parse_cold, repeat, warmup)
+    results['parse.warm'] = measure(
+        lambda: [processor.process_voice_query(text, coordinates) for text in VOICE_QUERIES], repeat, warmup
+    )
+
+    searches = {
+        'location': ('', {}),
+        'text': ('pizza', {}),
+        'filters': ('', {'service_ids': [1, 5], 'service_match': 'any', 'time': {'open_from': '20:00'}}),
+    }
+    for name, (query, filters) in searches.items():
+        results[f'search.index.{name}'] = measure(
+            lambda: engine._search_businesses(query, filters, coordinates, 10, 1, page_size), repeat, warmup
+        )
+        with indexes_disabled(engine):
+            results[f'search.sql.{name}'] = measure(
+                lambda: engine._search_businesses(query, filters, coordinates, 10, 1, page_size), repeat, warmup
+            )
+            with swapped_pool(engine, _RecordingPool()):
+                results[f'sql_build.{name}'] = measure(
+                    lambda: engine._search_businesses(query, filters, coordinates, 10, 1, page_size), repeat, warmup
+                )
+
+    page = engine._search_businesses('', {}, coordinates, 30, 1, page_size)['results']
+    results['hydration.db'] = measure(lambda: hydrate_businesses(page, db_config), repeat, warmup)
+
+    # Snapshot de documentos en un directorio temporal (solo para este proceso)
+    with tempfile.TemporaryDirectory(prefix='foodly-bench-snapshot-') as directory:
+        snapshot_module.build_snapshot(engine.pool, directory, full=True)
+        os.environ['BUSINESS_SNAPSHOT_DIR'] = directory
+        snapshot_module._snapshot = None
+        try:
+            results['hydration.snapshot'] = measure(lambda: hydrate_businesses(page, db_config), repeat, warmup)
+        finally:
+            del os.environ['BUSINESS_SNAPSHOT_DIR']
+            snapshot_module._snapshot = None
+
+    hydrated = hydrate_businesses(page, db_config)
+    response = {'business': hydrated, 'success': True, 'total': len(hydrated), 'next_cursor': None, 'facets': None}
+    results[f'serialization.{backend()}'] = measure(lambda: dumps(response), repeat, warmup)
+    return results
+
+
+def configure_app_environment(args) -> Dict:
+    """
+    Variables de entorno que lee la aplicación al importarse: pool sobre el
+    sustituto, sin caché de resultados (salvo --cache) y sin rollups
+    """
+    if args.sqlite:
+        os.environ['DB_CONNECTOR'] = 'benchmarks.standin:connect'
+        os.environ['BENCHMARK_SQLITE_PATH'] = os.path.abspath(args.sqlite)
+        db_config = {'host': '127.0.0.1', 'user': 'benchmark', 'password': '', 'database': os.path.abspath(args.sqlite)}
+    else:
+        os.environ['DB_CONNECTOR'] = 'benchmarks.standin:counting_connect'
+        db_config = {
+            'host': args.mysql_host,
+            'port': args.mysql_port,
+            'user': args.mysql_user,
+            'password': args.mysql_password or '',
+            'database': args.mysql_database
+        }
+
+    os.environ['DB_HOST'] = str(db_config['host'])
+    os.environ['DB_USER'] = db_config['user']
+    os.environ['DB_PASSWORD'] = db_config['password']
+    os.environ['DB_NAME'] = db_config['database']
+    os.environ['SEARCH_ROLLUPS_ENABLED'] = 'False'
+    os.environ.setdefault('DIAGNOSTICS_ENABLED', 'False')
+    if not args.cache:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+    return db_config
+
+
+def import_app(module_name: str):
+    """
+    Importa la aplicación Flask desde un directorio sin code/cfg/config.json,
+    de modo que tome la configuración de base de datos del entorno
+    """
+    current_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='foodly-bench-') as directory:
+        os.chdir(directory)
+        try:
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                return importlib.import_module(module_name)
+        finally:
+            os.chdir(current_dir)
+
+
+def response_total(data: Optional[Dict]) -> int:
+    """Total de resultados de /search (api.py lo da arriba, application.py dentro de business)"""
+    if not data:
+        return 0
+    if isinstance(data.get('business'), dict):
+        return data['business'].get('total') or 0
+    return data.get('total') or 0
+
+
+def scenario_cities(client) -> Dict[str, List[tuple]]:
+    """
+    Ciudades en las que cada escenario devuelve resultados. Con pocos negocios
+    (1k) una categoría o un servicio pueden no tener ninguno a 5 km del centro
+    de una ciudad, y esa petición mediría la búsqueda vacía en lugar de la
+    ruta que da nombre al escenario.
+    """
+    cities = {}
+    for name, body in E2E_SCENARIOS:
+        cities[name] = []
+        for city in CITIES:
+            response = client.post('/search', json=dict(body, latitude=city[1], longitude=city[2]))
+            if response.status_code == 200 and response_total(response.get_json(silent=True)):
+                cities[name].append(city)
+    return cities
+
+
+def run_e2e(app_module, requests: int, warmup: int) -> Dict:
+    client = app_module.app.test_client()
+    scenarios = {name: ([], [], []) for name, _ in E2E_SCENARIOS}
+    empty = {name: 0 for name, _ in E2E_SCENARIOS}
+    errors = 0
+
+    def request(index: int, record: bool):
+        nonlocal errors
+        name, body = E2E_SCENARIOS[index % len(E2E_SCENARIOS)]
+        if not cities[name]:
+            return
+        _, latitude, longitude = cities[name][(index // len(E2E_SCENARIOS)) % len(cities[name])]
+        body = dict(body, latitude=latitude, longitude=longitude)
+
+        before = standin.query_count()
+        start = time.perf_counter()
+        response = client.post('/search', json=body)
+        data = response.get_data()
+        elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            errors += 1
+            logging.warning(f"/search {name} -> {response.status_code}: {data[:200]!r}")
+        elif record and not response_total(response.get_json(silent=True)):
+            # Un escenario sin resultados mide una ruta distinta de la que dice su nombre
+            empty[name] += 1
+        if record:
+            latencies, queries, sizes = scenarios[name]
+            latencies.append(elapsed)
+            queries.append(standin.query_count() - before)
+            sizes.append(len(data))
+
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        cities = scenario_cities(client)
+        for index in range(warmup):
+            request(index, record=False)
+        for index in range(requests):
+            request(index, record=True)
+
+    all_latencies, all_queries = [], []
+    report = {'scenarios': {}}
+    for name, (latencies, queries, sizes) in scenarios.items():
+        if not latencies:
+            continue
+        all_latencies.extend(latencies)
+        all_queries.extend(queries)
+        report['scenarios'][name] = dict(
+            summarize(latencies, queries), mean_bytes=int(sum(sizes) / len(sizes)),
+            empty=empty[name], cities=len(cities[name])
+        )
+    report['overall'] = summarize(all_latencies, all_queries)
+    report['errors'] = errors
+    report['empty_scenarios'] = sorted(
+        name for name, (latencies, _, _) in scenarios.items()
+        if not cities[name] or (latencies and empty[name] >= len(latencies))
+    )
+    return report
+
+
+def git_revision() -> Dict:
+    def git(*args) -> Optional[str]:
+        try:
+            return subprocess.run(
+                ['git', *args], cwd=ROOT, capture_output=True, text=True, timeout=10
+            ).stdout.strip() or None
+        except Exception:
+            return None
+
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """Casos cuyo p50 o p95 empeora más de threshold (%) respecto a la línea base"""
+    def flatten(report: Dict) -> Dict[str, Dict]:
+        cases = {f"micro.{name}": case for name, case in report.get('micro', {}).items()}
+        e2e = report.get('e2e') or {}
+        cases.update({f"e2e.{name}": case for name, case in e2e.get('scenarios', {}).items()})
+        if e2e.get('overall'):
+            cases['e2e.overall'] = e2e['overall']
+        return cases
+
+    old_cases, new_cases = flatten(baseline), flatten(current)
+    regressions = []
+    print(f"\n{'caso':<32} {'p50 base':>10} {'p50':>10} {'Δ%':>7} {'p95 base':>10} {'p95':>10} {'Δ%':>7} {'q/llam':>7}")
+    for name in sorted(set(old_cases) & set(new_cases)):
+        old, new = old_cases[name], new_cases[name]
+        deltas = []
+        for key in ('p50_ms', 'p95_ms'):
+            deltas.append((new[key] - old[key]) / old[key] * 100 if old[key] else 0.0)
+        flag = ''
+        if any(delta > threshold for delta in deltas) or new['queries_per_call'] > old['queries_per_call']:
+            flag = '  <-- regresión'
+            regressions.append(name)
+        print(
+            f"{name:<32} {old['p50_ms']:>10.3f} {new['p50_ms']:>10.3f} {deltas[0]:>+7.1f} "
+            f"{old['p95_ms']:>10.3f} {new['p95_ms']:>10.3f} {deltas[1]:>+7.1f} "
+            f"{old['queries_per_call']:>3.1f}/{new['queries_per_call']:<3.1f}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de búsqueda")
+    parser.add_argument('--sqlite', help="fichero SQLite generado con benchmarks.datagen")
+    parser.add_argument('--mysql-host', default=os.environ.get('BENCHMARK_MYSQL_HOST'))
+    parser.add_argument('--mysql-port', type=int, default=int(os.environ.get('BENCHMARK_MYSQL_PORT', 3306)))
+    parser.add_argument('--mysql-user', default=os.environ.get('BENCHMARK_MYSQL_USER', 'root'))
+    parser.add_argument('--mysql-password', default=os.environ.get('BENCHMARK_MYSQL_PASSWORD'))
+    parser.add_argument('--mysql-database', default=os.environ.get('BENCHMARK_MYSQL_DATABASE', 'foodly_bench'))
+    parser.add_argument('--only', choices=('micro', 'e2e'), help="ejecuta solo una parte")
+    parser.add_argument('--repeat', type=int, default=200, help="llamadas medidas por micro-benchmark")
+    parser.add_argument('--requests', type=int, default=900, help="peticiones medidas en el recorrido /search")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--app', default='application', help="módulo de la aplicación Flask (application o api)")
+    parser.add_argument('--cache', action='store_true', help="mantiene la caché de resultados activa")
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--output', help="fichero JSON de resultados (por defecto, salida estándar)")
+    parser.add_argument('--baseline', help="JSON de una ejecución anterior para comparar")
+    parser.add_argument('--threshold', type=float, default=10.0, help="% de empeoramiento de p50/p95 que se marca")
+    args = parser.parse_args(argv)
+
+    if bool(args.sqlite) == bool(args.mysql_host):
+        parser.error("indica --sqlite o --mysql-host")
+    if args.sqlite and not os.path.exists(args.sqlite):
+        parser.error(f"{args.sqlite} no existe: genéralo con python -m benchmarks.datagen")
+    if args.mysql_host and args.mysql_host not in LOCAL_HOSTS:
+        parser.error("los benchmarks solo se ejecutan contra un MySQL local")
+
+    # Antes de importar la aplicación, para que su basicConfig no suba el nivel a INFO
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+    db_config = configure_app_environment(args)
+    app_module = import_app(args.app)
+    logging.getLogger().setLevel(args.log_level.upper())
+    engine = app_module.search_engine
+
+    report = {
+        'meta': dict(
+            git_revision(),
+            timestamp=datetime.datetime.now().isoformat(timespec='seconds'),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            backend='sqlite' if args.sqlite else 'mysql',
+            businesses=len(engine.columns) or None,
+            numpy=engine.columns.available(),
+            settings={
+                'repeat': args.repeat, 'requests': args.requests, 'warmup': args.warmup,
+                'per_page': args.per_page, 'app': args.app, 'cache': args.cache
+            }
+        )
+    }
+
+    try:
+        if args.only in (None, 'micro'):
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                report['micro'] = run_micro(engine, db_config, args.repeat, args.warmup, args.per_page)
+        if args.only in (None, 'e2e'):
+            report['e2e'] = run_e2e(app_module, args.requests, args.warmup)
+    finally:
+        engine.search_log.close()
+        engine.analytics.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+        print(f"Resultados guardados en {args.output}")
+    else:
+        print(output)
+
+    status = 0
+    empty_scenarios = report.get('e2e', {}).get('empty_scenarios')
+    if empty_scenarios:
+        print(f"\nEscenarios sin ningún resultado (revisa los datos o el texto de la consulta): {', '.join(empty_scenarios)}")
+        status = 1
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare(json.load(baseline_file), report, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} casos empeoran más de un {args.threshold}%")
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
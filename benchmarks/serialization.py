@@ -0,0 +1,137 @@
+"""
+Micro-benchmark de la serialización de la respuesta de /search.
+
+Compara el pipeline anterior (convert_datetime_objects + json.dumps +
+json.loads + jsonify) con la serialización única de
+code.search.serialization sobre una página de 50 negocios.
+
+Uso: python -m benchmarks.serialization [--businesses 50] [--repeat 2000]
+"""
+from decimal import Decimal
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from code.search.hydration import build_business_data
+from code.search.serialization import backend, dumps, stdlib_dumps
+
+
+def build_page(size: int):
+    """Página sintética con la misma forma que la respuesta real"""
+    services = {
+        id: {'id': id, 'service_uuid': f'service-uuid-{id}', 'service_name': f'Service {id}'}
+        for id in range(1, 17)
+    }
+    categories = {
+        id: {
+            'id': id,
+            'category_uuid': f'category-uuid-{id}',
+            'category_name': f'Category {id}',
+            'subcategories': [],
+            'category_image_path': 'https://foodly.s3.amazonaws.com/public/categories_images/default.jpg'
+        }
+        for id in range(1, 21)
+    }
+
+    businesses = []
+    for id in range(1, size + 1):
+        row = {
+            'id': id,
+            'name': f'Business {id}',
+            'email': f'business{id}@foodly.test',
+            'phone': '+351 275 000 000',
+            'address': f'Rua {id}, Covilhã',
+            'latitude': Decimal('40.2800000') + Decimal(id) / 10000,
+            'longitude': Decimal('-7.5000000') - Decimal(id) / 10000,
+            'service_ids': '1,3,5,8,13',
+            'category_id': id % 20 + 1,
+            'distance_km': id / 10,
+            'relevance': 1.0
+        }
+        hours = {id: {
+            f'day_{day}': {'open_a': datetime.time(9, 0), 'close_a': datetime.time(15, 0),
+                           'open_b': datetime.time(19, 0), 'close_b': datetime.time(23, 30)}
+            for day in range(7)
+        }}
+        menus = {id: [
+            {'id': id * 10 + n, 'uuid': f'menu-{id}-{n}', 'business_uuid': f'business-{id}',
+             'created_at': datetime.datetime(2024, 5, 1, 12, 0)}
+            for n in range(3)
+        ]}
+        cover_images = {id: [
+            {'id': id * 10 + n, 'business_image_uuid': f'image-{id}-{n}',
+             'business_image_path': f'https://foodly.s3.amazonaws.com/public/{id}/{n}.jpg'}
+            for n in range(2)
+        ]}
+        businesses.append(build_business_data(row, services, categories, hours, menus, cover_images))
+    return businesses
+
+
+def convert_datetime_objects(obj):
+    """Copia del conversor recursivo que usaba /search"""
+    if isinstance(obj, datetime.datetime):
+        return obj.strftime('%Y-%m-%d %H:%M:%S')
+    elif isinstance(obj, datetime.date):
+        return obj.strftime('%Y-%m-%d')
+    elif isinstance(obj, datetime.time):
+        return obj.strftime('%H:%M:%S')
+    elif isinstance(obj, dict):
+        return {k: convert_datetime_objects(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_datetime_objects(item) for item in obj]
+    return obj
+
+
+def legacy_pipeline(app, businesses):
+    businesses = convert_datetime_objects(businesses)
+    response = {"business": businesses, "success": True}
+    response_json_string = json.dumps(
+        response,
+        default=lambda o: o.isoformat() if isinstance(o, (datetime.datetime, datetime.date, datetime.time)) else str(o)
+    )
+    with app.app_context():
+        return jsonify(json.loads(response_json_string)).get_data()
+
+
+def cpu_time_us(function, repeat: int) -> float:
+    """Tiempo de CPU medio por llamada en microsegundos"""
+    function()
+    start = time.process_time()
+    for _ in range(repeat):
+        function()
+    return (time.process_time() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--businesses', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    businesses = build_page(args.businesses)
+
+    legacy = legacy_pipeline(app, businesses)
+    if json.loads(legacy) != json.loads(dumps({"business": businesses, "success": True})):
+        print("AVISO: la salida no coincide con la del pipeline anterior")
+
+    results = {
+        'legacy': cpu_time_us(lambda: legacy_pipeline(app, businesses), args.repeat),
+        'stdlib': cpu_time_us(lambda: stdlib_dumps({"business": businesses, "success": True}), args.repeat),
+        backend(): cpu_time_us(lambda: dumps({"business": businesses, "success": True}), args.repeat),
+    }
+
+    print(f"Página de {args.businesses} negocios, {len(legacy)} bytes, {args.repeat} repeticiones")
+    for name, us in results.items():
+        print(f"  {name:<8} {us:9.1f} µs/respuesta  ({results['legacy'] / us:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+Sustituto SQLite de MySQL para los benchmarks.
+
+Expone connect(**db_config) con la misma forma que mysql.connector.connect
+(cursor(dictionary=True), autocommit, start_transaction, ping...) y traduce
+al vuelo lo que usa el camino de búsqueda: placeholders %s, FIELD(),
+ST_Distance_Sphere(point(), point()) y MATCH ... AGAINST. Las columnas TIME,
+DATETIME y DECIMAL se devuelven como timedelta, datetime y Decimal, igual que
+mysql-connector. Los errores se elevan como mysql.connector.Error para que
+los fallbacks del motor se comporten igual.
+
+Se activa en el pool con DB_CONNECTOR=benchmarks.standin:connect; la ruta del
+fichero sale de BENCHMARK_SQLITE_PATH o, si no, de db_config['database'].
+
+counting_connect envuelve mysql.connector.connect para contar también las
+consultas por petición contra un MySQL/MariaDB local.
+"""
+from decimal import Decimal
+from functools import lru_cache
+import threading
+import datetime
+import sqlite3
+import json
+import math
+import re
+import os
+
+import mysql.connector
+from mysql.connector import errors
+
+# Radio de la esfera de ST_Distance_Sphere en MySQL
+SPHERE_RADIUS_M = 6370986
+
+_local = threading.local()
+
+
+def query_count() -> int:
+    """Consultas ejecutadas desde este hilo (las de los hilos de fondo no cuentan)"""
+    return getattr(_local, 'queries', 0)
+
+
+def _count():
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def _convert_time(raw: bytes) -> datetime.timedelta:
+    hours, minutes, seconds = (raw.decode().split(':') + ['0', '0'])[:3]
+    return datetime.timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+sqlite3.register_converter('TIME', _convert_time)
+sqlite3.register_converter('DATETIME', lambda raw: datetime.datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DECIMAL', lambda raw: Decimal(raw.decode()))
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.time, lambda value: value.strftime('%H:%M:%S'))
+sqlite3.register_adapter(datetime.timedelta, lambda value: str(value))
+
+_MATCH = re.compile(r'MATCH\(([^()]+)\)\s*AGAINST\(\s*%s\s+IN\s+NATURAL\s+LANGUAGE\s+MODE\s*\)', re.IGNORECASE)
+_DISTANCE = re.compile(r'ST_Distance_Sphere\(\s*point\(([^()]+)\)\s*,\s*point\(([^()]+)\)\s*\)', re.IGNORECASE)
+_FIELD = re.compile(r'FIELD\(([\w.]+),\s*((?:%s,\s*)*%s)\)', re.IGNORECASE)
+_DATE_SUB = re.compile(r'DATE_SUB\(NOW\(\),\s*INTERVAL\s+%s\s+DAY\)', re.IGNORECASE)
+_EXPLAIN_JSON = re.compile(r'^\s*EXPLAIN\s+FORMAT\s*=\s*JSON\s+', re.IGNORECASE)
+_PLAN_ACCESS = re.compile(r'^(SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER PRIMARY KEY))?')
+
+
+def _field_case(match) -> str:
+    """FIELD(x, a, b, ...) como CASE: SQLite limita el número de argumentos de una función"""
+    column, values = match.group(1), match.group(2).count('%s')
+    whens = ' '.join(f"WHEN %s THEN {position}" for position in range(1, values + 1))
+    return f"(CASE {column} {whens} ELSE 0 END)"
+
+
+@lru_cache(maxsize=1024)
+def translate(sql: str) -> str:
+    """Dialecto MySQL del motor -> SQLite"""
+    sql = _MATCH.sub(r'match_against(\1, %s)', sql)
+    sql = _DISTANCE.sub(r'st_distance_sphere(\1, \2)', sql)
+    sql = _FIELD.sub(_field_case, sql)
+    sql = _DATE_SUB.sub("datetime('now', '-' || %s || ' days')", sql)
+    sql = re.sub(r'\bNOW\(\)', "datetime('now')", sql)
+    sql = re.sub(r'^\s*REPLACE INTO', 'INSERT OR REPLACE INTO', sql)
+    return sql.replace('%s', '?')
+
+
+def _distance_sphere(lon1, lat1, lon2, lat2):
+    if None in (lon1, lat1, lon2, lat2):
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * SPHERE_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _match_against(text, query):
+    """Relevancia aproximada de MATCH AGAINST: palabras de la consulta presentes"""
+    if not text or not query:
+        return 0.0
+    words = set(re.findall(r'\w+', text.lower()))
+    return float(sum(1 for word in set(re.findall(r'\w+', query.lower())) if word in words))
+
+
+def _hour(value):
+    return int(str(value)[11:13]) if value and len(str(value)) >= 13 else None
+
+
+def _database_error(error: sqlite3.Error) -> errors.DatabaseError:
+    return errors.DatabaseError(msg=f"SQLite: {error}")
+
+
+class Cursor:
+    """Cursor con la interfaz de mysql-connector usada por el proyecto"""
+
+    def __init__(self, connection: 'Connection', dictionary: bool = False):
+        self._connection = connection
+        self._cursor = connection._sqlite.cursor()
+        self._dictionary = dictionary
+        self._rows = []
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, sql: str, params=None):
+        _count()
+        if _EXPLAIN_JSON.match(sql):
+            return self._explain_json(_EXPLAIN_JSON.sub('', sql), params)
+        try:
+            self._cursor.execute(translate(sql), tuple(params or ()))
+        except sqlite3.Error as e:
+            raise _database_error(e) from e
+        self.description = self._cursor.description
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        rows = self._cursor.fetchall() if self.description else []
+        if self._dictionary and rows:
+            names = [column[0] for column in self.description]
+            rows = [dict(zip(names, row)) for row in rows]
+        self._rows = rows
+
+    def _explain_json(self, sql: str, params):
+        """
+        EXPLAIN FORMAT=JSON aproximado a partir de EXPLAIN QUERY PLAN, con la
+        misma estructura que MySQL (nested_loop, access_type, subconsultas
+        dependientes, filesort) para que el perfil de consultas funcione aquí
+        """
+        try:
+            rows = self._cursor.execute('EXPLAIN QUERY PLAN ' + translate(sql), tuple(params or ())).fetchall()
+        except sqlite3.Error as e:
+            raise _database_error(e) from e
+
+        root = {'select_id': 1, 'message': 'SQLite stand-in'}
+        blocks = {0: root}
+        for node_id, parent, _, detail in rows:
+            block = blocks.get(parent, root)
+            access = _PLAN_ACCESS.match(detail)
+            if 'SUBQUERY' in detail:
+                correlated = detail.startswith('CORRELATED')
+                subquery = {'dependent': correlated, 'cacheable': not correlated, 'query_block': {'select_id': node_id}}
+                block.setdefault('attached_subqueries', []).append(subquery)
+                blocks[node_id] = subquery['query_block']
+            elif access:
+                full_scan = access.group(1) == 'SCAN' and not access.group(3)
+                table = {
+                    'table_name': access.group(2),
+                    'access_type': 'ALL' if full_scan else 'index' if access.group(1) == 'SCAN' else 'ref',
+                    'key': access.group(3) or ('PRIMARY' if access.group(4) else None),
+                    'rows_examined_per_scan': self._table_rows(sql, access.group(2)) if full_scan else 1,
+                    'sqlite_detail': detail
+                }
+                block.setdefault('nested_loop', []).append({'table': table})
+            elif detail.startswith('USE TEMP B-TREE'):
+                block['using_filesort' if 'ORDER BY' in detail else 'using_temporary_table'] = True
+            else:
+                block.setdefault('sqlite_notes', []).append(detail)
+
+        document = json.dumps({'query_block': root})
+        self.description = (('EXPLAIN', None, None, None, None, None, None),)
+        self.rowcount = 1
+        self._rows = [{'EXPLAIN': document}] if self._dictionary else [(document,)]
+
+    def _table_rows(self, sql: str, alias: str) -> int:
+        """Filas de la tabla de un alias del plan (para rows_examined_per_scan)"""
+        match = re.search(rf'(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?{re.escape(alias)}\b', sql, re.IGNORECASE)
+        table = match.group(1) if match else alias
+        try:
+            return self._connection._sqlite.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def executemany(self, sql: str, seq_params):
+        for params in seq_params:
+            self.execute(sql, params)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """Conexión SQLite con la interfaz de mysql-connector usada por el pool"""
+
+    def __init__(self, path: str):
+        self._sqlite = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            isolation_level=None,
+            check_same_thread=False,
+            timeout=30
+        )
+        self._sqlite.execute('PRAGMA journal_mode=WAL')
+        self._sqlite.create_function('st_distance_sphere', 4, _distance_sphere, deterministic=True)
+        self._sqlite.create_function('match_against', 2, _match_against, deterministic=True)
+        self._sqlite.create_function('hour', 1, _hour, deterministic=True)
+        self.autocommit = True
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._sqlite.in_transaction
+
+    def cursor(self, dictionary: bool = False, **kwargs) -> Cursor:
+        return Cursor(self, dictionary)
+
+    def start_transaction(self):
+        self._sqlite.execute('BEGIN')
+
+    def commit(self):
+        if self._sqlite.in_transaction:
+            self._sqlite.execute('COMMIT')
+
+    def rollback(self):
+        if self._sqlite.in_transaction:
+            self._sqlite.execute('ROLLBACK')
+
+    def ping(self, reconnect: bool = False):
+        try:
+            self._sqlite.execute('SELECT 1')
+        except sqlite3.Error as e:
+            raise errors.InterfaceError(msg=f"SQLite: {e}") from e
+
+    def is_connected(self) -> bool:
+        try:
+            self.ping()
+            return True
+        except errors.InterfaceError:
+            return False
+
+    def close(self):
+        self._sqlite.close()
+
+
+def connect(**db_config) -> Connection:
+    """Sustituto de mysql.connector.connect sobre un fichero SQLite"""
+    path = os.environ.get('BENCHMARK_SQLITE_PATH') or db_config.get('database')
+    if not path or not os.path.exists(path):
+        raise errors.DatabaseError(msg=f"Base SQLite de benchmark no encontrada: {path}")
+    return Connection(path)
+
+
+class _CountingCursor:
+    """Cursor de mysql-connector que cuenta las consultas del hilo"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        _count()
+        return self._cursor.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _CountingConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        if name == '_connection':
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._connection, name, value)
+
+
+def counting_connect(**db_config):
+    """mysql.connector.connect con recuento de consultas (DB_CONNECTOR=benchmarks.standin:counting_connect)"""
+    return _CountingConnection(mysql.connector.connect(**db_config))
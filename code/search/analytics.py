@@ -0,0 +1,244 @@
+from typing import Dict, Optional
+import threading
+import datetime
+import logging
+import socket
+import atexit
+import json
+import os
+
+from .cache import LRUCache
+from .querys import SKETCH_WINDOW_QUERY, SKETCH_PURGE_QUERY
+from .rollups import bucket_start, window_start
+from .sketches import HyperLogLog, SpaceSaving, TDigest
+
+
+def analytics_enabled() -> bool:
+    return os.environ.get('SEARCH_ANALYTICS_ENABLED', 'True').lower() == 'true'
+
+
+class HourlySketch:
+    """Resumen de una hora de búsquedas: contadores exactos y sketches"""
+
+    def __init__(self):
+        self.searches = 0
+        self.zero_results = 0
+        self.results_sum = 0
+        self.users = HyperLogLog(int(os.environ.get('SEARCH_ANALYTICS_HLL_PRECISION', 12)))
+        self.queries = SpaceSaving(int(os.environ.get('SEARCH_ANALYTICS_TOP_CAPACITY', 100)))
+        self.latency = TDigest(float(os.environ.get('SEARCH_ANALYTICS_TDIGEST_COMPRESSION', 100)))
+
+    def record(self, query: str, user_id: Optional[str], results_count: int, execution_time_ms: int):
+        self.searches += 1
+        self.zero_results += 1 if not results_count else 0
+        self.results_sum += results_count or 0
+        if user_id is not None:
+            self.users.add(str(user_id))
+        self.queries.add(query or '', results_count or 0)
+        self.latency.add(execution_time_ms or 0)
+
+    def merge(self, other: 'HourlySketch'):
+        self.searches += other.searches
+        self.zero_results += other.zero_results
+        self.results_sum += other.results_sum
+        self.users.merge(other.users)
+        self.queries.merge(other.queries)
+        self.latency.merge(other.latency)
+
+    def to_dict(self) -> Dict:
+        return {
+            'searches': self.searches,
+            'zero_results': self.zero_results,
+            'results_sum': self.results_sum,
+            'users': self.users.to_dict(),
+            'queries': self.queries.to_dict(),
+            'latency': self.latency.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HourlySketch':
+        sketch = cls.__new__(cls)
+        sketch.searches = data['searches']
+        sketch.zero_results = data['zero_results']
+        sketch.results_sum = data['results_sum']
+        sketch.users = HyperLogLog.from_dict(data['users'])
+        sketch.queries = SpaceSaving.from_dict(data['queries'])
+        sketch.latency = TDigest.from_dict(data['latency'])
+        return sketch
+
+
+class SearchAnalytics:
+    """
+    Analítica de búsquedas en memoria alimentada desde cada búsqueda.
+
+    Cada worker mantiene un HourlySketch por hora y lo persiste cada
+    persist_interval segundos en search_stats_sketches (una fila por hora y
+    worker, sustituida en cada persistencia). Las estadísticas de una ventana
+    se obtienen fusionando las filas de todos los workers: el coste depende del
+    número de horas y workers, no del tráfico, y el resultado se cachea unos
+    segundos.
+    """
+
+    def __init__(self, pool, persist_interval: Optional[float] = None):
+        self.pool = pool
+        self.enabled = analytics_enabled()
+        self.persist_interval = persist_interval or float(os.environ.get('SEARCH_ANALYTICS_PERSIST_SECONDS', 60))
+        self.retention_days = int(os.environ.get('SEARCH_ANALYTICS_RETENTION_DAYS', 35))
+        self.window_cache = LRUCache(64, float(os.environ.get('SEARCH_ANALYTICS_CACHE_SECONDS', 10)))
+
+        self._lock = threading.Lock()
+        self._buckets: Dict[datetime.datetime, HourlySketch] = {}
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.worker_id = None
+
+        self.recorded = 0
+        self.persisted = 0
+        self.persist_failed = 0
+        self.last_persist = None
+        self._last_purge = None
+
+    def _ensure_started(self):
+        """Arranca el hilo de persistencia (una vez por proceso, también tras un fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Proceso hijo (fork): los sketches del padre los persiste el padre
+                self._buckets = {}
+                self._dirty = set()
+                self._stop = threading.Event()
+            self._pid = os.getpid()
+            self.worker_id = f"{socket.gethostname()}:{self._pid}"
+            self._thread = threading.Thread(target=self._run, name='search-analytics', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def record(
+        self,
+        query: str,
+        user_id: Optional[str],
+        results_count: int,
+        execution_time_ms: int
+    ):
+        """Suma una búsqueda a los sketches de la hora actual"""
+        if not self.enabled:
+            return
+        self._ensure_started()
+        bucket = bucket_start(datetime.datetime.now())
+        with self._lock:
+            sketch = self._buckets.get(bucket)
+            if sketch is None:
+                sketch = self._buckets[bucket] = HourlySketch()
+            sketch.record(query, user_id, results_count, execution_time_ms)
+            self._dirty.add(bucket)
+            self.recorded += 1
+
+    def _run(self):
+        while not self._stop.wait(self.persist_interval):
+            self.persist()
+
+    def persist(self):
+        """Guarda las horas con cambios y libera las que ya están cerradas"""
+        with self._lock:
+            snapshot = {bucket: json.dumps(self._buckets[bucket].to_dict()) for bucket in self._dirty}
+            self._dirty = set()
+        if not snapshot:
+            return
+
+        now = datetime.datetime.now()
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "REPLACE INTO search_stats_sketches (bucket_start, worker_id, payload, updated_at) VALUES "
+                    + ', '.join(['(%s, %s, %s, %s)'] * len(snapshot)),
+                    [value for bucket, payload in snapshot.items() for value in (bucket, self.worker_id, payload, now)]
+                )
+                if self._last_purge is None or now - self._last_purge >= datetime.timedelta(hours=1):
+                    cursor.execute(SKETCH_PURGE_QUERY, [window_start(self.retention_days)])
+                    self._last_purge = now
+                conn.commit()
+                cursor.close()
+            self.persisted += len(snapshot)
+            self.last_persist = now
+        except Exception as e:
+            with self._lock:
+                self._dirty.update(snapshot)
+            self.persist_failed += 1
+            logging.error(f"Error persistiendo sketches de analítica: {e}")
+            return
+
+        # Las horas anteriores a la actual ya están completas en la base de datos
+        current = bucket_start(now)
+        with self._lock:
+            for bucket in list(self._buckets):
+                if bucket < current and bucket not in self._dirty:
+                    del self._buckets[bucket]
+
+    def window(self, days: int) -> Dict:
+        """
+        Fusiona los sketches de todos los workers desde el inicio de la ventana.
+        Devuelve {'total': HourlySketch, 'hours': {bucket_start: búsquedas}}.
+        """
+        cached = self.window_cache.get(days)
+        if cached is not None:
+            return cached
+
+        since = window_start(days)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SKETCH_WINDOW_QUERY, [since])
+            rows = cursor.fetchall()
+            cursor.close()
+
+        with self._lock:
+            own = {
+                bucket: HourlySketch.from_dict(sketch.to_dict())
+                for bucket, sketch in self._buckets.items() if bucket >= since
+            }
+
+        total = HourlySketch()
+        hours: Dict[datetime.datetime, int] = {}
+        for bucket, worker_id, payload in rows:
+            if worker_id == self.worker_id and bucket in own:
+                # La copia en memoria de este worker es más reciente
+                continue
+            sketch = HourlySketch.from_dict(json.loads(payload))
+            total.merge(sketch)
+            hours[bucket] = hours.get(bucket, 0) + sketch.searches
+        for bucket, sketch in own.items():
+            total.merge(sketch)
+            hours[bucket] = hours.get(bucket, 0) + sketch.searches
+
+        result = {'total': total, 'hours': hours}
+        self.window_cache.set(days, result)
+        return result
+
+    def close(self, timeout: float = 5.0):
+        """Parada ordenada: detiene el hilo y persiste lo pendiente"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self.persist()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            buckets = len(self._buckets)
+            dirty = len(self._dirty)
+        return {
+            'enabled': self.enabled,
+            'worker_id': self.worker_id,
+            'buckets_in_memory': buckets,
+            'dirty_buckets': dirty,
+            'recorded': self.recorded,
+            'persisted': self.persisted,
+            'persist_failed': self.persist_failed,
+            'last_persist': self.last_persist.isoformat() if self.last_persist else None,
+            'window_cache': self.window_cache.stats()
+        }
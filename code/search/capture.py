@@ -0,0 +1,141 @@
+"""
+Captura muestreada del tráfico de /search en JSONL para reproducirlo con
+benchmarks.replay. Cada línea es el cuerpo de la petición (solo los campos de
+búsqueda, con las coordenadas redondeadas) más captured_at.
+
+    SEARCH_CAPTURE_PATH=/var/log/foodly/search-capture-{pid}.jsonl
+    SEARCH_CAPTURE_SAMPLE_RATE=0.01
+"""
+from typing import Dict, Optional
+import threading
+import datetime
+import logging
+import atexit
+import random
+import queue
+import json
+import os
+
+# Campos del cuerpo de /search que se guardan
+CAPTURE_FIELDS = (
+    'voice_text', 'latitude', 'longitude', 'radius', 'page', 'per_page', 'cursor',
+    'category_id', 'category_ids', 'service_id', 'service_ids', 'service_match'
+)
+
+
+class TrafficCapture:
+    """
+    Hook de muestreo del handler de /search. record() solo sortea y encola
+    (nunca bloquea la petición: con la cola llena la muestra se descarta); un
+    hilo daemon por proceso añade las líneas al fichero. {pid} en la ruta
+    da un fichero por worker de gunicorn.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        sample_rate: Optional[float] = None,
+        coordinate_decimals: Optional[int] = None,
+        queue_size: Optional[int] = None
+    ):
+        self.path = path if path is not None else os.environ.get('SEARCH_CAPTURE_PATH')
+        self.sample_rate = (
+            sample_rate if sample_rate is not None
+            else float(os.environ.get('SEARCH_CAPTURE_SAMPLE_RATE', 0))
+        )
+        # Las coordenadas del usuario se guardan con precisión reducida (3 decimales ~ 100 m)
+        self.coordinate_decimals = (
+            coordinate_decimals if coordinate_decimals is not None
+            else int(os.environ.get('SEARCH_CAPTURE_COORD_DECIMALS', 3))
+        )
+        self._queue_size = queue_size or int(os.environ.get('SEARCH_CAPTURE_QUEUE_SIZE', 1000))
+        self.enabled = bool(self.path) and self.sample_rate > 0
+
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        self._thread = None
+        self._pid = None
+
+        self.sampled = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        """Arranca el hilo escritor (una vez por proceso, también tras un fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue(maxsize=self._queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='search-capture-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def payload(self, data: Dict) -> Dict:
+        """Campos de búsqueda de la petición en el formato de replay"""
+        payload = {key: data[key] for key in CAPTURE_FIELDS if data.get(key) not in (None, '', [])}
+        for key in ('latitude', 'longitude'):
+            if key in payload:
+                try:
+                    payload[key] = round(float(payload[key]), self.coordinate_decimals)
+                except (TypeError, ValueError):
+                    del payload[key]
+        payload['captured_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+        return payload
+
+    def record(self, data: Optional[Dict]):
+        """Guarda el cuerpo de la petición con probabilidad sample_rate"""
+        if not self.enabled or not data or random.random() >= self.sample_rate:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(self.payload(data))
+            self.sampled += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(lines)
+
+    def _write(self, payloads):
+        path = self.path.replace('{pid}', str(os.getpid()))
+        try:
+            with open(path, 'a', encoding='utf-8') as capture_file:
+                capture_file.write(''.join(json.dumps(payload, ensure_ascii=False) + '\n' for payload in payloads))
+            self.written += len(payloads)
+        except Exception as e:
+            self.failed += len(payloads)
+            logging.error(f"Error escribiendo la captura de tráfico en {path}: {e}")
+
+    def flush(self):
+        """Escribe lo que quede en la cola (al cerrar el proceso)"""
+        payloads = []
+        while True:
+            try:
+                payloads.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if payloads:
+            self._write(payloads)
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'sample_rate': self.sample_rate,
+            'sampled': self.sampled,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
@@ -0,0 +1,302 @@
+from typing import Dict, List, Optional, Set, Tuple
+import threading
+import logging
+import time
+import os
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy se usa el ranking en MySQL
+    np = None
+
+from .geo_index import EARTH_RADIUS_KM, KM_PER_DEGREE
+
+MAX_SERVICE_BIT = 63
+
+
+class BusinessColumns:
+    """
+    Almacén columnar en memoria de los negocios activos: ids, coordenadas,
+    category_id y un bitmask de servicios por negocio, como arrays de NumPy.
+
+    Permite calcular distancias haversine, máscaras de radio/filtros y un
+    score combinado relevancia/distancia para decenas de miles de candidatos
+    en una sola pasada vectorizada, eligiendo el top-k con argpartition.
+    """
+
+    def __init__(self, refresh_interval: Optional[float] = None, distance_weight: Optional[float] = None):
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.environ.get('COLUMNS_REFRESH_SECONDS', 300))
+        )
+        # Peso de la distancia normalizada (distancia / radio) frente a la relevancia
+        self.distance_weight = (
+            distance_weight if distance_weight is not None
+            else float(os.environ.get('RANK_DISTANCE_WEIGHT', 0.001))
+        )
+
+        self._lock = threading.RLock()
+        self._watermark = None
+        self._last_refresh = 0.0
+        self.loaded = False
+
+        self._positions: Dict[int, int] = {}
+        self.ids = None
+        self.lat = None
+        self.lon = None
+        self.category_ids = None
+        self.service_masks = None
+        self.alive = None
+
+    @staticmethod
+    def available() -> bool:
+        return np is not None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _read_rows(self, pool, since=None) -> Tuple[List[Dict], Dict[int, int]]:
+        """Lee negocios (todos o los modificados desde la marca de agua) y sus servicios"""
+        with pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            if since is None:
+                cursor.execute("""
+                    SELECT b.id, b.business_latitude, b.business_longitude, c.id as category_id,
+                           b.deleted_at, b.updated_at
+                    FROM businesses b
+                    LEFT JOIN categories c ON b.category_id = c.id
+                    WHERE b.deleted_at IS NULL
+                """)
+            else:
+                cursor.execute("""
+                    SELECT b.id, b.business_latitude, b.business_longitude, c.id as category_id,
+                           b.deleted_at, b.updated_at
+                    FROM businesses b
+                    LEFT JOIN categories c ON b.category_id = c.id
+                    WHERE b.updated_at >= %s
+                """, (since,))
+            rows = cursor.fetchall()
+
+            masks = {}
+            business_ids = [row['id'] for row in rows]
+            if business_ids:
+                if since is None:
+                    cursor.execute("SELECT business_id, service_id FROM business_service")
+                else:
+                    cursor.execute(
+                        f"SELECT business_id, service_id FROM business_service "
+                        f"WHERE business_id IN ({', '.join(['%s'] * len(business_ids))})",
+                        business_ids
+                    )
+                for link in cursor.fetchall():
+                    if 0 <= link['service_id'] <= MAX_SERVICE_BIT:
+                        masks[link['business_id']] = masks.get(link['business_id'], 0) | (1 << link['service_id'])
+            cursor.close()
+        return rows, masks
+
+    def _apply_rows(self, rows: List[Dict], masks: Dict[int, int]):
+        """Actualiza/añade filas. Los negocios borrados se marcan como no vivos."""
+        new_rows = []
+        for row in rows:
+            updated_at = row.get('updated_at')
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+            valid = (
+                row.get('deleted_at') is None
+                and row.get('business_latitude') is not None
+                and row.get('business_longitude') is not None
+            )
+            position = self._positions.get(row['id'])
+            if position is not None:
+                self.alive[position] = valid
+                if valid:
+                    self.lat[position] = float(row['business_latitude'])
+                    self.lon[position] = float(row['business_longitude'])
+                    self.category_ids[position] = row.get('category_id') or 0
+                    self.service_masks[position] = masks.get(row['id'], 0)
+            elif valid:
+                new_rows.append(row)
+
+        if not new_rows:
+            return
+
+        start = len(self.ids)
+        self.ids = np.concatenate([self.ids, np.array([row['id'] for row in new_rows], dtype=np.int64)])
+        self.lat = np.concatenate([self.lat, np.array([float(row['business_latitude']) for row in new_rows])])
+        self.lon = np.concatenate([self.lon, np.array([float(row['business_longitude']) for row in new_rows])])
+        self.category_ids = np.concatenate([
+            self.category_ids,
+            np.array([row.get('category_id') or 0 for row in new_rows], dtype=np.int64)
+        ])
+        self.service_masks = np.concatenate([
+            self.service_masks,
+            np.array([masks.get(row['id'], 0) for row in new_rows], dtype=np.uint64)
+        ])
+        self.alive = np.concatenate([self.alive, np.ones(len(new_rows), dtype=bool)])
+        for offset, row in enumerate(new_rows):
+            self._positions[row['id']] = start + offset
+
+    def load(self, pool):
+        """Carga completa de las columnas"""
+        if np is None:
+            logging.warning("NumPy no disponible: ranking en memoria deshabilitado")
+            return
+
+        start_time = time.time()
+        rows, masks = self._read_rows(pool)
+
+        with self._lock:
+            self._positions = {}
+            self._watermark = None
+            self.ids = np.empty(0, dtype=np.int64)
+            self.lat = np.empty(0, dtype=np.float64)
+            self.lon = np.empty(0, dtype=np.float64)
+            self.category_ids = np.empty(0, dtype=np.int64)
+            self.service_masks = np.empty(0, dtype=np.uint64)
+            self.alive = np.empty(0, dtype=bool)
+            self._apply_rows(rows, masks)
+            self._last_refresh = time.time()
+            self.loaded = True
+
+        logging.info(
+            f"Almacén columnar cargado: {len(self._positions)} negocios "
+            f"({int((time.time() - start_time) * 1000)}ms)"
+        )
+
+    def refresh(self, pool):
+        """Refresco incremental por marca de agua de updated_at"""
+        if not self.loaded or self._watermark is None:
+            return self.load(pool)
+
+        rows, masks = self._read_rows(pool, since=self._watermark)
+        with self._lock:
+            self._apply_rows(rows, masks)
+            self._last_refresh = time.time()
+
+    def mark_stale(self):
+        """Fuerza el refresco en la siguiente llamada a maybe_refresh"""
+        self._last_refresh = 0.0
+
+    def maybe_refresh(self, pool):
+        """Refresca las columnas si ha pasado el intervalo configurado"""
+        if self.refresh_interval and time.time() - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = time.time()
+            try:
+                self.refresh(pool)
+            except Exception as e:
+                self._last_refresh = time.time()
+                logging.error(f"Error refrescando el almacén columnar: {e}")
+
+    @staticmethod
+    def supports_service(service_id: int) -> bool:
+        return 0 <= service_id <= MAX_SERVICE_BIT
+
+    def rank(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        k: int,
+        category_id: Optional[int] = None,
+        service_id: Optional[int] = None,
+        relevance: Optional[Dict[int, float]] = None,
+        after: Optional[Tuple[float, float, int]] = None,
+        business_ids: Optional[Set[int]] = None
+    ) -> Dict:
+        """
+        Rankea los negocios dentro del radio y devuelve los k mejores.
+
+        relevance es un dict opcional business_id -> relevancia; si se pasa,
+        solo los negocios con relevancia > 0 son candidatos (como MATCH AGAINST).
+        El score es relevancia - distance_weight * (distancia / radio), de modo
+        que la relevancia manda y la distancia desempata.
+
+        after es la clave (score, distancia, id) del último negocio de la página
+        anterior (paginación por cursor): solo se devuelven los posteriores en
+        el orden (score DESC, distancia ASC, id ASC). total cuenta todos los
+        negocios que cumplen los filtros (sus ids en matched, como array) y
+        remaining los posteriores a after.
+
+        business_ids restringe los candidatos a un conjunto ya calculado por
+        otro índice (por ejemplo, los abiertos según el índice de horarios).
+        """
+        with self._lock:
+            lat = self.lat
+            lon = self.lon
+            mask = self.alive.copy()
+
+            # Bounding box (comparaciones baratas) antes de la trigonometría
+            d_lat = radius_km / KM_PER_DEGREE
+            d_lon = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(latitude)), 1e-6))
+            mask &= (np.abs(lat - latitude) <= d_lat) & (np.abs(lon - longitude) <= d_lon)
+
+            if category_id is not None:
+                mask &= self.category_ids == category_id
+            if service_id is not None:
+                mask &= (self.service_masks & np.uint64(1 << service_id)) != 0
+            if business_ids is not None:
+                mask &= np.isin(self.ids, np.fromiter(business_ids, dtype=np.int64, count=len(business_ids)))
+
+            candidates = np.flatnonzero(mask)
+            ids = self.ids[candidates]
+            cand_lat = lat[candidates]
+            cand_lon = lon[candidates]
+
+        # Haversine vectorizado
+        phi1 = np.radians(latitude)
+        phi2 = np.radians(cand_lat)
+        a = (
+            np.sin((phi2 - phi1) / 2) ** 2
+            + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(cand_lon - longitude) / 2) ** 2
+        )
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+        in_radius = distances <= radius_km
+        if relevance is not None:
+            scores_relevance = np.array([relevance.get(int(id), 0.0) for id in ids], dtype=np.float64)
+            in_radius &= scores_relevance > 0
+        else:
+            scores_relevance = np.ones(len(ids), dtype=np.float64)
+
+        ids = ids[in_radius]
+        distances = distances[in_radius]
+        scores = scores_relevance[in_radius] - self.distance_weight * (distances / max(radius_km, 1e-9))
+        relevance_values = scores_relevance[in_radius]
+        total = len(ids)
+        matched = ids
+
+        if after is not None:
+            after_score, after_distance, after_id = after
+            later = (scores < after_score) | (
+                (scores == after_score) & (
+                    (distances > after_distance) | ((distances == after_distance) & (ids > after_id))
+                )
+            )
+            ids = ids[later]
+            distances = distances[later]
+            scores = scores[later]
+            relevance_values = relevance_values[later]
+        remaining = len(ids)
+
+        # Top-k con argpartition y orden exacto solo de esos k. Los empates con
+        # la k-ésima puntuación entran todos: argpartition elegiría un subconjunto
+        # arbitrario y el cursor saltaría para siempre los ids menores del empate
+        limit = remaining
+        if 0 < k < remaining:
+            kth_score = -np.partition(-scores, k - 1)[k - 1]
+            top = np.flatnonzero(scores >= kth_score)
+            limit = k
+        else:
+            top = np.arange(remaining)
+        order = top[np.lexsort((ids[top], distances[top], -scores[top]))][:limit]
+
+        return {
+            'ids': [int(id) for id in ids[order]],
+            'distances': [float(distance) for distance in distances[order]],
+            'relevance': [float(score) for score in relevance_values[order]],
+            'scores': [float(score) for score in scores[order]],
+            'total': total,
+            'remaining': remaining,
+            'matched': matched
+        }
@@ -0,0 +1,303 @@
+from typing import Callable, Dict, Optional
+from contextlib import contextmanager
+from collections import deque
+import mysql.connector
+from mysql.connector import errors
+import importlib
+import threading
+import json
+import logging
+import time
+import os
+
+from .tracing import TracedConnection, instrumentation_enabled
+
+
+class PoolExhaustedError(errors.PoolError):
+    """No hay conexiones libres en el pool tras esperar el timeout configurado"""
+
+
+# Errores tras los que la conexión ya no es fiable y no debe volver al pool
+DISCONNECT_ERRORS = (errors.InterfaceError, errors.OperationalError)
+
+
+def is_disconnect(error: BaseException) -> bool:
+    """True si la conexión que lanzó error debe descartarse (release(conn, discard=True))"""
+    return isinstance(error, DISCONNECT_ERRORS)
+
+
+def load_connector() -> Callable:
+    """
+    Función de conexión del pool: mysql.connector.connect salvo que
+    DB_CONNECTOR indique otra como "modulo:funcion" (por ejemplo el sustituto
+    SQLite de los benchmarks, benchmarks.standin:connect)
+    """
+    path = os.environ.get('DB_CONNECTOR')
+    if not path:
+        return mysql.connector.connect
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute or 'connect')
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones MySQL compartido por el motor de búsqueda, el procesador
+    de texto y los helpers de la API.
+
+    Configuración por variables de entorno:
+        DB_POOL_SIZE       número máximo de conexiones abiertas (por proceso)
+        DB_POOL_TIMEOUT    segundos a esperar por una conexión libre
+        DB_POOL_RECYCLE    segundos de vida máxima de una conexión
+        DB_POOL_PRE_PING   segundos de inactividad a partir de los cuales se
+                           valida la conexión con un ping antes de prestarla
+        DB_CONNECTOR       función de conexión alternativa ("modulo:funcion")
+    """
+
+    def __init__(
+        self,
+        db_config: Dict,
+        size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        recycle: Optional[float] = None,
+        pre_ping: Optional[float] = None,
+        connect: Optional[Callable] = None
+    ):
+        self.db_config = dict(db_config)
+        self.connect = connect or load_connector()
+        self.size = size or int(os.environ.get('DB_POOL_SIZE', 5))
+        self.timeout = timeout if timeout is not None else float(os.environ.get('DB_POOL_TIMEOUT', 10))
+        self.recycle = recycle if recycle is not None else float(os.environ.get('DB_POOL_RECYCLE', 1800))
+        self.pre_ping = pre_ping if pre_ping is not None else float(os.environ.get('DB_POOL_PRE_PING', 5))
+
+        self._condition = threading.Condition()
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._created_at = {}  # id(conn) -> created_at
+        self._open = 0
+        self._pid = os.getpid()
+
+        self._stats = {
+            'borrowed': 0,
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'invalidated': 0,
+            'waits': 0,
+            'exhausted': 0,
+            'wait_time_ms': 0.0,
+            'max_in_use': 0
+        }
+
+    def _check_fork(self):
+        """
+        Tras un fork (workers de gunicorn) las conexiones del padre no son
+        reutilizables: se descartan sin cerrarlas para no cortar el socket ajeno
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._created_at.clear()
+            self._open = 0
+
+    def _connect(self):
+        conn = self.connect(**self.db_config)
+        conn.autocommit = True
+        if instrumentation_enabled():
+            # Cada consulta de los cursores de esta conexión es un span de la traza de
+            # la petición y pasa por los observadores de consultas (perfil por forma)
+            conn = TracedConnection(conn)
+        return conn
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn, created_at: float, last_used: float) -> bool:
+        """
+        Valida una conexión inactiva antes de prestarla. Se llama sin el lock:
+        el ping es un viaje de red y no debe bloquear a los demás hilos
+        """
+        now = time.time()
+        if self.recycle and now - created_at > self.recycle:
+            with self._condition:
+                self._stats['recycled'] += 1
+            return False
+        if now - last_used > self.pre_ping:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                with self._condition:
+                    self._stats['invalidated'] += 1
+                return False
+        return True
+
+    def acquire(self):
+        """
+        Presta una conexión del pool, creando una nueva si hay hueco.
+        Lanza PoolExhaustedError si no se libera ninguna antes del timeout.
+        """
+        deadline = time.time() + self.timeout
+        waited = False
+        wait_start = time.time()
+
+        while True:
+            idle = None
+            with self._condition:
+                self._check_fork()
+                while True:
+                    if self._idle:
+                        idle = self._idle.pop()
+                        break
+
+                    if self._open < self.size:
+                        self._open += 1
+                        break
+
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._stats['exhausted'] += 1
+                        logging.warning(
+                            f"Pool de conexiones agotado ({self.size} conexiones en uso) "
+                            f"tras esperar {self.timeout}s"
+                        )
+                        raise PoolExhaustedError(
+                            msg=f"Pool de conexiones agotado: {self.size} conexiones en uso"
+                        )
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    self._condition.wait(remaining)
+
+            if idle is None:
+                break
+
+            # La conexión inactiva ya es de este hilo: se valida fuera del lock
+            conn, created_at, last_used = idle
+            if self._is_usable(conn, created_at, last_used):
+                with self._condition:
+                    self._stats['reused'] += 1
+                    return self._borrowed(conn, waited, wait_start)
+            self._discard(conn)
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+
+        # Conectar fuera del lock para no bloquear al resto de hilos
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._condition:
+                self._open -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._stats['created'] += 1
+            self._created_at[id(conn)] = time.time()
+            return self._borrowed(conn, waited, wait_start)
+
+    def _borrowed(self, conn, waited: bool, wait_start: float):
+        self._stats['borrowed'] += 1
+        if waited:
+            self._stats['wait_time_ms'] += (time.time() - wait_start) * 1000
+        in_use = self._open - len(self._idle)
+        self._stats['max_in_use'] = max(self._stats['max_in_use'], in_use)
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Devuelve una conexión al pool (o la descarta si quedó inservible)"""
+        if conn is None:
+            return
+
+        with self._condition:
+            if self._pid != os.getpid():
+                return
+
+            if not discard:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                except Exception:
+                    discard = True
+
+            if discard:
+                self._discard(conn)
+                self._open -= 1
+            else:
+                created_at = self._created_at.get(id(conn), time.time())
+                self._idle.append((conn, created_at, time.time()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager para usar una conexión del pool:
+
+            with pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+        """
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except DISCONNECT_ERRORS:
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def stats(self) -> Dict:
+        """Métricas del pool, incluyendo las de agotamiento"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['wait_time_ms'] = round(stats['wait_time_ms'], 2)
+            stats['size'] = self.size
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+            return stats
+
+    def close_all(self):
+        """Cierra todas las conexiones inactivas del pool"""
+        with self._condition:
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+                self._open -= 1
+
+
+_pools: Dict[tuple, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_config: Dict) -> ConnectionPool:
+    """
+    Devuelve el pool compartido para una configuración de base de datos.
+    Todos los componentes que usan la misma configuración comparten pool.
+    """
+    key = tuple(sorted((k, str(v)) for k, v in db_config.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_config)
+            _pools[key] = pool
+        return pool
+
+
+def load_db_config() -> Dict:
+    """Configuración de la API (config.json y, si no, variables de entorno) para los jobs de línea de comandos"""
+    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cfg', 'config.json')
+    try:
+        with open(config_path, 'r') as config_file:
+            db_config = json.load(config_file)
+            return db_config.get('database', db_config)
+    except Exception as e:
+        logging.warning(f"Error cargando configuración desde config.json: {e}")
+        return {
+            'host': os.environ.get('DB_HOST'),
+            'user': os.environ.get('DB_USER'),
+            'password': os.environ.get('DB_PASSWORD'),
+            'database': os.environ.get('DB_NAME')
+        }
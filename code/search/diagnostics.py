@@ -0,0 +1,126 @@
+from typing import Dict, Optional
+import threading
+import datetime
+import logging
+import socket
+import time
+import os
+
+
+def diagnostics_enabled() -> bool:
+    """El modo diagnóstico es opt-in mediante DIAGNOSTICS_ENABLED=true"""
+    return os.environ.get('DIAGNOSTICS_ENABLED', 'False').lower() == 'true'
+
+
+def _safe_db_config(db_config: Dict) -> Dict:
+    """Configuración de base de datos sin la contraseña"""
+    return {key: value for key, value in db_config.items() if key.lower() != 'password'}
+
+
+def check_network(db_config: Dict, include_public_ip: bool = False, timeout: float = 5) -> Dict:
+    """
+    Diagnóstico de red: hostname, IP local, IP pública (opcional),
+    resolución DNS del host de base de datos y prueba de puerto por socket
+    """
+    result = {
+        'hostname': None,
+        'local_ip': None,
+        'public_ip': None,
+        'db_host_ip': None,
+        'db_port_open': None,
+        'errors': []
+    }
+
+    try:
+        result['hostname'] = socket.gethostname()
+        result['local_ip'] = socket.gethostbyname(result['hostname'])
+    except Exception as network_error:
+        result['errors'].append(f"Error obteniendo información de red: {network_error}")
+
+    if include_public_ip:
+        try:
+            import requests
+            result['public_ip'] = requests.get('https://api.ipify.org', timeout=timeout).text
+        except Exception as ip_error:
+            result['errors'].append(f"Error obteniendo IP pública: {ip_error}")
+
+    try:
+        result['db_host_ip'] = socket.gethostbyname(db_config['host'])
+    except Exception as dns_error:
+        result['errors'].append(f"Error de resolución DNS: {dns_error}")
+
+    try:
+        test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        test_socket.settimeout(timeout)
+        result['db_port_open'] = test_socket.connect_ex((
+            db_config['host'],
+            int(db_config.get('port', 3306))
+        )) == 0
+        test_socket.close()
+    except Exception as socket_error:
+        result['errors'].append(f"Error de conexión por socket: {socket_error}")
+
+    return result
+
+
+class DiagnosticsProbe:
+    """
+    Sonda de diagnóstico que se ejecuta una vez al arrancar (en segundo plano)
+    y guarda sus resultados. Las búsquedas normales nunca la ejecutan: los
+    resultados se consultan bajo demanda desde /debug/diagnostics.
+    """
+
+    def __init__(self, db_config: Dict, pool=None):
+        self.db_config = db_config
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._result: Optional[Dict] = None
+
+    def run(self, include_public_ip: bool = True) -> Dict:
+        """Ejecuta el diagnóstico completo y cachea el resultado"""
+        start_time = time.time()
+
+        result = {
+            'checked_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'db_config': _safe_db_config(self.db_config),
+            'network': check_network(self.db_config, include_public_ip=include_public_ip),
+            'database': {'connected': False}
+        }
+
+        if self.pool is not None:
+            try:
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                    cursor.close()
+                result['database']['connected'] = True
+            except Exception as e:
+                result['database']['error'] = str(e)
+            result['database']['pool'] = self.pool.stats()
+
+        result['duration_ms'] = int((time.time() - start_time) * 1000)
+
+        for error in result['network']['errors']:
+            logging.error(error)
+        logging.info(f"Diagnóstico completado en {result['duration_ms']}ms: {result['network']}")
+
+        with self._lock:
+            self._result = result
+        return result
+
+    def start(self, include_public_ip: bool = True):
+        """Lanza la sonda de arranque en un hilo para no retrasar el inicio"""
+        thread = threading.Thread(
+            target=self.run,
+            kwargs={'include_public_ip': include_public_ip},
+            name='diagnostics-probe',
+            daemon=True
+        )
+        thread.start()
+        return thread
+
+    def get_cached(self) -> Optional[Dict]:
+        """Último resultado de la sonda (None si aún no se ha ejecutado)"""
+        with self._lock:
+            return self._result
@@ -1,10 +1,43 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set
 import mysql.connector
 from mysql.connector import Error
 import time
 import json
-from .querys import STATS_GENERAL_QUERY, TOP_SEARCHES_QUERY, HOURLY_DISTRIBUTION_QUERY
+from .querys import (
+    STATS_GENERAL_QUERY,
+    TOP_SEARCHES_QUERY,
+    HOURLY_DISTRIBUTION_QUERY,
+    BUSINESS_SEARCH_COLUMNS,
+    BUSINESSES_BY_IDS_QUERY,
+    ROLLUP_STATS_GENERAL_QUERY,
+    ROLLUP_USERS_SKETCH_QUERY,
+    ROLLUP_TOP_SEARCHES_QUERY,
+    ROLLUP_HOURLY_DISTRIBUTION_QUERY
+)
+from .rollups import window_start, count_unique_users
 from .text_processor import TextProcessor
+from .db_pool import get_pool, is_disconnect
+from .diagnostics import DiagnosticsProbe, check_network
+from .geo_index import GeoIndex
+from .columnar import BusinessColumns
+from .text_index import InvertedIndex
+from .hours_index import OpeningHoursIndex
+from .facets import FacetIndex, ATTRIBUTE_FILTER_KEYS, attribute_filters, has_attribute_filters
+from .result_cache import ResultCache
+from .search_log import SearchLogWriter
+from .analytics import SearchAnalytics
+from .single_flight import SingleFlight
+from .stages import stage, record as record_stage
+from .metrics import count_search
+from .query_profile import PROFILER as QUERY_PROFILER
+from .pagination import (
+    InvalidCursorError,
+    encode_cursor,
+    decode_cursor,
+    rank_key,
+    cursor_rank_key
+)
+import os
 import logging
 
 class SearchEngine:
@@ -13,29 +46,94 @@ class SearchEngine:
         Inicializa el motor de búsqueda con la configuración de la base de datos
         """
         self.db_config = db_config
+        # Pool de conexiones compartido con el text processor y la API
+        self.pool = get_pool(db_config)
+        # Diagnósticos de red/BD fuera del camino de búsqueda (opt-in)
+        self.diagnostics = DiagnosticsProbe(db_config, self.pool)
         self.text_processor = TextProcessor()
         
         # NUEVO: Pasar configuración de DB al text processor
         self.text_processor.db_config = db_config
         
-        self.test_database_connection()
+        # Índices en memoria (se cargan al arrancar y se refrescan de forma incremental)
+        self.geo_index = GeoIndex()
+        self.columns = BusinessColumns()
+        # Índice de texto BM25 con el mismo analizador que el procesamiento de voz
+        self.text_index = InvertedIndex(self.text_processor.analyze)
+        self.text_index_max_candidates = int(os.environ.get('TEXT_INDEX_MAX_CANDIDATES', 10000))
+        # Bitmaps semanales de business_hours para los filtros time/meal_time
+        self.hours_index = OpeningHoursIndex()
+        # Bitsets por categoría y servicio (filtros AND/OR y facetas)
+        self.facets = FacetIndex()
+
+        # Caché de resultados (local + compartida opcional) delante de search_businesses
+        self.result_cache = ResultCache()
+        # Búsquedas idénticas concurrentes comparten un único cálculo
+        self.single_flight = SingleFlight()
+
+        # Registro de búsquedas en search_logs en segundo plano (por lotes)
+        self.search_log = SearchLogWriter(self.pool)
+        # Sketches de analítica (usuarios únicos, top consultas, percentiles)
+        self.analytics = SearchAnalytics(self.pool)
+        # Latencia por forma de consulta y EXPLAIN de las formas lentas
+        self.query_profiler = QUERY_PROFILER
+        self.query_profiler.attach(self.pool)
+        
+        if self.test_database_connection():
+            self._load_indexes()
+
+    def _load_indexes(self):
+        """
+        Carga los índices en memoria. Si alguno falla, la búsqueda sigue
+        funcionando con el camino SQL equivalente.
+        """
+        try:
+            self.geo_index.load(self.pool)
+        except Exception as e:
+            logging.error(f"Error cargando el índice geoespacial: {e}")
+
+        try:
+            self.columns.load(self.pool)
+        except Exception as e:
+            logging.error(f"Error cargando el almacén columnar: {e}")
+
+        try:
+            self.text_index.load(self.pool)
+        except Exception as e:
+            logging.error(f"Error cargando el índice de texto: {e}")
+
+        try:
+            self.hours_index.load(self.pool)
+        except Exception as e:
+            logging.error(f"Error cargando el índice de horarios: {e}")
+
+        try:
+            self.facets.load(self.pool)
+        except Exception as e:
+            logging.error(f"Error cargando el índice de facetas: {e}")
+
+        try:
+            self.text_processor.gazetteer.load(self.pool)
+        except Exception as e:
+            logging.error(f"Error cargando el gazetteer de ciudades: {e}")
 
     def test_database_connection(self):
         """
         Método de prueba de conexión detallado
         """
         try:
-            import socket
-
-            # Información de red detallada
+            # Información de red detallada (sin llamadas externas)
             logging.info("Información de red:")
-            try:
-                local_hostname = socket.gethostname()
-                local_ip = socket.gethostbyname(local_hostname)
-                logging.info(f"Hostname local: {local_hostname}")
-                logging.info(f"IP local: {local_ip}")
-            except Exception as network_error:
-                logging.error(f"Error obteniendo información de red: {network_error}")
+            network = check_network(self.db_config)
+            logging.info(f"Hostname local: {network['hostname']}")
+            logging.info(f"IP local: {network['local_ip']}")
+            logging.info(f"IP del host de base de datos: {network['db_host_ip']}")
+            if network['db_port_open']:
+                logging.info("Puerto de base de datos está abierto")
+            elif network['db_port_open'] is False:
+                logging.error("No se puede conectar al puerto de base de datos")
+            for error in network['errors']:
+                logging.error(error)
 
             # Intentar establecer conexión
             logging.info("Iniciando prueba de conexión a base de datos")
@@ -46,47 +144,18 @@ class SearchEngine:
                 if key.lower() != 'password':
                     logging.info(f"{key}: {value}")
 
-            # Verificar resolución DNS
-            try:
-                host_ip = socket.gethostbyname(self.db_config['host'])
-                logging.info(f"IP del host de base de datos: {host_ip}")
-            except socket.gaierror as dns_error:
-                logging.error(f"Error de resolución DNS: {dns_error}")
-
-            # Prueba de conexión por socket
-            try:
-                test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                test_socket.settimeout(10)
-                result = test_socket.connect_ex((
-                    self.db_config['host'],
-                    self.db_config.get('port', 3306)
-                ))
-
-                if result == 0:
-                    logging.info("Puerto de base de datos está abierto")
-                else:
-                    logging.error("No se puede conectar al puerto de base de datos")
-
-                test_socket.close()
-            except Exception as socket_error:
-                logging.error(f"Error de conexión por socket: {socket_error}")
+            # Conexión MySQL (la primera conexión queda caliente en el pool)
+            with self.pool.connection() as conn:
+                # Crear cursor
+                cursor = conn.cursor()
 
-            # Conexión MySQL
-            import mysql.connector
-            conn = mysql.connector.connect(**self.db_config)
+                # Consulta de prueba simple
+                cursor.execute("SELECT 1")
+                result = cursor.fetchone()
 
-            # Crear cursor
-            cursor = conn.cursor()
+                logging.info(f"Resultado de consulta de prueba: {result}")
 
-            # Consulta de prueba simple
-            cursor.execute("SELECT 1")
-            result = cursor.fetchone()
-
-            logging.info(f"Resultado de consulta de prueba: {result}")
-
-            # Cerrar cursor y conexión
-            cursor.close()
-            conn.close()
+                cursor.close()
 
             logging.info("Conexión a base de datos establecida exitosamente")
             return True
@@ -108,9 +177,6 @@ class SearchEngine:
 
             logging.error(error_messages.get(err.errno, "Error desconocido"))
 
-            return False
-        except socket.error as sock_err:
-            logging.error(f"Error de socket: {sock_err}")
             return False
         except Exception as e:
             # Capturar cualquier otro error
@@ -122,10 +188,12 @@ class SearchEngine:
     #Metodo de diagnostico para busquedas
     def _diagnose_business_search(self, coordinates, radius, filters=None):
         """
-        MEtodo de diagnostico generico para busquedas
+        MEtodo de diagnostico generico para busquedas.
+        Solo se usa desde /debug/diagnostics, nunca en el camino de búsqueda.
         """
+        discard = False
         try:
-            conn = mysql.connector.connect(**self.db_config)
+            conn = self.pool.acquire()
             cursor = conn.cursor(dictionary=True)
 
             #Construccion dinámica de la consulta SQL
@@ -199,23 +267,37 @@ class SearchEngine:
 
         except mysql.connector.Error as err:
             logging.error(f"Error en diagnóstico de búsqueda de negocios: {err}")
+            discard = is_disconnect(err)
             return []
         finally:
-            if 'conn' in locals() and conn.is_connected():
-                cursor.close()
-                conn.close()
+            if 'conn' in locals():
+                if 'cursor' in locals():
+                    cursor.close()
+                self.pool.release(conn, discard=discard)
 
-    def process_voice_search(self, voice_text: str, coordinates: Optional[Dict] = None) -> Dict:
+    def process_voice_search(
+        self,
+        voice_text: str,
+        coordinates: Optional[Dict] = None,
+        page: int = 1,
+        per_page: int = 20,
+        cursor: Optional[str] = None,
+        filters: Optional[Dict] = None,
+        user_id: Optional[str] = None
+    ) -> Dict:
         """
-        Procesa una búsqueda de voz con sistema de prioridades de ubicación
+        Procesa una búsqueda de voz con sistema de prioridades de ubicación.
+        filters (categoría/servicios de la petición) se suman a los de la voz.
+        user_id solo se usa para el registro de la búsqueda.
         """
         logging.info(f"Iniciando procesamiento de búsqueda de voz: '{voice_text}'")
         logging.info(f"Coordenadas proporcionadas: {coordinates}")
         
-        search_params = self.text_processor.process_voice_query(
-            text=voice_text,
-            coordinates=coordinates
-        )
+        with stage('parse'):
+            search_params = self.text_processor.process_voice_query(
+                text=voice_text,
+                coordinates=coordinates
+            )
         
         logging.info(f"Parámetros de búsqueda procesados: {search_params}")
         logging.info(f"Fuente de ubicación: {search_params.get('location_source', 'unknown')}")
@@ -257,11 +339,18 @@ class SearchEngine:
             search_coordinates = None
             logging.info("Búsqueda global sin restricciones geográficas")
         
+        search_filters = dict(search_params['filters'] or {})
+        search_filters.update(filters or {})
+
         results = self.search_businesses(
             query=search_params['query'],
-            filters=search_params['filters'],
+            filters=search_filters,
             coordinates=search_coordinates,
-            radius=radius
+            radius=radius,
+            page=page,
+            per_page=per_page,
+            cursor=cursor,
+            user_id=user_id
         )
         
         if isinstance(results, dict) and 'results' in results:
@@ -288,11 +377,73 @@ class SearchEngine:
     coordinates: Optional[Dict] = None,
     radius: float = 5.0,
     page: int = 1,
-    per_page: int = 20
+    per_page: int = 20,
+    cursor: Optional[str] = None,
+    user_id: Optional[str] = None
+) -> Dict:
+        """
+        Realiza búsqueda de negocios, sirviendo desde la caché de resultados
+        cuando hay una búsqueda equivalente (misma celda de coordenadas) reciente.
+        Con cursor (stats['next_cursor'] de la página anterior) se pagina por
+        clave en lugar de por page. Las búsquedas idénticas que llegan mientras
+        otra está en curso esperan a su resultado (single-flight).
+        user_id no forma parte de la clave: solo se registra en search_logs.
+        """
+        start_time = time.time()
+        cache_key = self.result_cache.make_key(query, filters, coordinates, radius, page, per_page, cursor)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Búsqueda servida desde caché ({len(cached['results'])} resultados)")
+            stats = dict(cached['stats'])
+            stats['execution_time_ms'] = int((time.time() - start_time) * 1000)
+            stats['cached'] = True
+            self._log_search(query, filters, len(cached['results']), stats['execution_time_ms'], user_id)
+            count_search('cache')
+            return {'results': cached['results'], 'stats': stats}
+
+        def compute() -> Dict:
+            computed = self._search_businesses(query, filters, coordinates, radius, page, per_page, page_cursor=cursor)
+            if 'error' not in computed.get('stats', {}):
+                self.result_cache.set(cache_key, computed)
+            return computed
+
+        with stage('search'):
+            results, shared = self.single_flight.do(cache_key, compute)
+        if shared:
+            logging.info(f"Búsqueda coalescida con otra en curso ({len(results['results'])} resultados)")
+            results = {'results': results['results'], 'stats': dict(results['stats'], coalesced=True)}
+        count_search('coalesced' if shared else 'error' if 'error' in results['stats'] else 'computed')
+        self._log_search(query, filters, len(results['results']), int((time.time() - start_time) * 1000), user_id)
+        return results
+
+    def invalidate_business(self, business_id: int):
+        """
+        Hook para cuando se crea, modifica o borra un negocio: invalida la
+        caché de resultados y fuerza el refresco de los índices en memoria
+        en la siguiente búsqueda
+        """
+        self.result_cache.invalidate_business(business_id)
+        for index in (self.geo_index, self.columns, self.text_index, self.hours_index, self.facets):
+            index.mark_stale()
+
+    def _search_businesses(
+    self,
+    query: str,
+    filters: Optional[Dict] = None,
+    coordinates: Optional[Dict] = None,
+    radius: float = 5.0,
+    page: int = 1,
+    per_page: int = 20,
+    page_cursor: Optional[str] = None
 ) -> Dict:
         """
         Realiza búsqueda de negocios
         """
+        # Un cursor inválido es un error del cliente: se propaga al llamador
+        cursor_data = decode_cursor(page_cursor)
+        if cursor_data and cursor_data.get('p'):
+            page = cursor_data['p']
+
         logging.info("=" * 50)
         logging.info("Iniciando búsqueda de negocios")
         logging.info(f"Parámetros de búsqueda:")
@@ -304,122 +455,125 @@ class SearchEngine:
 
         start_time = time.time()
 
-        try:
-            # Diagnóstico de red detallado
-            import socket
-            import requests
-
-            try:
-                logging.info("Diagnóstico de conectividad de red:")
-
-                # Hostname y IP local
-                local_hostname = socket.gethostname()
-                local_ip = socket.gethostbyname(local_hostname)
-                logging.info(f"Hostname local: {local_hostname}")
-                logging.info(f"IP local: {local_ip}")
+        # El filtro por radio solo se aplica si hay coordenadas y no hay filtro de ciudad
+        use_radius_filter = bool(coordinates) and not (filters and 'city_name' in filters)
+        has_query = bool(query and query.strip())
+        discard = False
 
-                # IP pública
-                try:
-                    public_ip = requests.get('https://api.ipify.org').text
-                    logging.info(f"IP pública: {public_ip}")
-                except Exception as ip_error:
-                    logging.error(f"Error obteniendo IP pública: {ip_error}")
-
-                # Resolución DNS del host de base de datos
-                try:
-                    host_ip = socket.gethostbyname(self.db_config['host'])
-                    logging.info(f"IP del host de base de datos: {host_ip}")
-                except socket.gaierror as dns_error:
-                    logging.error(f"Error de resolución DNS: {dns_error}")
-
-                # Prueba de conexión por socket
-                try:
-                    test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    test_socket.settimeout(10)
-                    result = test_socket.connect_ex((
-                        self.db_config['host'],
-                        self.db_config.get('port', 3306)
-                    ))
-
-                    if result == 0:
-                        logging.info("Puerto de base de datos está abierto")
-                    else:
-                        logging.error("No se puede conectar al puerto de base de datos")
-
-                    test_socket.close()
-                except Exception as socket_error:
-                    logging.error(f"Error de conexión por socket: {socket_error}")
-
-            except Exception as network_error:
-                logging.error(f"Error en diagnóstico de red: {network_error}")
-
-            # Logging de configuración de base de datos
-            logging.info("Configuración de conexión a base de datos:")
-            for key, value in self.db_config.items():
-                if key.lower() != 'password':
-                    logging.info(f"{key}: {value}")
+        try:
+            # Relevancia de texto desde el índice BM25 en memoria (sustituye a MATCH AGAINST)
+            text_scores = None
+            if has_query:
+                # También reintenta la carga si el índice no se pudo cargar al arrancar
+                self.text_index.maybe_refresh(self.pool)
+            if has_query and self.text_index.loaded:
+                with stage('index'):
+                    text_scores = self.text_index.search(query, limit=self.text_index_max_candidates)
+                logging.info(f"Índice de texto: {len(text_scores)} negocios coinciden con '{query}'")
+
+                if not text_scores:
+                    return self._empty_results(page, per_page, start_time)
+
+            # Filtros resueltos por índices en memoria: allowed_ids es la
+            # intersección y index_filters las claves que ya no van a SQL
+            allowed_ids, index_filters = None, set()
+            if filters and ('time' in filters or 'meal_time' in filters):
+                self.hours_index.maybe_refresh(self.pool)
+            if self.hours_index.loaded and filters and ('time' in filters or 'meal_time' in filters):
+                with stage('index'):
+                    open_ids = self.hours_index.matching(filters)
+                if open_ids is not None:
+                    logging.info(f"Índice de horarios: {len(open_ids)} negocios abiertos")
+                    allowed_ids, index_filters = open_ids, index_filters | {'time', 'meal_time'}
+            if has_attribute_filters(filters):
+                self.facets.maybe_refresh(self.pool)
+            if self.facets.loaded and has_attribute_filters(filters):
+                with stage('index'):
+                    attribute_ids = self.facets.matching(filters)
+                logging.info(f"Índice de facetas: {len(attribute_ids)} negocios cumplen categoría/servicios")
+                allowed_ids = attribute_ids if allowed_ids is None else allowed_ids & attribute_ids
+                index_filters |= set(ATTRIBUTE_FILTER_KEYS)
+            if allowed_ids is not None:
+                if not allowed_ids:
+                    return self._empty_results(page, per_page, start_time)
+                if text_scores is not None:
+                    text_scores = {
+                        business_id: score for business_id, score in text_scores.items()
+                        if business_id in allowed_ids
+                    }
+                    if not text_scores:
+                        return self._empty_results(page, per_page, start_time)
+
+            # Ranking completo en memoria: MySQL solo trae la página final
+            if self._can_rank_in_process(query, filters, coordinates, text_scores, index_filters):
+                return self._search_ranked_in_process(
+                    filters, coordinates, radius, page, per_page, start_time, text_scores, cursor_data,
+                    allowed_ids, index_filters
+                )
 
-            # Intentar establecer conexión
-            conn = mysql.connector.connect(**self.db_config)
-            logging.info("Conexión a la base de datos establecida correctamente")
+            # Candidatos por distancia desde el índice geoespacial en memoria:
+            # MySQL solo tiene que traer los detalles de esos ids
+            nearby = None
+            if use_radius_filter:
+                self.geo_index.maybe_refresh(self.pool)
+            if use_radius_filter and self.geo_index.loaded:
+                with stage('index'):
+                    nearby = self.geo_index.query(coordinates['latitude'], coordinates['longitude'], radius)
+                logging.info(f"Índice geoespacial: {len(nearby)} negocios a menos de {radius}km")
+                if allowed_ids is not None:
+                    nearby = [(business_id, distance) for business_id, distance in nearby if business_id in allowed_ids]
+
+                if not nearby:
+                    return self._empty_results(page, per_page, start_time)
+
+                # Solo interesan los negocios que cumplen a la vez texto y radio
+                if text_scores is not None:
+                    nearby_ids = {business_id for business_id, _ in nearby}
+                    text_scores = {
+                        business_id: score for business_id, score in text_scores.items()
+                        if business_id in nearby_ids
+                    }
+                    if not text_scores:
+                        return self._empty_results(page, per_page, start_time)
+
+            # Tomar una conexión del pool compartido
+            with stage('db_acquire'):
+                conn = self.pool.acquire()
+            logging.info("Conexión a la base de datos obtenida del pool")
             cursor = conn.cursor(dictionary=True)
+            build_started = time.perf_counter()
 
 
             # Calcular offset para paginación
             offset = (page - 1) * per_page
 
             # Construir consulta base
-            sql = """
-                SELECT DISTINCT
-                    b.id,
-                    b.business_name as name,
-                    b.business_about_us,
-                    b.business_address as address,
-                    b.business_email as email,
-                    b.business_phone as phone,
-                    b.business_latitude as latitude,
-                    b.business_longitude as longitude,
-                    b.user_id,
-                    b.business_uuid,
-                    b.business_logo,
-                    b.business_additional_info,
-                    b.business_zipcode,
-                    b.business_city,
-                    b.business_country,
-                    b.business_website,
-                    c.id as category_id,
-                    c.category_name as category_name
-            """
+            sql = "SELECT DISTINCT" + BUSINESS_SEARCH_COLUMNS
 
             params = []
 
-            # Añadir distancia si hay coordenadas
-            if coordinates:
+            # Añadir distancia si hay coordenadas (con índice la distancia ya es conocida)
+            if coordinates and nearby is None:
                 sql += """
-                    AND ST_Distance_Sphere(
+                    , ST_Distance_Sphere(
                         point(b.business_longitude, b.business_latitude),
                         point(%s, %s)
-                    ) * 0.001 <= %s
+                    ) * 0.001 as distance_km
                 """
                 params.extend([
                     coordinates['longitude'],
-                    coordinates['latitude'],
-                    radius
+                    coordinates['latitude']
                 ])
-                logging.info(f"Aplicando filtro de distancia con radio: {radius}km")
-            else:
+            elif not coordinates:
                 logging.info("Búsqueda global sin restricción de distancia")
 
-            # Diagnóstico de búsqueda de negocios
-            if coordinates:
-                diagnostic_businesses = self._diagnose_business_search(
-                    coordinates,
-                    radius,
-                    filters
-                )
-
             # Para la cláusula de relevancia
-            if query and query.strip():
+            if text_scores is not None:
+                # La relevancia viene del índice BM25 y se añade tras la consulta
+                sql += """
+                    , 1 as relevance
+                """
+            elif has_query:
                 # Si hay consulta, usar MATCH AGAINST para relevancia
                 sql += """
                     , MATCH(b.business_name) AGAINST(%s IN NATURAL LANGUAGE MODE) as relevance
@@ -436,6 +590,11 @@ class SearchEngine:
                 , (SELECT GROUP_CONCAT(DISTINCT service_id)
                            FROM business_service
                            WHERE business_id = b.id) as service_ids
+            """
+
+            # A partir de aquí FROM + WHERE, reutilizable para el COUNT del total
+            from_start, from_params_start = len(sql), len(params)
+            sql += """
                     FROM
                         businesses b
                         LEFT JOIN categories c ON b.category_id = c.id
@@ -445,7 +604,10 @@ class SearchEngine:
 
             # Aplicar filtro de búsqueda por texto si existe
             # Aplicar filtro de búsqueda por texto si existe
-            if query and query.strip():
+            if text_scores is not None:
+                sql += f" AND b.id IN ({', '.join(['%s'] * len(text_scores))})"
+                params.extend(text_scores.keys())
+            elif has_query:
                 sql += " AND MATCH(b.business_name) AGAINST(%s IN NATURAL LANGUAGE MODE)"
                 params.append(query)
 
@@ -470,14 +632,29 @@ class SearchEngine:
                 city_filter_applied = True
 
             # Aplicar filtro de distancia SOLO si hay coordenadas Y no hay filtro de ciudad
-            elif coordinates and not city_filter_applied:
+            elif use_radius_filter and nearby is not None:
+                # Candidatos ya filtrados por el índice geoespacial
+                sql += f" AND b.id IN ({', '.join(['%s'] * len(nearby))})"
+                params.extend([business_id for business_id, _ in nearby])
+                logging.info(f"Aplicando filtro de distancia desde índice con radio: {radius}km")
+            elif use_radius_filter:
+                # Sin índice: bounding box (barato) antes del cálculo exacto de distancia
+                min_lat, max_lat, min_lon, max_lon = self.geo_index.bounding_box(
+                    coordinates['latitude'], coordinates['longitude'], radius
+                )
                 sql += """
+                    AND b.business_latitude BETWEEN %s AND %s
+                    AND b.business_longitude BETWEEN %s AND %s
                     AND ST_Distance_Sphere(
                         point(b.business_longitude, b.business_latitude),
                         point(%s, %s)
                     ) * 0.001 <= %s
                 """
                 params.extend([
+                    min_lat,
+                    max_lat,
+                    min_lon,
+                    max_lon,
                     coordinates['longitude'],
                     coordinates['latitude'],
                     radius
@@ -491,98 +668,242 @@ class SearchEngine:
 
             # MANTENER TODOS LOS FILTROS EXISTENTES
             if filters:
-                # Filtro por categoría
-                if 'category_id' in filters:
-                    sql += " AND b.category_id = %s"
-                    params.append(filters['category_id'])
-                    logging.info(f"Aplicando filtro por categoría: {filters['category_id']}")
-
-                # Filtro por servicio
-                if 'service_id' in filters:
-                    sql += " AND EXISTS (SELECT 1 FROM business_service bs2 WHERE bs2.business_id = b.id AND bs2.service_id = %s)"
-                    params.append(filters['service_id'])
-                    logging.info(f"Aplicando filtro por servicio: {filters['service_id']}")
-
-                # Filtros por horarios si existen
-                if 'time' in filters:
-                    time_info = filters['time']
-                    
-                    # Filtro por horario de apertura
-                    if 'open_from' in time_info:
-                        sql += """
-                            AND EXISTS (
-                                SELECT 1 FROM business_hours bh 
-                                WHERE bh.business_id = b.id 
-                                AND bh.open_a <= %s
-                            )
-                        """
-                        params.append(time_info['open_from'])
-                        logging.info(f"Aplicando filtro abierto desde: {time_info['open_from']}")
-                    
-                    # Filtro por horario de cierre
-                    if 'open_until' in time_info:
-                        sql += """
-                            AND EXISTS (
-                                SELECT 1 FROM business_hours bh 
-                                WHERE bh.business_id = b.id 
-                                AND bh.close_a >= %s
-                            )
-                        """
-                        params.append(time_info['open_until'])
-                        logging.info(f"Aplicando filtro abierto hasta: {time_info['open_until']}")
-
-                # Filtro por meal_time si existe
-                if 'meal_time' in filters:
-                    meal_time = filters['meal_time']
-                    if 'typical_hours' in meal_time:
-                        typical_hours = meal_time['typical_hours']
-                        sql += """
-                            AND EXISTS (
-                                SELECT 1 FROM business_hours bh 
-                                WHERE bh.business_id = b.id 
-                                AND bh.open_a <= %s 
-                                AND bh.close_a >= %s
-                            )
-                        """
-                        params.extend([typical_hours['to'], typical_hours['from']])
-                        logging.info(f"Aplicando filtro por meal_time: {meal_time['type']}")
-
-            # Agrupar resultados
-            sql += " GROUP BY b.id"
-
-            # Decidir orden según el tipo de búsqueda
+                category_ids, service_ids, service_match = attribute_filters(filters)
+                attributes_in_sql = 'category_id' not in index_filters
+
+                # Filtro por categoría (sin índice de facetas)
+                if category_ids and attributes_in_sql:
+                    sql += f" AND b.category_id IN ({', '.join(['%s'] * len(category_ids))})"
+                    params.extend(category_ids)
+                    logging.info(f"Aplicando filtro por categoría: {category_ids}")
+
+                # Filtro por servicios (sin índice de facetas): todos o alguno
+                if service_ids and attributes_in_sql:
+                    if service_match == 'any':
+                        sql += (
+                            " AND EXISTS (SELECT 1 FROM business_service bs2 WHERE bs2.business_id = b.id"
+                            f" AND bs2.service_id IN ({', '.join(['%s'] * len(service_ids))}))"
+                        )
+                        params.extend(service_ids)
+                    else:
+                        for service_id in service_ids:
+                            sql += " AND EXISTS (SELECT 1 FROM business_service bs2 WHERE bs2.business_id = b.id AND bs2.service_id = %s)"
+                            params.append(service_id)
+                    logging.info(f"Aplicando filtro por servicio: {service_ids} ({service_match})")
+
+                # Filtros resueltos por los índices: solo hace falta restringir
+                # los ids si no lo están ya los candidatos de texto o radio
+                if allowed_ids is not None and text_scores is None and nearby is None:
+                    sql += f" AND b.id IN ({', '.join(['%s'] * len(allowed_ids))})"
+                    params.extend(sorted(allowed_ids))
+                    logging.info("Aplicando filtros de horarios/categoría/servicios desde índices")
+
+                # Filtros por horarios y meal_time (sin índice de horarios):
+                # misma semántica que el índice, hoy en SEARCH_TIMEZONE
+                sql_hours_filters = {
+                    key: filters[key] for key in ('time', 'meal_time')
+                    if key in filters and key not in index_filters
+                }
+                if sql_hours_filters:
+                    for clause, clause_params in self.hours_index.sql_conditions(sql_hours_filters):
+                        sql += f" AND {clause}"
+                        params.extend(clause_params)
+                    logging.info(f"Aplicando filtros de horario en SQL: {sql_hours_filters}")
+
+            # Con índices en memoria el orden se calcula aquí (ordered_ids) y
+            # MySQL solo filtra y trae la página: ORDER BY FIELD(b.id, ...)
+            # recorre su lista por cada fila (O(n²) con miles de candidatos)
+            known_distances = dict(nearby) if nearby is not None else {}
+            candidates_filtered = False
+            if text_scores is None and has_query and nearby is not None:
+                # MATCH AGAINST sin índice BM25 pero con distancias del índice
+                # geoespacial: se leen las relevancias sin ORDER BY y se ordena en memoria
+                record_stage('sql_build', build_started)
+                with stage('sql_execute'):
+                    cursor.execute(
+                        "SELECT DISTINCT b.id, MATCH(b.business_name) AGAINST(%s IN NATURAL LANGUAGE MODE) as relevance "
+                        + sql[from_start:],
+                        [query] + params[from_params_start:]
+                    )
+                    text_scores = {row['id']: float(row['relevance'] or 0.0) for row in cursor.fetchall()}
+                build_started = time.perf_counter()
+                candidates_filtered = True
+                if not text_scores:
+                    return self._empty_results(page, per_page, start_time)
+
+            relevance_ids = None
+            if text_scores is not None:
+                # Relevancia descendente y, a igualdad, distancia ascendente
+                relevance_ids = sorted(
+                    text_scores,
+                    key=lambda business_id: (-text_scores[business_id], known_distances.get(business_id, 0.0), business_id)
+                )
+
+            # Decidir orden según el tipo de búsqueda. ordered_ids es el orden
+            # completo cuando lo dan los índices en memoria (cursor por clave
+            # relevancia/distancia/id); sin él se pagina por nombre u offset.
+            ordered_ids = None
+            order_mode = 'offset'
+            order_sql = None
             if city_filter_applied:
                 # Para búsquedas por ciudad, priorizar relevancia del texto
-                if query and query.strip():
-                    sql += " ORDER BY relevance DESC"
+                if has_query:
+                    order_sql = "relevance DESC"
+                    ordered_ids = relevance_ids
                 else:
-                    sql += " ORDER BY b.business_name ASC"
-            elif coordinates and (not query or not query.strip()):
+                    order_sql = "b.business_name ASC, b.id ASC"
+                    order_mode = 'name'
+            elif coordinates and not has_query:
                 # Si solo hay coordenadas, ordenar por distancia
-                sql += " ORDER BY distance_km ASC"
+                order_sql = "distance_km ASC"
+                if nearby is not None:
+                    ordered_ids = [business_id for business_id, _ in nearby]
+            elif coordinates and text_scores is not None:
+                # Relevancia y distancia ya combinadas en el orden del índice de texto
+                ordered_ids = relevance_ids
             elif coordinates:
                 # Si hay consulta Y coordenadas, ordenar por relevancia y luego distancia
-                sql += " ORDER BY relevance DESC, distance_km ASC"
-            elif query and query.strip():
+                order_sql = "relevance DESC, distance_km ASC"
+            elif has_query:
                 # Si solo hay consulta (búsqueda global), ordenar por relevancia
-                sql += " ORDER BY relevance DESC"
+                order_sql = "relevance DESC"
+                ordered_ids = relevance_ids
             else:
                 # Fallback: ordenar por nombre
-                sql += " ORDER BY b.business_name ASC"
-            # Añadir paginación
-            sql += " LIMIT %s OFFSET %s"
-            params.extend([per_page, offset])
+                order_sql = "b.business_name ASC, b.id ASC"
+                order_mode = 'name'
+
+            def sort_key(business_id: int) -> tuple:
+                """Clave (relevancia, distancia, id) con la que se ordenó ordered_ids"""
+                relevance = text_scores.get(business_id, 0.0) if text_scores is not None else 1.0
+                return rank_key(relevance, known_distances.get(business_id, 0.0), business_id)
+
+            if ordered_ids is not None:
+                order_mode = 'rank'
+
+            # Total: exacto desde los índices si no hay filtros que solo conoce
+            # MySQL; si no, un COUNT sin ORDER BY en la primera página, que
+            # después viaja dentro del cursor
+            sql_only_keys = {'city_name', 'time', 'meal_time'} | set(ATTRIBUTE_FILTER_KEYS)
+            sql_only_filters = bool(filters) and any(
+                key in filters for key in sql_only_keys - index_filters - {'service_match'}
+            )
+            # El radio sin índice geoespacial también lo resuelve solo MySQL
+            sql_only_filters = sql_only_filters or (use_radius_filter and nearby is None)
+
+            # Orden en memoria con filtros que solo conoce MySQL: una consulta de
+            # ids sin ORDER BY deja en ordered_ids los que los cumplen
+            if order_mode == 'rank' and sql_only_filters and not candidates_filtered:
+                record_stage('sql_build', build_started)
+                with stage('sql_execute'):
+                    cursor.execute("SELECT DISTINCT b.id " + sql[from_start:], params[from_params_start:])
+                    matching = {row['id'] for row in cursor.fetchall()}
+                build_started = time.perf_counter()
+                ordered_ids = [business_id for business_id in ordered_ids if business_id in matching]
+                candidates_filtered = True
+            exact_ids = ordered_ids is not None and (candidates_filtered or not sql_only_filters)
+
+            # Con el conjunto completo de resultados en memoria, facetas por bitsets
+            result_ids = ordered_ids if exact_ids else None
+            total = cursor_data.get('t') if cursor_data else None
+            if total is None and exact_ids:
+                total = len(ordered_ids)
+            if total is None:
+                record_stage('sql_build', build_started)
+                with stage('sql_execute'):
+                    cursor.execute(
+                        "SELECT COUNT(DISTINCT b.id) as total " + sql[from_start:],
+                        params[from_params_start:]
+                    )
+                    total = cursor.fetchone()['total']
+                build_started = time.perf_counter()
+
+            if cursor_data and cursor_data['m'] != order_mode:
+                raise InvalidCursorError("Cursor inválido para esta búsqueda")
+
+            if cursor_data and order_mode == 'offset':
+                offset = cursor_data['o']
+            elif cursor_data:
+                offset = 0
+
+            # Paginación por clave: solo los posteriores a la última fila entregada
+            if cursor_data and order_mode == 'rank':
+                last_key = cursor_rank_key(cursor_data)
+                ordered_ids = [business_id for business_id in ordered_ids if sort_key(business_id) > last_key]
+                if not ordered_ids:
+                    return self._empty_results(page, per_page, start_time, total)
+
+            # Con el orden en memoria la página se corta aquí y la consulta solo
+            # lleva sus ids (ya filtrados por MySQL si hacía falta)
+            page_ids = None
+            if order_mode == 'rank':
+                # Una fila de más para saber si hay página siguiente
+                page_ids = ordered_ids[offset:offset + per_page + 1]
+                if not page_ids:
+                    return self._empty_results(page, per_page, start_time, total)
+                sql = sql[:from_start] + f"""
+                    FROM
+                        businesses b
+                        LEFT JOIN categories c ON b.category_id = c.id
+                    WHERE
+                        b.deleted_at IS NULL
+                        AND b.id IN ({', '.join(['%s'] * len(page_ids))})
+                    GROUP BY b.id
+                """
+                params = params[:from_params_start] + page_ids
+            else:
+                if cursor_data and order_mode == 'name':
+                    last_name, last_id = cursor_data['k']
+                    sql += " AND (b.business_name > %s OR (b.business_name = %s AND b.id > %s))"
+                    params.extend([last_name, last_name, last_id])
+
+                # Agrupar resultados y ordenar
+                sql += " GROUP BY b.id"
+                sql += f" ORDER BY {order_sql}"
+
+                # Añadir paginación (una fila de más para saber si hay página siguiente)
+                sql += " LIMIT %s OFFSET %s"
+                params.extend([per_page + 1, offset])
 
             logging.info("Consulta SQL generada:")
             logging.info(sql)
             logging.info("Parámetros de la consulta:")
             for i, param in enumerate(params, 1):
                 logging.info(f"Parámetro {i}: {param}")
+            record_stage('sql_build', build_started)
 
             try:
                 # Ejecutar búsqueda
-                cursor.execute(sql, params)
-                results = cursor.fetchall()
+                with stage('sql_execute'):
+                    cursor.execute(sql, params)
+                with stage('fetch'):
+                    results = cursor.fetchall()
+                    if page_ids is not None:
+                        positions = {business_id: position for position, business_id in enumerate(page_ids)}
+                        results.sort(key=lambda result: positions.get(result['id'], len(positions)))
+
+                next_cursor = None
+                if len(results) > per_page:
+                    results = results[:per_page]
+                    last = results[-1]
+                    if order_mode == 'rank':
+                        relevance, distance, business_id = sort_key(last['id'])
+                        next_cursor = encode_cursor('rank', [-relevance, distance, business_id], total=total, page=page + 1)
+                    elif order_mode == 'name':
+                        next_cursor = encode_cursor('name', [last['name'], last['id']], total=total, page=page + 1)
+                    else:
+                        next_cursor = encode_cursor('offset', offset=offset + per_page, total=total, page=page + 1)
+
+                # Distancias calculadas por el índice geoespacial
+                if nearby is not None:
+                    distances = dict(nearby)
+                    for result in results:
+                        result['distance_km'] = distances.get(result['id'], 0.0)
+
+                # Relevancia calculada por el índice de texto
+                if text_scores is not None:
+                    for result in results:
+                        result['relevance'] = text_scores.get(result['id'], 0.0)
 
                 # Logging detallado de resultados
                 logging.info(f"Número total de resultados: {len(results)}")
@@ -590,7 +911,7 @@ class SearchEngine:
                 # Loguear detalles de los primeros 5 resultados
                 for i, result in enumerate(results[:5], 1):
                     logging.info(f"Resultado {i}:")
-                    logging.info(json.dumps(result, indent=2, ensure_ascii=False))
+                    logging.info(json.dumps(result, indent=2, ensure_ascii=False, default=str))
 
             except mysql.connector.Error as query_error:
                 # Logging detallado de errores de consulta
@@ -621,11 +942,20 @@ class SearchEngine:
                     'total_results': len(results),
                     'execution_time_ms': execution_time,
                     'page': page,
-                    'per_page': per_page
+                    'per_page': per_page,
+                    'total': total,
+                    'next_cursor': next_cursor,
+                    'facets': self.facets.counts(result_ids) if result_ids is not None and self.facets.loaded else None
                 }
             }
 
+        except InvalidCursorError:
+            raise
+
         except mysql.connector.Error as err:
+            # Una conexión caída no vuelve al pool
+            discard = is_disconnect(err)
+
             # Logging detallado de errores de conexión
             logging.error("Error de conexión a base de datos:")
             logging.error(f"Tipo de error: mysql.connector.Error")
@@ -675,36 +1005,158 @@ class SearchEngine:
 
 
         finally:
-            if 'conn' in locals() and conn.is_connected():
+            if 'conn' in locals():
+                if 'cursor' in locals():
+                    cursor.close()
+                self.pool.release(conn, discard=discard)
+                logging.info("Conexión a la base de datos devuelta al pool")
+
+
+    def _empty_results(self, page: int, per_page: int, start_time: float, total: int = 0) -> Dict:
+        """Resultado vacío cuando los índices en memoria ya descartan todo"""
+        return {
+            'results': [],
+            'stats': {
+                'total_results': 0,
+                'execution_time_ms': int((time.time() - start_time) * 1000),
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'next_cursor': None
+            }
+        }
+
+    def _can_rank_in_process(
+        self,
+        query: str,
+        filters: Optional[Dict],
+        coordinates: Optional[Dict],
+        text_scores: Optional[Dict[int, float]] = None,
+        index_filters: Optional[Set[str]] = None
+    ) -> bool:
+        """
+        Indica si la búsqueda puede rankearse entera con el almacén columnar:
+        búsqueda por radio, texto (si lo hay) resuelto por el índice BM25 y
+        filtros representables en columnas o ya resueltos por los índices
+        de horarios y facetas (index_filters)
+        """
+        if not coordinates:
+            return False
+        self.columns.maybe_refresh(self.pool)
+        if not self.columns.loaded:
+            return False
+        if query and query.strip() and text_scores is None:
+            return False
+
+        filters = filters or {}
+        index_filters = index_filters or set()
+        if set(filters) - {'category_id', 'service_id', 'service_match'} - index_filters:
+            return False
+        if (
+            'service_id' in filters and 'service_id' not in index_filters
+            and not BusinessColumns.supports_service(filters['service_id'])
+        ):
+            return False
+        return True
+
+    def _search_ranked_in_process(
+        self,
+        filters: Optional[Dict],
+        coordinates: Dict,
+        radius: float,
+        page: int,
+        per_page: int,
+        start_time: float,
+        text_scores: Optional[Dict[int, float]] = None,
+        cursor_data: Optional[Dict] = None,
+        allowed_ids: Optional[Set[int]] = None,
+        index_filters: Optional[Set[str]] = None
+    ) -> Dict:
+        """
+        Búsqueda por radio rankeada con el kernel vectorizado de NumPy.
+        Solo se consulta MySQL para los detalles de los negocios de la página.
+        El cursor guarda la clave (score, distancia, id) del último negocio.
+        """
+        # Los filtros ya resueltos por los índices llegan como allowed_ids
+        filters = {key: value for key, value in (filters or {}).items() if key not in (index_filters or ())}
+        if cursor_data and cursor_data['m'] != 'rank':
+            raise InvalidCursorError("Cursor inválido para esta búsqueda")
+        offset = 0 if cursor_data else (page - 1) * per_page
+        after = tuple(cursor_data['k']) if cursor_data else None
+
+        with stage('index'):
+            ranked = self.columns.rank(
+                coordinates['latitude'],
+                coordinates['longitude'],
+                radius,
+                k=offset + per_page,
+                category_id=filters.get('category_id'),
+                service_id=filters.get('service_id'),
+                relevance=text_scores,
+                after=after,
+                business_ids=allowed_ids
+            )
+        logging.info(f"Ranking en memoria: {ranked['total']} negocios a menos de {radius}km")
+
+        page_ids = ranked['ids'][offset:offset + per_page]
+        next_cursor = None
+        if page_ids and ranked['remaining'] > offset + len(page_ids):
+            last = offset + len(page_ids) - 1
+            next_cursor = encode_cursor(
+                'rank',
+                [ranked['scores'][last], ranked['distances'][last], ranked['ids'][last]],
+                page=page + 1
+            )
+        distances = dict(zip(ranked['ids'], ranked['distances']))
+        relevance = dict(zip(ranked['ids'], ranked['relevance']))
+
+        results = []
+        if page_ids:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                placeholders = ', '.join(['%s'] * len(page_ids))
+                with stage('sql_execute'):
+                    cursor.execute(
+                        BUSINESSES_BY_IDS_QUERY.format(placeholders=placeholders),
+                        page_ids + page_ids
+                    )
+                with stage('fetch'):
+                    results = cursor.fetchall()
                 cursor.close()
-                conn.close()
-                logging.info("Conexión a la base de datos cerrada")
 
+            for result in results:
+                result['distance_km'] = distances.get(result['id'], 0.0)
+                result['relevance'] = relevance.get(result['id'], 1.0)
+
+        return {
+            'results': results,
+            'stats': {
+                'total_results': len(results),
+                'execution_time_ms': int((time.time() - start_time) * 1000),
+                'page': page,
+                'per_page': per_page,
+                'total': ranked['total'],
+                'next_cursor': next_cursor,
+                'facets': self.facets.counts(ranked['matched']) if self.facets.loaded else None
+            }
+        }
 
     def _log_search(
         self,
-        cursor,
         query: str,
         filters: Optional[Dict],
         results_count: int,
-        execution_time: int
+        execution_time: int,
+        user_id: Optional[str] = None
     ):
         """
-        Registra la búsqueda en la tabla de logs
+        Registra la búsqueda en la tabla de logs. Solo se encola: el INSERT lo
+        hace por lotes el escritor en segundo plano.
         """
         try:
-            sql = """
-                INSERT INTO search_logs
-                (query, filters, results_count, execution_time_ms)
-                VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(sql, (
-                query,
-                json.dumps(filters) if filters else None,
-                results_count,
-                execution_time
-            ))
-        except Error as e:
+            self.search_log.record(query, filters, results_count, execution_time, user_id)
+            self.analytics.record(query, user_id, results_count, execution_time)
+        except Exception as e:
             print(f"Error al registrar log: {e}")
 
     def _format_top_searches(self, searches: List[Dict]) -> List[Dict]:
@@ -718,51 +1170,140 @@ class SearchEngine:
     def get_search_stats(self, days: int = 7, user_id: Optional[str] = None) -> Dict:
         """
         Obtiene estadísticas de búsqueda
+
+        Sin user_id se responde desde los sketches de analítica (fusión de
+        resúmenes de tamaño fijo, con percentiles de latencia) o, si no están
+        disponibles, desde los rollups horarios (como mucho 24 x days filas);
+        si tampoco existen se recurre a search_logs.
         """
+        if not user_id and self.analytics.enabled and os.environ.get('STATS_USE_SKETCHES', 'True').lower() == 'true':
+            try:
+                return self._stats_from_sketches(days)
+            except Error as e:
+                logging.warning(f"Sketches no disponibles, usando rollups: {e}")
+
+        discard = False
         try:
-            conn = mysql.connector.connect(**self.db_config)
+            conn = self.pool.acquire()
             cursor = conn.cursor(dictionary=True)
 
-            params = [days]
-            sql = STATS_GENERAL_QUERY
-            if user_id:
-                sql += " AND user_id = %s"
-                params.append(user_id)
-
-            # Obtener estadísticas generales
-            cursor.execute(sql, params)
-            general_stats = cursor.fetchone()
-
-            # Obtener top búsquedas
-            cursor.execute(TOP_SEARCHES_QUERY, [days])
-            top_searches = cursor.fetchall()
+            if not user_id and os.environ.get('STATS_USE_ROLLUPS', 'True').lower() == 'true':
+                try:
+                    return self._stats_from_rollups(cursor, days)
+                except Error as e:
+                    logging.warning(f"Rollups no disponibles, usando search_logs: {e}")
 
-            # Obtener distribución horaria
-            cursor.execute(HOURLY_DISTRIBUTION_QUERY, [days])
-            hourly_distribution = cursor.fetchall()
-
-            return {
-                'period': f'Últimos {days} días',
-                'general_stats': self._format_general_stats(general_stats),
-                'top_searches': self._format_top_searches(top_searches),
-                'hourly_distribution': hourly_distribution
-            }
+            return self._stats_from_logs(cursor, days, user_id)
 
         except Error as e:
             print(f"Error obteniendo estadísticas: {e}")
+            discard = is_disconnect(e)
             raise
         finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            if 'conn' in locals():
+                if 'cursor' in locals():
+                    cursor.close()
+                self.pool.release(conn, discard=discard)
+
+    def _stats_from_sketches(self, days: int) -> Dict:
+        """Estadísticas fusionando los sketches horarios de todos los workers"""
+        window = self.analytics.window(days)
+        total = window['total']
+
+        general_stats = {
+            'total_searches': total.searches,
+            'unique_users': total.users.count(),
+            'avg_results': total.results_sum / total.searches if total.searches else 0,
+            'avg_execution_time': total.latency.total / total.latency.count if total.latency.count else 0,
+            'min_execution_time': int(total.latency.min) if total.latency.min is not None else None,
+            'max_execution_time': int(total.latency.max) if total.latency.max is not None else None,
+            'zero_results_searches': total.zero_results,
+            'percentiles': {
+                f'p{int(q * 100)}': total.latency.quantile(q) for q in (0.5, 0.95, 0.99)
+            }
+        }
+
+        top_searches = [
+            {'query': query, 'frequency': frequency, 'avg_results': avg_results or 0}
+            for query, frequency, _, avg_results in total.queries.top(10)
+        ]
+
+        hours: Dict[int, int] = {}
+        for bucket, searches in window['hours'].items():
+            hours[bucket.hour] = hours.get(bucket.hour, 0) + searches
+        hourly_distribution = [{'hour': hour, 'searches': hours[hour]} for hour in sorted(hours)]
+
+        return {
+            'period': f'Últimos {days} días',
+            'general_stats': self._format_general_stats(general_stats),
+            'top_searches': self._format_top_searches(top_searches),
+            'hourly_distribution': hourly_distribution
+        }
+
+    def _stats_from_rollups(self, cursor, days: int) -> Dict:
+        """Estadísticas sumando los buckets horarios de la ventana"""
+        since = window_start(days)
+
+        cursor.execute(ROLLUP_STATS_GENERAL_QUERY, [since])
+        general_stats = cursor.fetchone()
+        # Usuarios únicos (aproximados) fusionando el HyperLogLog de cada hora
+        cursor.execute(ROLLUP_USERS_SKETCH_QUERY, [since])
+        general_stats['unique_users'] = count_unique_users(row['users_sketch'] for row in cursor.fetchall())
+        # SUM() devuelve Decimal en MySQL
+        for key in ('total_searches', 'zero_results_searches'):
+            general_stats[key] = int(general_stats[key] or 0)
+
+        cursor.execute(ROLLUP_TOP_SEARCHES_QUERY, [since])
+        top_searches = [
+            dict(row, frequency=int(row['frequency'])) for row in cursor.fetchall()
+        ]
+
+        cursor.execute(ROLLUP_HOURLY_DISTRIBUTION_QUERY, [since])
+        hourly_distribution = [
+            {'hour': row['hour'], 'searches': int(row['searches'])} for row in cursor.fetchall()
+        ]
+
+        return {
+            'period': f'Últimos {days} días',
+            'general_stats': self._format_general_stats(general_stats),
+            'top_searches': self._format_top_searches(top_searches),
+            'hourly_distribution': hourly_distribution
+        }
+
+    def _stats_from_logs(self, cursor, days: int, user_id: Optional[str] = None) -> Dict:
+        """Estadísticas recorriendo search_logs (filtro por usuario o sin rollups)"""
+        params = [days]
+        sql = STATS_GENERAL_QUERY
+        if user_id:
+            sql += " AND user_id = %s"
+            params.append(user_id)
+
+        # Obtener estadísticas generales
+        cursor.execute(sql, params)
+        general_stats = cursor.fetchone()
+
+        # Obtener top búsquedas
+        cursor.execute(TOP_SEARCHES_QUERY, [days])
+        top_searches = cursor.fetchall()
+
+        # Obtener distribución horaria
+        cursor.execute(HOURLY_DISTRIBUTION_QUERY, [days])
+        hourly_distribution = cursor.fetchall()
+
+        return {
+            'period': f'Últimos {days} días',
+            'general_stats': self._format_general_stats(general_stats),
+            'top_searches': self._format_top_searches(top_searches),
+            'hourly_distribution': hourly_distribution
+        }
 
     def _format_general_stats(self, stats: Dict) -> Dict:
         """Formatea estadísticas generales"""
-        return {
+        formatted = {
             'total_searches': stats['total_searches'],
             'unique_users': stats['unique_users'],
-            'average_results': round(float(stats['avg_results']), 2),
-            'average_execution_time_ms': round(float(stats['avg_execution_time']), 2),
+            'average_results': round(float(stats['avg_results'] or 0), 2),
+            'average_execution_time_ms': round(float(stats['avg_execution_time'] or 0), 2),
             'min_execution_time_ms': stats['min_execution_time'],
             'max_execution_time_ms': stats['max_execution_time'],
             'zero_results_percentage': round(
@@ -770,4 +1311,11 @@ class SearchEngine:
                 if stats['total_searches'] > 0 else 0,
                 2
             )
-        }
\ No newline at end of file
+        }
+        if stats.get('percentiles'):
+            # Solo disponibles con los sketches (t-digest)
+            formatted['execution_time_percentiles_ms'] = {
+                name: round(value, 2) if value is not None else None
+                for name, value in stats['percentiles'].items()
+            }
+        return formatted
\ No newline at end of file
@@ -0,0 +1,187 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import threading
+import logging
+import time
+import os
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy los filtros de categoría/servicio van por SQL
+    np = None
+
+# Claves de filtro que resuelve el índice
+ATTRIBUTE_FILTER_KEYS = ('category_id', 'category_ids', 'service_id', 'service_ids', 'service_match')
+
+
+def attribute_filters(filters: Optional[Dict]) -> Tuple[List[int], List[int], str]:
+    """
+    Normaliza los filtros de categoría y servicio:
+    (categorías aceptadas (OR), servicios, 'all' (AND) o 'any' (OR))
+    """
+    filters = filters or {}
+    category_ids = list(filters.get('category_ids') or [])
+    if filters.get('category_id') is not None:
+        category_ids.append(filters['category_id'])
+    service_ids = list(filters.get('service_ids') or [])
+    if filters.get('service_id') is not None:
+        service_ids.append(filters['service_id'])
+    match = 'any' if str(filters.get('service_match', 'all')).lower() == 'any' else 'all'
+    return (
+        sorted({int(category_id) for category_id in category_ids}),
+        sorted({int(service_id) for service_id in service_ids}),
+        match
+    )
+
+
+def has_attribute_filters(filters: Optional[Dict]) -> bool:
+    category_ids, service_ids, _ = attribute_filters(filters)
+    return bool(category_ids or service_ids)
+
+
+class FacetIndex:
+    """
+    Bitsets en memoria por category_id y por service_id sobre los negocios
+    activos (una fila de booleanos de NumPy por valor, alineadas por posición).
+
+    Los filtros de varios servicios son AND/OR de filas y los conteos de
+    facetas del conjunto de resultados son un AND con la máscara del
+    resultado y un count_nonzero por fila. Se recarga entero cada
+    FACET_INDEX_REFRESH_SECONDS.
+    """
+
+    def __init__(self, refresh_interval: Optional[float] = None):
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.environ.get('FACET_INDEX_REFRESH_SECONDS', 300))
+        )
+
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+        self.loaded = False
+
+        self.ids = None
+        self.category_values: List[int] = []
+        self.service_values: List[int] = []
+        self._category_rows: Dict[int, int] = {}
+        self._service_rows: Dict[int, int] = {}
+        self.category_bits = None
+        self.service_bits = None
+
+    def __len__(self) -> int:
+        return len(self.ids) if self.ids is not None else 0
+
+    def _read_rows(self, pool) -> Tuple[List[Dict], List[Dict]]:
+        with pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT b.id, c.id as category_id
+                FROM businesses b
+                LEFT JOIN categories c ON b.category_id = c.id
+                WHERE b.deleted_at IS NULL
+            """)
+            businesses = cursor.fetchall()
+            cursor.execute("SELECT business_id, service_id FROM business_service")
+            links = cursor.fetchall()
+            cursor.close()
+        return businesses, links
+
+    def load(self, pool):
+        """Carga completa de los bitsets"""
+        if np is None:
+            logging.warning("NumPy no disponible: índice de facetas deshabilitado")
+            return
+
+        start_time = time.time()
+        businesses, links = self._read_rows(pool)
+
+        ids = np.array([row['id'] for row in businesses], dtype=np.int64)
+        positions = {business_id: position for position, business_id in enumerate(ids.tolist())}
+
+        category_values = sorted({row['category_id'] for row in businesses if row.get('category_id') is not None})
+        category_rows = {category_id: row for row, category_id in enumerate(category_values)}
+        category_bits = np.zeros((len(category_values), len(ids)), dtype=bool)
+        for position, row in enumerate(businesses):
+            if row.get('category_id') is not None:
+                category_bits[category_rows[row['category_id']], position] = True
+
+        service_values = sorted({link['service_id'] for link in links})
+        service_rows = {service_id: row for row, service_id in enumerate(service_values)}
+        service_bits = np.zeros((len(service_values), len(ids)), dtype=bool)
+        for link in links:
+            position = positions.get(link['business_id'])
+            if position is not None:
+                service_bits[service_rows[link['service_id']], position] = True
+
+        with self._lock:
+            self.ids = ids
+            self.category_values, self._category_rows, self.category_bits = category_values, category_rows, category_bits
+            self.service_values, self._service_rows, self.service_bits = service_values, service_rows, service_bits
+            self._last_refresh = time.time()
+            self.loaded = True
+
+        logging.info(
+            f"Índice de facetas cargado: {len(ids)} negocios, {len(category_values)} categorías, "
+            f"{len(service_values)} servicios ({int((time.time() - start_time) * 1000)}ms)"
+        )
+
+    def mark_stale(self):
+        """Fuerza la recarga en la siguiente llamada a maybe_refresh"""
+        self._last_refresh = 0.0
+
+    def maybe_refresh(self, pool):
+        """Recarga el índice si ha pasado el intervalo configurado"""
+        if self.refresh_interval and time.time() - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = time.time()
+            try:
+                self.load(pool)
+            except Exception as e:
+                self._last_refresh = time.time()
+                logging.error(f"Error refrescando el índice de facetas: {e}")
+
+    def _row(self, bits, rows: Dict[int, int], value: int):
+        row = rows.get(value)
+        return bits[row] if row is not None else np.zeros(len(self.ids), dtype=bool)
+
+    def matching(self, filters: Optional[Dict]) -> Optional[Set[int]]:
+        """
+        Negocios que cumplen los filtros de categoría (cualquiera de las
+        indicadas) y de servicios (todos o alguno según service_match).
+        None si no hay filtros de categoría ni de servicio.
+        """
+        category_ids, service_ids, match = attribute_filters(filters)
+        if not category_ids and not service_ids:
+            return None
+
+        with self._lock:
+            mask = np.ones(len(self.ids), dtype=bool)
+            if category_ids:
+                categories = np.zeros(len(self.ids), dtype=bool)
+                for category_id in category_ids:
+                    categories |= self._row(self.category_bits, self._category_rows, category_id)
+                mask &= categories
+            if service_ids:
+                rows = [self._row(self.service_bits, self._service_rows, service_id) for service_id in service_ids]
+                mask &= np.logical_and.reduce(rows) if match == 'all' else np.logical_or.reduce(rows)
+            return set(self.ids[mask].tolist())
+
+    def counts(self, business_ids: Iterable[int]) -> Dict[str, List[Dict]]:
+        """Conteos por categoría y por servicio del conjunto de resultados"""
+        if not isinstance(business_ids, np.ndarray):
+            business_ids = np.fromiter(business_ids, dtype=np.int64)
+
+        with self._lock:
+            result = np.isin(self.ids, business_ids)
+            category_counts = np.count_nonzero(self.category_bits & result, axis=1) if len(self.category_values) else []
+            service_counts = np.count_nonzero(self.service_bits & result, axis=1) if len(self.service_values) else []
+
+            def facet(values: List[int], counts) -> List[Dict]:
+                entries = [
+                    {'id': value, 'count': int(count)}
+                    for value, count in zip(values, counts) if count
+                ]
+                return sorted(entries, key=lambda entry: (-entry['count'], entry['id']))
+
+            return {
+                'categories': facet(self.category_values, category_counts),
+                'services': facet(self.service_values, service_counts)
+            }
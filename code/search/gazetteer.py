@@ -0,0 +1,164 @@
+from typing import Callable, Dict, List, Optional, Set
+import threading
+import logging
+import time
+import os
+
+
+def _trigrams(text: str) -> Set[str]:
+    """Trigramas de un texto con padding (para matching difuso)"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Distancia de Levenshtein con corte temprano a partir de max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class CityGazetteer:
+    """
+    Gazetteer en memoria con los valores distintos de business_city.
+
+    Se carga una vez y se refresca periódicamente. Está indexado por nombre en
+    minúsculas, por la forma normalizada de TextProcessor._normalize_city_name
+    y por trigramas, de modo que resolver una ciudad (exacta, parcial o con
+    errores/acentos) es una búsqueda en memoria y nunca una consulta a la BD.
+    """
+
+    def __init__(self, normalizer: Callable[[str], str], refresh_interval: Optional[float] = None):
+        self.normalizer = normalizer
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.environ.get('GAZETTEER_REFRESH_SECONDS', 600))
+        )
+        self.min_similarity = float(os.environ.get('GAZETTEER_MIN_SIMILARITY', 0.5))
+
+        self._lock = threading.RLock()
+        self._by_lower: Dict[str, str] = {}
+        self._by_normalized: Dict[str, str] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._last_refresh = 0.0
+        self.loaded = False
+        # Se incrementa cada vez que cambia el contenido (para invalidar cachés)
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._by_lower)
+
+    def build(self, cities: List[str]):
+        """Construye los índices a partir de una lista de ciudades"""
+        by_lower = {}
+        by_normalized = {}
+        trigrams = {}
+        for city in sorted(set(city.strip() for city in cities if city and city.strip())):
+            by_lower.setdefault(city.lower(), city)
+            normalized = self.normalizer(city)
+            if normalized:
+                by_normalized.setdefault(normalized, city)
+                for trigram in _trigrams(normalized):
+                    trigrams.setdefault(trigram, set()).add(normalized)
+
+        with self._lock:
+            changed = set(by_lower) != set(self._by_lower)
+            self._by_lower = by_lower
+            self._by_normalized = by_normalized
+            self._trigrams = trigrams
+            self._last_refresh = time.time()
+            self.loaded = True
+            if changed:
+                self.version += 1
+
+    def load(self, pool):
+        """Carga (o recarga) las ciudades desde la tabla businesses"""
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT business_city FROM businesses WHERE business_city IS NOT NULL")
+            cities = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+
+        self.build(cities)
+        logging.info(f"Gazetteer de ciudades cargado: {len(self._by_lower)} ciudades")
+
+    def maybe_refresh(self, pool):
+        """Recarga el gazetteer si ha pasado el intervalo configurado"""
+        if self.refresh_interval and time.time() - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = time.time()
+            try:
+                self.load(pool)
+            except Exception as e:
+                self._last_refresh = time.time()
+                logging.error(f"Error refrescando el gazetteer de ciudades: {e}")
+
+    def _fuzzy(self, normalized: str) -> Optional[str]:
+        """Mejor candidato por similitud de trigramas y distancia de edición"""
+        query_trigrams = _trigrams(normalized)
+        counts: Dict[str, int] = {}
+        for trigram in query_trigrams:
+            for candidate in self._trigrams.get(trigram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+
+        max_distance = max(1, len(normalized) // 4)
+        best = None
+        for candidate, shared in counts.items():
+            similarity = shared / len(query_trigrams | _trigrams(candidate))
+            if similarity < self.min_similarity:
+                continue
+            distance = _edit_distance(normalized, candidate, max_distance)
+            if distance > max_distance:
+                continue
+            key = (distance, -similarity, candidate)
+            if best is None or key < best[0]:
+                best = (key, candidate)
+
+        return self._by_normalized[best[1]] if best else None
+
+    def lookup(self, city_name: str, variations: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Devuelve el nombre exacto de la ciudad tal y como está en la BD.
+        Para cada variación prueba coincidencia exacta y parcial (como el
+        antiguo LOWER(...) = ... / LIKE '%x%'); si ninguna encaja, prueba la
+        forma normalizada y después coincidencias difusas.
+        """
+        variations = variations or [city_name]
+        with self._lock:
+            for variation in variations:
+                variation_lower = variation.lower().strip()
+                if not variation_lower:
+                    continue
+
+                exact = self._by_lower.get(variation_lower)
+                if exact:
+                    return exact
+
+                partial = [city for lower, city in self._by_lower.items() if variation_lower in lower]
+                if partial:
+                    return min(partial, key=lambda city: (len(city), city))
+
+            for variation in variations:
+                normalized = self.normalizer(variation)
+                if not normalized:
+                    continue
+                city = self._by_normalized.get(normalized)
+                if city:
+                    return city
+                city = self._fuzzy(normalized)
+                if city:
+                    return city
+
+        return None
@@ -0,0 +1,199 @@
+from typing import Dict, List, Optional, Set, Tuple
+import threading
+import logging
+import math
+import time
+import os
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia en km entre dos puntos sobre la esfera terrestre"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """
+    Índice geoespacial en memoria sobre business_latitude/business_longitude.
+
+    Los negocios se reparten en una rejilla uniforme de celdas de
+    GEO_INDEX_CELL_KM km de lado (en grados). Una búsqueda por radio solo
+    visita las celdas que cubren el bounding box del círculo y calcula la
+    distancia exacta únicamente para los negocios de esas celdas.
+
+    Se refresca de forma incremental usando updated_at como marca de agua.
+    """
+
+    def __init__(self, cell_size_km: Optional[float] = None, refresh_interval: Optional[float] = None):
+        self.cell_size_km = cell_size_km or float(os.environ.get('GEO_INDEX_CELL_KM', 2.0))
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.environ.get('GEO_INDEX_REFRESH_SECONDS', 300))
+        )
+        self.cell_deg = self.cell_size_km / KM_PER_DEGREE
+
+        self._lock = threading.RLock()
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._watermark = None
+        self._last_refresh = 0.0
+        self.loaded = False
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg)))
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def upsert(self, business_id: int, lat: float, lon: float):
+        """Inserta o mueve un negocio en el índice"""
+        with self._lock:
+            self.remove(business_id)
+            self._points[business_id] = (lat, lon)
+            self._cells.setdefault(self._cell(lat, lon), set()).add(business_id)
+
+    def remove(self, business_id: int):
+        """Elimina un negocio del índice (si existe)"""
+        with self._lock:
+            point = self._points.pop(business_id, None)
+            if point is None:
+                return
+            cell = self._cell(*point)
+            ids = self._cells.get(cell)
+            if ids is not None:
+                ids.discard(business_id)
+                if not ids:
+                    del self._cells[cell]
+
+    def _apply_rows(self, rows: List[Dict]):
+        for row in rows:
+            lat = row.get('business_latitude')
+            lon = row.get('business_longitude')
+            if row.get('deleted_at') is not None or lat is None or lon is None:
+                self.remove(row['id'])
+            else:
+                self.upsert(row['id'], float(lat), float(lon))
+
+            updated_at = row.get('updated_at')
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    def load(self, pool):
+        """Carga completa del índice desde la tabla businesses"""
+        start_time = time.time()
+        with pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, business_latitude, business_longitude, deleted_at, updated_at
+                FROM businesses
+                WHERE deleted_at IS NULL
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+
+        with self._lock:
+            self._points = {}
+            self._cells = {}
+            self._watermark = None
+            self._apply_rows(rows)
+            self._last_refresh = time.time()
+            self.loaded = True
+
+        logging.info(
+            f"Índice geoespacial cargado: {len(self._points)} negocios en "
+            f"{len(self._cells)} celdas ({int((time.time() - start_time) * 1000)}ms)"
+        )
+
+    def refresh(self, pool):
+        """
+        Refresco incremental: solo lee los negocios con updated_at posterior a
+        la marca de agua (incluidos los borrados lógicamente)
+        """
+        if not self.loaded or self._watermark is None:
+            return self.load(pool)
+
+        with pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, business_latitude, business_longitude, deleted_at, updated_at
+                FROM businesses
+                WHERE updated_at >= %s
+            """, (self._watermark,))
+            rows = cursor.fetchall()
+            cursor.close()
+
+        with self._lock:
+            self._apply_rows(rows)
+            self._last_refresh = time.time()
+
+        if rows:
+            logging.info(f"Índice geoespacial actualizado: {len(rows)} negocios modificados")
+
+    def mark_stale(self):
+        """Fuerza el refresco en la siguiente llamada a maybe_refresh"""
+        self._last_refresh = 0.0
+
+    def maybe_refresh(self, pool):
+        """Refresca el índice si ha pasado el intervalo configurado"""
+        if self.refresh_interval and time.time() - self._last_refresh >= self.refresh_interval:
+            # Se reserva el turno antes de leer para que las peticiones
+            # concurrentes no repitan la misma carga (ni los reintentos tras un fallo)
+            self._last_refresh = time.time()
+            try:
+                self.refresh(pool)
+            except Exception as e:
+                # Si falla, se sigue sirviendo el índice actual y se reintenta más tarde
+                self._last_refresh = time.time()
+                logging.error(f"Error refrescando el índice geoespacial: {e}")
+
+    def bounding_box(self, lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+        """Bounding box (min_lat, max_lat, min_lon, max_lon) que contiene el círculo"""
+        d_lat = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        d_lon = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+        return lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon
+
+    def query(self, lat: float, lon: float, radius_km: float) -> List[Tuple[int, float]]:
+        """
+        Devuelve [(business_id, distancia_km), ...] de los negocios a menos de
+        radius_km de (lat, lon), ordenados por distancia ascendente
+        """
+        min_lat, max_lat, min_lon, max_lon = self.bounding_box(lat, lon, radius_km)
+        min_cell = self._cell(min_lat, min_lon)
+        max_cell = self._cell(max_lat, max_lon)
+
+        results = []
+        with self._lock:
+            points = self._points
+            span = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+            if span <= len(self._cells):
+                cells = (
+                    self._cells.get((cell_lat, cell_lon))
+                    for cell_lat in range(min_cell[0], max_cell[0] + 1)
+                    for cell_lon in range(min_cell[1], max_cell[1] + 1)
+                )
+            else:
+                # Rejilla dispersa: es más barato recorrer solo las celdas ocupadas
+                cells = (
+                    ids for cell, ids in self._cells.items()
+                    if min_cell[0] <= cell[0] <= max_cell[0] and min_cell[1] <= cell[1] <= max_cell[1]
+                )
+
+            for ids in cells:
+                if not ids:
+                    continue
+                for business_id in ids:
+                    b_lat, b_lon = points[business_id]
+                    distance = haversine_km(lat, lon, b_lat, b_lon)
+                    if distance <= radius_km:
+                        results.append((business_id, distance))
+
+        results.sort(key=lambda item: (item[1], item[0]))
+        return results
@@ -0,0 +1,349 @@
+from typing import Dict, List, Optional, Set, Tuple
+import threading
+import datetime
+import logging
+import time
+import os
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy las pruebas de bits se hacen negocio a negocio
+    np = None
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+# 672 bits empaquetados en palabras de 64 bits
+WORDS = (SLOTS_PER_WEEK + 63) // 64
+WORD_BYTES = WORDS * 8
+
+
+def to_minutes(value) -> Optional[int]:
+    """
+    Minutos desde las 00:00 de una hora de business_hours (TIME llega como
+    timedelta y puede pasar de 24:00) o de un filtro ('19:00', '7:30' o la
+    hora como entero)
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds() // 60)
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute
+    if isinstance(value, int):
+        return value * 60
+    try:
+        parts = str(value).split(':')
+        return int(parts[0]) * 60 + (int(parts[1]) if len(parts) > 1 else 0)
+    except ValueError:
+        return None
+
+
+def sql_time(minutes: int) -> str:
+    """Minutos -> literal TIME de MySQL ('21:00:00'; admite más de 24:00)"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def load_timezone(name: str) -> datetime.tzinfo:
+    """Zona horaria IANA ('Europe/Madrid'); UTC si no se reconoce"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning(f"Zona horaria desconocida '{name}': se usa UTC para los filtros de horario")
+        return datetime.timezone.utc
+
+
+def range_mask(start_slot: int, end_slot: int) -> int:
+    """Bits [start_slot, end_slot) de la semana, dando la vuelta de domingo a lunes"""
+    length = end_slot - start_slot
+    if length <= 0:
+        return 0
+    if length >= SLOTS_PER_WEEK:
+        return (1 << SLOTS_PER_WEEK) - 1
+    start_slot %= SLOTS_PER_WEEK
+    mask = ((1 << length) - 1) << start_slot
+    overflow = mask >> SLOTS_PER_WEEK
+    return (mask | overflow) & ((1 << SLOTS_PER_WEEK) - 1)
+
+
+def shift_mask(day: int, open_value, close_value) -> int:
+    """
+    Bits de un turno. Solo se marcan las franjas de 15 minutos abiertas
+    enteras (apertura redondeada hacia arriba, cierre hacia abajo), así que
+    "abierto a las T" nunca da falsos positivos. Un cierre anterior o igual a
+    la apertura (20:00-02:00) termina al día siguiente.
+    """
+    opens = to_minutes(open_value)
+    closes = to_minutes(close_value)
+    if opens is None or closes is None:
+        return 0
+    if closes <= opens:
+        closes += 24 * 60
+    start = day * SLOTS_PER_DAY + -(-opens // SLOT_MINUTES)
+    end = day * SLOTS_PER_DAY + closes // SLOT_MINUTES
+    return range_mask(start, end)
+
+
+class OpeningHoursIndex:
+    """
+    Índice en memoria de business_hours: un bitmap semanal por negocio con
+    resolución de 15 minutos (7 x 96 bits), con los dos turnos (open_a/close_a
+    y open_b/close_b) y los cierres después de medianoche.
+
+    Los bitmaps se empaquetan en un array (negocios x 11 palabras de 64 bits)
+    y "abierto a la hora T del día D", "abierto durante [desde, hasta]" o
+    "abierto en algún momento de la franja de una comida" son una máscara y
+    un AND vectorizado sobre todos los negocios.
+
+    Los días de business_hours empiezan en lunes (day 0) salvo que
+    HOURS_WEEK_START=sunday. "Hoy" y "ahora" se toman en la zona horaria
+    SEARCH_TIMEZONE (la de los horarios de los negocios), no en la del
+    servidor. Se recarga entero cada HOURS_INDEX_REFRESH_SECONDS.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: Optional[float] = None,
+        week_start: Optional[str] = None,
+        timezone: Optional[str] = None
+    ):
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.environ.get('HOURS_INDEX_REFRESH_SECONDS', 300))
+        )
+        self.week_start = (week_start or os.environ.get('HOURS_WEEK_START', 'monday')).lower()
+        self.timezone = load_timezone(timezone or os.environ.get('SEARCH_TIMEZONE', 'UTC'))
+
+        self._lock = threading.RLock()
+        self._last_refresh = 0.0
+        self.loaded = False
+
+        self._ids = None
+        self._words = None
+        self._bitmaps: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids) if self._ids is not None else len(self._bitmaps)
+
+    def _weekday(self, day: int) -> Optional[int]:
+        """Día de business_hours -> día de la semana de Python (lunes = 0)"""
+        if day is None or not 0 <= int(day) <= 6:
+            return None
+        return (int(day) - 1) % 7 if self.week_start == 'sunday' else int(day)
+
+    def _day(self, weekday: int) -> int:
+        """Día de la semana de Python (lunes = 0) -> día de business_hours"""
+        return (weekday + 1) % 7 if self.week_start == 'sunday' else weekday
+
+    def today(self) -> int:
+        """Día de la semana actual (lunes = 0) en la zona horaria configurada"""
+        return datetime.datetime.now(self.timezone).weekday()
+
+    def _read_rows(self, pool) -> List[Dict]:
+        with pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT bh.business_id, bh.day, bh.open_a, bh.close_a, bh.open_b, bh.close_b
+                FROM business_hours bh
+                JOIN businesses b ON b.id = bh.business_id
+                WHERE b.deleted_at IS NULL
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def build(self, rows: List[Dict]) -> Dict[int, int]:
+        """Bitmap semanal por negocio a partir de filas de business_hours"""
+        bitmaps: Dict[int, int] = {}
+        skipped = 0
+        for row in rows:
+            weekday = self._weekday(row.get('day'))
+            if weekday is None:
+                skipped += 1
+                continue
+            mask = (
+                shift_mask(weekday, row.get('open_a'), row.get('close_a'))
+                | shift_mask(weekday, row.get('open_b'), row.get('close_b'))
+            )
+            bitmaps[row['business_id']] = bitmaps.get(row['business_id'], 0) | mask
+        if skipped:
+            logging.warning(f"Índice de horarios: {skipped} filas con día fuera de 0-6 ignoradas")
+        return bitmaps
+
+    def load(self, pool):
+        """Carga completa de los horarios"""
+        start_time = time.time()
+        bitmaps = self.build(self._read_rows(pool))
+
+        with self._lock:
+            if np is not None:
+                ids = list(bitmaps)
+                self._ids = np.array(ids, dtype=np.int64)
+                packed = b''.join(bitmaps[business_id].to_bytes(WORD_BYTES, 'little') for business_id in ids)
+                self._words = np.frombuffer(packed, dtype='<u8').reshape(len(ids), WORDS)
+                self._bitmaps = {}
+            else:
+                self._bitmaps = bitmaps
+            self._last_refresh = time.time()
+            self.loaded = True
+
+        logging.info(
+            f"Índice de horarios cargado: {len(bitmaps)} negocios "
+            f"({int((time.time() - start_time) * 1000)}ms)"
+        )
+
+    def mark_stale(self):
+        """Fuerza la recarga en la siguiente llamada a maybe_refresh"""
+        self._last_refresh = 0.0
+
+    def maybe_refresh(self, pool):
+        """Recarga el índice si ha pasado el intervalo configurado"""
+        if self.refresh_interval and time.time() - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = time.time()
+            try:
+                self.load(pool)
+            except Exception as e:
+                self._last_refresh = time.time()
+                logging.error(f"Error refrescando el índice de horarios: {e}")
+
+    def select(self, mask: int, require_all: bool = True) -> Set[int]:
+        """Negocios con todos los bits de mask (o alguno si require_all es False)"""
+        if not mask:
+            return set()
+        with self._lock:
+            if self._words is not None:
+                query = np.frombuffer(mask.to_bytes(WORD_BYTES, 'little'), dtype='<u8')
+                hits = self._words & query
+                matching = np.all(hits == query, axis=1) if require_all else np.any(hits != 0, axis=1)
+                return set(self._ids[matching].tolist())
+            if require_all:
+                return {business_id for business_id, bitmap in self._bitmaps.items() if bitmap & mask == mask}
+            return {business_id for business_id, bitmap in self._bitmaps.items() if bitmap & mask}
+
+    @staticmethod
+    def window_mask(weekday: int, start_minutes: int, end_minutes: Optional[int] = None) -> int:
+        """
+        Máscara de [start, end) en el día indicado; sin end, la franja que
+        contiene start. Un end anterior o igual a start termina al día siguiente.
+        """
+        start = weekday * SLOTS_PER_DAY + start_minutes // SLOT_MINUTES
+        if end_minutes is None:
+            return range_mask(start, start + 1)
+        if end_minutes <= start_minutes:
+            end_minutes += 24 * 60
+        end = weekday * SLOTS_PER_DAY + -(-end_minutes // SLOT_MINUTES)
+        return range_mask(start, max(end, start + 1))
+
+    def open_at(self, weekday: int, minutes: int) -> Set[int]:
+        """Abiertos a la hora indicada"""
+        return self.select(self.window_mask(weekday, minutes))
+
+    def open_during(self, weekday: int, start_minutes: int, end_minutes: int) -> Set[int]:
+        """Abiertos durante toda la franja [start, end)"""
+        return self.select(self.window_mask(weekday, start_minutes, end_minutes))
+
+    def open_any(self, weekday: int, start_minutes: int, end_minutes: int) -> Set[int]:
+        """Abiertos en algún momento de la franja [start, end)"""
+        return self.select(self.window_mask(weekday, start_minutes, end_minutes), require_all=False)
+
+    def matching(self, filters: Optional[Dict], weekday: Optional[int] = None) -> Optional[Set[int]]:
+        """
+        Negocios que cumplen los filtros 'time' y 'meal_time' de la búsqueda
+        para el día indicado (hoy por defecto). None si no hay filtros de horario.
+
+        - open_from: abierto a esa hora
+        - open_until: sigue abierto justo antes de esa hora
+        - open_from + open_until: abierto durante toda la franja
+        - meal_time: abierto en algún momento de typical_hours
+        """
+        filters = filters or {}
+        if 'time' not in filters and 'meal_time' not in filters:
+            return None
+        if weekday is None:
+            weekday = self.today()
+
+        result = None
+        time_info = filters.get('time') or {}
+        open_from = to_minutes(time_info.get('open_from'))
+        open_until = to_minutes(time_info.get('open_until'))
+        if open_until == 0:
+            # "hasta medianoche" es el final del día
+            open_until = 24 * 60
+        if open_from is not None and open_until is not None:
+            result = self.open_during(weekday, open_from, open_until)
+        elif open_from is not None:
+            result = self.open_at(weekday, open_from)
+        elif open_until is not None:
+            result = self.open_at(weekday, open_until - SLOT_MINUTES)
+
+        typical_hours = (filters.get('meal_time') or {}).get('typical_hours')
+        if typical_hours:
+            meal_from = to_minutes(typical_hours.get('from'))
+            meal_to = to_minutes(typical_hours.get('to'))
+            if meal_from is not None and meal_to is not None:
+                serving = self.open_any(weekday, meal_from, meal_to)
+                result = serving if result is None else result & serving
+
+        return result
+
+    def _sql_open_between(self, weekday: int, start_minutes: int, end_minutes: int) -> Tuple[str, List]:
+        """
+        EXISTS sobre business_hours: algún turno (a o b) abierto en algún
+        momento de [start, end) del día. Cuenta los turnos de ese día que
+        cierran pasada la medianoche (cierre <= apertura) y los del día
+        anterior que aún siguen abiertos.
+        """
+        today = self._day(weekday)
+        yesterday = self._day((weekday - 1) % 7)
+        start, end = sql_time(start_minutes), sql_time(end_minutes)
+        conditions, params = [], []
+        for opens, closes in (('bh.open_a', 'bh.close_a'), ('bh.open_b', 'bh.close_b')):
+            conditions.append(
+                f"(bh.day = %s AND {opens} < %s AND ({closes} > %s OR {closes} <= {opens}))"
+            )
+            params.extend([today, end, start])
+            conditions.append(f"(bh.day = %s AND {closes} <= {opens} AND {closes} > %s)")
+            params.extend([yesterday, start])
+        clause = (
+            "EXISTS (SELECT 1 FROM business_hours bh WHERE bh.business_id = b.id AND ("
+            + " OR ".join(conditions) + "))"
+        )
+        return clause, params
+
+    def sql_conditions(self, filters: Optional[Dict], weekday: Optional[int] = None) -> List[Tuple[str, List]]:
+        """
+        Condiciones SQL para los filtros 'time' y 'meal_time' cuando el índice
+        no está cargado, con la misma semántica que matching(): día de hoy,
+        los dos turnos y los cierres después de medianoche.
+
+        Es una aproximación en dos puntos: trabaja al minuto en lugar de por
+        franjas de 15 minutos, y open_from + open_until exige estar abierto al
+        principio y al final de la franja, no necesariamente en el mismo turno.
+        """
+        filters = filters or {}
+        if weekday is None:
+            weekday = self.today()
+
+        conditions = []
+        time_info = filters.get('time') or {}
+        open_from = to_minutes(time_info.get('open_from'))
+        open_until = to_minutes(time_info.get('open_until'))
+        if open_until == 0:
+            open_until = 24 * 60
+        if open_from is not None:
+            conditions.append(self._sql_open_between(weekday, open_from, open_from + 1))
+        if open_until is not None:
+            last_slot = open_until - SLOT_MINUTES
+            conditions.append(self._sql_open_between(weekday, last_slot, last_slot + 1))
+
+        typical_hours = (filters.get('meal_time') or {}).get('typical_hours')
+        if typical_hours:
+            meal_from = to_minutes(typical_hours.get('from'))
+            meal_to = to_minutes(typical_hours.get('to'))
+            if meal_from is not None and meal_to is not None:
+                if meal_to <= meal_from:
+                    meal_to += 24 * 60
+                conditions.append(self._sql_open_between(weekday, meal_from, meal_to))
+
+        return conditions
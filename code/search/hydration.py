@@ -0,0 +1,341 @@
+from typing import Dict, Iterable, Iterator, List, Optional
+import datetime
+import logging
+import os
+import mysql.connector
+from .db_pool import get_pool, is_disconnect
+from .snapshot import get_snapshot
+from .stages import stage
+
+DEFAULT_CATEGORY_IMAGE_PATH = "https://foodly.s3.amazonaws.com/public/categories_images/default.jpg"
+
+# Tamaño de lote de la hidratación en streaming
+HYDRATION_BATCH_SIZE = int(os.environ.get('HYDRATION_BATCH_SIZE', 50))
+
+
+def _placeholders(values: List) -> str:
+    """Genera la lista de placeholders para una cláusula IN (...)"""
+    return ', '.join(['%s'] * len(values))
+
+
+def _format_hour(value):
+    """Formatea una hora de business_hours como HH:MM si es un objeto time"""
+    return value.strftime('%H:%M') if isinstance(value, datetime.time) else value
+
+
+def parse_service_ids(raw_service_ids) -> List[int]:
+    """
+    Convierte el GROUP_CONCAT de service_ids ("1,4,7") en una lista de enteros
+    """
+    if not raw_service_ids:
+        return []
+    try:
+        return [int(id.strip()) for id in str(raw_service_ids).split(',') if id.strip()]
+    except ValueError as e:
+        print(f"Error procesando service_ids: {e}")
+        return []
+
+
+def fetch_services(cursor, service_ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    Obtiene los servicios de todos los negocios de la página en una sola consulta
+    """
+    ids = sorted(set(service_ids))
+    if not ids:
+        return {}
+
+    cursor.execute(
+        f"SELECT id, service_uuid, service_name FROM services WHERE id IN ({_placeholders(ids)})",
+        ids
+    )
+    return {service['id']: service for service in cursor.fetchall()}
+
+
+def fetch_categories(cursor, category_ids: Iterable[int]) -> Dict[int, Dict]:
+    """
+    Obtiene las categorías de todos los negocios de la página en una sola consulta
+    """
+    ids = sorted({id for id in category_ids if id is not None})
+    if not ids:
+        return {}
+
+    cursor.execute(
+        f"""
+        SELECT id, category_uuid, category_name
+        FROM categories
+        WHERE id IN ({_placeholders(ids)})
+        """,
+        ids
+    )
+    categories = {}
+    for category in cursor.fetchall():
+        #Añadir subcategorias vacias y la imagen por defecto como en el ejemplo
+        category['subcategories'] = []
+        category['category_image_path'] = DEFAULT_CATEGORY_IMAGE_PATH
+        categories[category['id']] = category
+    return categories
+
+
+def fetch_hours(cursor, business_ids: List[int]) -> Dict[int, Dict]:
+    """
+    Obtiene los horarios de apertura y cierre de todos los negocios de la página
+    """
+    if not business_ids:
+        return {}
+
+    cursor.execute(
+        f"""
+        SELECT business_id,
+               day,
+               open_a,
+               close_a,
+               open_b,
+               close_b
+        FROM business_hours
+        WHERE business_id IN ({_placeholders(business_ids)})
+        """,
+        business_ids
+    )
+    rows = cursor.fetchall()
+
+    hours_by_business = {business_id: {} for business_id in business_ids}
+    for hour in rows:
+        day_data = {}
+        for field in ('open_a', 'close_a', 'open_b', 'close_b'):
+            if hour[field]:
+                day_data[field] = _format_hour(hour[field])
+
+        formatted_hours = hours_by_business.setdefault(hour['business_id'], {})
+        formatted_hours[f'day_{hour["day"]}'] = day_data
+
+    #Asegurarse de que todos los dias esten presentes
+    for formatted_hours in hours_by_business.values():
+        for i in range(7):
+            formatted_hours.setdefault(f'day_{i}', {})
+
+    return hours_by_business
+
+
+def fetch_menus(cursor, business_uuids: Dict[int, Optional[str]]) -> Dict[int, List[Dict]]:
+    """
+    Obtiene los menús de todos los negocios de la página.
+    El business_uuid ya viene en la fila de búsqueda, no hace falta consultarlo.
+    """
+    business_ids = list(business_uuids.keys())
+    if not business_ids:
+        return {}
+
+    cursor.execute(
+        f"""
+        SELECT id, uuid, business_id
+        FROM business_menus
+        WHERE business_id IN ({_placeholders(business_ids)})
+        """,
+        business_ids
+    )
+    rows = cursor.fetchall()
+
+    menus_by_business = {business_id: [] for business_id in business_ids}
+    for menu in rows:
+        menus_by_business.setdefault(menu['business_id'], []).append({
+            'id': menu['id'],
+            'uuid': menu['uuid'],
+            'business_uuid': business_uuids.get(menu['business_id']),
+        })
+    return menus_by_business
+
+
+def fetch_cover_images(cursor, business_ids: List[int]) -> Dict[int, List[Dict]]:
+    """
+    Obtiene las imágenes de portada de todos los negocios de la página
+    """
+    if not business_ids:
+        return {}
+
+    cursor.execute(
+        f"""
+        SELECT business_id, id, business_image_uuid, business_image_path
+        FROM business_cover_images
+        WHERE business_id IN ({_placeholders(business_ids)})
+        """,
+        business_ids
+    )
+    rows = cursor.fetchall()
+
+    images_by_business = {business_id: [] for business_id in business_ids}
+    for image in rows:
+        business_id = image.pop('business_id')
+        images_by_business.setdefault(business_id, []).append(image)
+    return images_by_business
+
+
+def build_business_data(
+    business: Dict,
+    services: Dict[int, Dict],
+    categories: Dict[int, Dict],
+    hours: Dict[int, Dict],
+    menus: Dict[int, List[Dict]],
+    cover_images: Dict[int, List[Dict]]
+) -> Dict:
+    """
+    Crea la estructura del negocio según el formato esperado por Laravel
+    """
+    business_services = []
+    for service_id in parse_service_ids(business.get('service_ids')):
+        service = services.get(service_id)
+        if service:
+            business_services.append({
+                "id": service['id'],
+                "service_uuid": service.get('service_uuid', f"service-{service['id']}"),
+                "service_name": service.get('service_name', f"Service {service['id']}")
+            })
+
+    business_data = {
+        'id': business['id'],
+        'user_id': business.get('user_id', 1),
+        'business_uuid': business.get('business_uuid', f"business-{business['id']}"),
+        'business_logo': business.get('business_logo', ''),
+        'business_name': business['name'],
+        'business_email': business.get('email', ''),
+        'business_phone': business.get('phone', ''),
+        'business_about_us': business.get('business_about_us', ''),
+        'business_services': business_services,
+        'business_additional_info': business.get('business_additional_info', ''),
+        'business_address': business.get('address', ''),
+        'business_zipcode': business.get('business_zipcode', ''),
+        'business_city': business.get('business_city', ''),
+        'business_country': business.get('business_country', ''),
+        'business_website': business.get('business_website', ''),
+        'business_latitude': business.get('latitude', 0),
+        'business_longitude': business.get('longitude', 0),
+        'business_menus': menus.get(business['id'], []),
+        'category_id': business.get('category_id', 0),
+        'category': categories.get(business.get('category_id')) or {},
+        'business_opening_hours': hours.get(business['id'], {}),
+        'cover_images': cover_images.get(business['id']) or [],
+        'business_promotions': [],
+        'business_branches': []
+    }
+
+    return apply_search_fields(business_data, business)
+
+
+def apply_search_fields(business_data: Dict, business: Dict) -> Dict:
+    """Campos que dependen de la búsqueda: distancia y relevancia"""
+    if 'distance_km' in business:
+        business_data['distance'] = round(business['distance_km'], 2)
+    elif 'distance' in business:
+        business_data['distance'] = round(business['distance'], 2)
+    else:
+        business_data['distance'] = 0.0
+
+    if 'relevance' in business:
+        business_data['score'] = float(business['relevance'])
+    else:
+        business_data['score'] = 1.0
+
+    return business_data
+
+
+def hydrate_businesses(businesses: List[Dict], db_config: Dict) -> List[Dict]:
+    """
+    Hidrata una página completa de resultados de búsqueda.
+    Usa una única conexión y una consulta IN (...) por tabla, de modo que el
+    número de consultas depende del número de tablas y no del de negocios.
+    """
+    if not businesses:
+        return []
+    return _hydrate_batch(businesses, get_pool(db_config))
+
+
+def iter_hydrated_businesses(
+    businesses: List[Dict],
+    db_config: Dict,
+    batch_size: Optional[int] = None
+) -> Iterator[Dict]:
+    """
+    Hidrata los resultados por lotes y va devolviendo cada negocio en cuanto
+    su lote está listo (para respuestas en streaming). La conexión solo se
+    retiene mientras se consulta cada lote, no mientras el cliente lee.
+    """
+    batch_size = batch_size or HYDRATION_BATCH_SIZE
+    pool = get_pool(db_config)
+    for start in range(0, len(businesses), batch_size):
+        for business in _hydrate_batch(businesses[start:start + batch_size], pool):
+            yield business
+
+
+def _hydrate_batch(businesses: List[Dict], pool) -> List[Dict]:
+    """
+    Hidrata un lote de negocios. Con snapshot de documentos (BUSINESS_SNAPSHOT_DIR)
+    cada negocio es una lectura por id sin tráfico a la base de datos; solo
+    los que no estén en el snapshot se hidratan desde MySQL.
+    """
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return _hydrate_from_db(businesses, pool)
+
+    with stage('hydrate.snapshot'):
+        documents = snapshot.get_many(business['id'] for business in businesses)
+    missing = [business for business in businesses if business['id'] not in documents]
+    from_db = {business['id']: business for business in _hydrate_from_db(missing, pool)} if missing else {}
+
+    hydrated = []
+    for business in businesses:
+        document = documents.get(business['id'])
+        if document is not None:
+            hydrated.append(apply_search_fields(document, business))
+        elif business['id'] in from_db:
+            hydrated.append(from_db[business['id']])
+    return hydrated
+
+
+def _hydrate_from_db(businesses: List[Dict], pool) -> List[Dict]:
+    """
+    Hidrata un lote de negocios con una consulta IN (...) por tabla. Los
+    fetch_* no capturan los errores de la base de datos: aquí se registran,
+    la página se devuelve sin los datos relacionados y la conexión se
+    descarta si quedó inservible.
+    """
+    business_ids = [business['id'] for business in businesses]
+    service_ids = set()
+    for business in businesses:
+        service_ids.update(parse_service_ids(business.get('service_ids')))
+
+    conn = cursor = None
+    discard = False
+    try:
+        with stage('db_acquire'):
+            conn = pool.acquire()
+        cursor = conn.cursor(dictionary=True)
+
+        # Cada subconsulta es una etapa propia en Server-Timing y /metrics
+        with stage('hydrate.services'):
+            services = fetch_services(cursor, service_ids)
+        with stage('hydrate.categories'):
+            categories = fetch_categories(cursor, [business.get('category_id') for business in businesses])
+        with stage('hydrate.hours'):
+            hours = fetch_hours(cursor, business_ids)
+        with stage('hydrate.menus'):
+            menus = fetch_menus(cursor, {business['id']: business.get('business_uuid') for business in businesses})
+        with stage('hydrate.cover_images'):
+            cover_images = fetch_cover_images(cursor, business_ids)
+    except mysql.connector.Error as e:
+        logging.error(f"Error de base de datos hidratando negocios: {e}")
+        services, categories, hours, menus, cover_images = {}, {}, {}, {}, {}
+        discard = is_disconnect(e)
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            pool.release(conn, discard=discard)
+
+    hydrated = []
+    for business in businesses:
+        try:
+            hydrated.append(build_business_data(business, services, categories, hours, menus, cover_images))
+        except Exception as e:
+            print(f'Error procesando negocio {business.get("id", "unknown")}: {e}')
+            logging.error(f"Error procesando negocio {business.get('id', 'unknown')}: {e}")
+
+    return hydrated
@@ -0,0 +1,80 @@
+from typing import Any, Dict, Iterable, List, Tuple
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Autómata de Aho-Corasick sobre secuencias de tokens.
+
+    El alfabeto son tokens completos (no caracteres), así que las
+    coincidencias respetan siempre los límites de palabra: "in" no encaja
+    dentro de "drinks" ni "tea" dentro de "steak". Se compila una vez y
+    encuentra todas las frases clave en una sola pasada sobre los tokens.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._keywords: List[List[Tuple[int, Any]]] = [[]]
+        self._output: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def add(self, phrase: Iterable[str], payload: Any):
+        """Añade una frase (lista de tokens) con el payload a devolver al encontrarla"""
+        tokens = list(phrase)
+        if not tokens:
+            return
+
+        node = 0
+        for token in tokens:
+            next_node = self._goto[node].get(token)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][token] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._keywords.append([])
+                self._output.append([])
+            node = next_node
+        self._keywords[node].append((len(tokens), payload))
+        self._built = False
+
+    def build(self):
+        """Calcula los enlaces de fallo (BFS) y propaga las salidas"""
+        queue = deque()
+        for node in self._goto[0].values():
+            self._fail[node] = 0
+            self._output[node] = list(self._keywords[node])
+            queue.append(node)
+
+        while queue:
+            node = queue.popleft()
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(token, 0)
+                self._output[child] = self._keywords[child] + self._output[self._fail[child]]
+
+        self._built = True
+
+    def find_all(self, tokens: List[str]) -> List[Tuple[int, int, Any]]:
+        """
+        Devuelve todas las coincidencias como (inicio, fin, payload), con fin
+        exclusivo, ordenadas por posición
+        """
+        if not self._built:
+            self.build()
+
+        matches = []
+        node = 0
+        for position, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for length, payload in self._output[node]:
+                matches.append((position + 1 - length, position + 1, payload))
+
+        matches.sort(key=lambda match: (match[0], match[1]))
+        return matches
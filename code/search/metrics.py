@@ -0,0 +1,319 @@
+"""
+Métricas de la API en el formato de texto de Prometheus (GET /metrics):
+histogramas de latencia por etapa de /search, peticiones HTTP por endpoint
+y estado, y origen de cada búsqueda (caché, coalescida o calculada).
+
+Con gunicorn cada worker es un proceso con sus propios contadores: con
+METRICS_MULTIPROC_DIR cada uno vuelca los suyos a un fichero de ese
+directorio y /metrics (lo atienda el worker que lo atienda) suma todos.
+El directorio debe vaciarse al desplegar, como el de prometheus_client.
+
+    METRICS_ENABLED=True
+    METRICS_MULTIPROC_DIR=/tmp/foodly-metrics
+    METRICS_FLUSH_SECONDS=5
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import threading
+import logging
+import bisect
+import atexit
+import json
+import glob
+import time
+import os
+
+# Límites (segundos) de las cubetas de latencia: de 0,5 ms a 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Contador monótono con etiquetas"""
+    kind = 'counter'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        self.registry.touch()
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = [[list(key), value] for key, value in self._values.items()]
+        return {'type': self.kind, 'help': self.help, 'labelnames': list(self.labelnames), 'samples': samples}
+
+
+class Histogram:
+    """
+    Histograma de cubetas fijas (acumuladas al exportar, como espera
+    Prometheus). observe() es una búsqueda binaria y una suma bajo lock.
+    """
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        registry: 'MetricsRegistry',
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Por etiquetas: [muestras por cubeta (+Inf al final), suma]
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+        self.registry.touch()
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            samples = [[list(key), {'counts': list(counts), 'sum': total}] for key, (counts, total) in self._values.items()]
+        return {
+            'type': self.kind,
+            'help': self.help,
+            'labelnames': list(self.labelnames),
+            'buckets': list(self.buckets),
+            'samples': samples
+        }
+
+
+class MetricsRegistry:
+    """
+    Registro de métricas del proceso. Con multiproc_dir un hilo daemon
+    vuelca la instantánea del proceso a metrics-<pid>.json cada
+    flush_interval segundos (y al salir); collect() suma las de todos los
+    ficheros. Tras un fork el hijo empieza con los contadores a cero para no
+    contar dos veces lo que registró el padre.
+    """
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: Optional[float] = None):
+        self.enabled = metrics_enabled()
+        self.multiproc_dir = multiproc_dir if multiproc_dir is not None else os.environ.get('METRICS_MULTIPROC_DIR')
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+        )
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = self._metrics[name] = Counter(self, name, help, labelnames)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        metric = self._metrics[name] = Histogram(self, name, help, labelnames, buckets)
+        return metric
+
+    def touch(self):
+        """Arranca el volcado a disco del proceso con la primera métrica registrada"""
+        if self.multiproc_dir and self._thread is None:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+            metric.reset()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.multiproc_dir, f"metrics-{pid}.json")
+
+    def flush(self):
+        """Escribe la instantánea del proceso (escritura atómica con rename)"""
+        if not self.multiproc_dir or self._pid != os.getpid():
+            return
+        path = self._path(self._pid)
+        try:
+            with open(path + '.tmp', 'w') as snapshot_file:
+                json.dump(self.snapshot(), snapshot_file)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            logging.error(f"Error volcando métricas a {path}: {e}")
+
+    def collect(self) -> Dict[str, Dict]:
+        """Métricas del proceso o, en modo multiproceso, la suma de todos los workers"""
+        if not self.multiproc_dir:
+            return self.snapshot()
+
+        self.flush()
+        merged: Dict[str, Dict] = {}
+        for path in sorted(glob.glob(os.path.join(self.multiproc_dir, 'metrics-*.json'))):
+            try:
+                with open(path) as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+            except Exception as e:
+                logging.warning(f"Instantánea de métricas ilegible {path}: {e}")
+                continue
+            for name, metric in snapshot.items():
+                self._merge(merged, name, metric)
+        # Métricas aún sin muestras en ningún worker
+        for name, metric in self.snapshot().items():
+            merged.setdefault(name, dict(metric, samples=[]))
+        for metric in merged.values():
+            metric.pop('_index', None)
+        return merged
+
+    @staticmethod
+    def _merge(merged: Dict[str, Dict], name: str, metric: Dict):
+        target = merged.get(name)
+        if target is None:
+            target = merged[name] = dict(metric, samples=[], _index={})
+        index = target['_index']
+        for labels, value in metric['samples']:
+            key = tuple(labels)
+            if key not in index:
+                index[key] = len(target['samples'])
+                target['samples'].append([labels, value])
+                continue
+            current = target['samples'][index[key]]
+            if metric['type'] == 'histogram':
+                current[1]['counts'] = [a + b for a, b in zip(current[1]['counts'], value['counts'])]
+                current[1]['sum'] += value['sum']
+            else:
+                current[1] += value
+
+    def render(self) -> str:
+        """Exposición en formato de texto de Prometheus"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            labelnames = metric['labelnames']
+            for labels, value in sorted(metric['samples'], key=lambda sample: sample[0]):
+                if metric['type'] != 'histogram':
+                    lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(metric['buckets']) + ['+Inf'], value['counts']):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {repr(float(value['sum']))}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+SEARCH_STAGE_SECONDS = REGISTRY.histogram(
+    'foodly_search_stage_duration_seconds',
+    'Tiempo por etapa de /search (parse, city, index, sql_build, sql_execute, fetch, hydrate.*, serialize, total)',
+    ('stage',)
+)
+SEARCHES = REGISTRY.counter(
+    'foodly_search_requests_total',
+    'Búsquedas del motor por origen del resultado (cache, coalesced, computed, error)',
+    ('source',)
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    'foodly_http_requests_total',
+    'Peticiones HTTP por endpoint, método y código de estado',
+    ('endpoint', 'method', 'status')
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    'foodly_http_request_duration_seconds',
+    'Latencia de las peticiones HTTP por endpoint (sin el envío de respuestas en streaming)',
+    ('endpoint',)
+)
+
+
+def observe_stages(timer):
+    """Vuelca al histograma de etapas los tiempos de una petición (StageTimer)"""
+    if timer is None or not REGISTRY.enabled:
+        return
+    for name, elapsed_ms in timer.stages.items():
+        SEARCH_STAGE_SECONDS.observe(elapsed_ms / 1000.0, stage=name)
+    SEARCH_STAGE_SECONDS.observe(timer.total_ms() / 1000.0, stage='total')
+
+
+def observe_request(endpoint: str, method: str, status: int, started: float):
+    """Cuenta una petición HTTP y su latencia desde started (time.perf_counter())"""
+    if not REGISTRY.enabled:
+        return
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+    HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+
+def count_search(source: str):
+    if REGISTRY.enabled:
+        SEARCHES.inc(source=source)
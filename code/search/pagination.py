@@ -0,0 +1,60 @@
+from typing import Dict, Optional
+import base64
+import json
+
+# Modos de cursor según el orden de la búsqueda:
+# - rank: (relevancia DESC, distancia ASC, id ASC)
+# - name: (business_name ASC, id ASC)
+# - offset: orden calculado en MySQL sin clave estable (fallback sin índices)
+CURSOR_MODES = ('rank', 'name', 'offset')
+
+
+class InvalidCursorError(ValueError):
+    """Cursor mal formado o de otra búsqueda"""
+
+
+def encode_cursor(mode: str, key: Optional[list] = None, offset: Optional[int] = None,
+                  total: Optional[int] = None, page: Optional[int] = None) -> str:
+    """Codifica la posición de la siguiente página como un token opaco"""
+    payload = {'m': mode}
+    if key is not None:
+        payload['k'] = key
+    if offset is not None:
+        payload['o'] = offset
+    if total is not None:
+        payload['t'] = total
+    if page is not None:
+        payload['p'] = page
+    raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Dict]:
+    """Decodifica un cursor de encode_cursor (None si no hay cursor)"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"Cursor inválido: {e}")
+
+    if not isinstance(payload, dict) or payload.get('m') not in CURSOR_MODES:
+        raise InvalidCursorError("Cursor inválido")
+    if payload['m'] == 'offset' and not isinstance(payload.get('o'), int):
+        raise InvalidCursorError("Cursor inválido")
+    key_length = {'rank': 3, 'name': 2}.get(payload['m'])
+    if key_length and (not isinstance(payload.get('k'), list) or len(payload['k']) != key_length):
+        raise InvalidCursorError("Cursor inválido")
+    return payload
+
+
+def rank_key(relevance: float, distance: float, business_id: int) -> tuple:
+    """Clave de orden ascendente equivalente a (relevancia DESC, distancia ASC, id ASC)"""
+    return (-relevance, distance, business_id)
+
+
+def cursor_rank_key(cursor: Dict) -> tuple:
+    """Clave de orden del último elemento devuelto según el cursor"""
+    relevance, distance, business_id = cursor['k']
+    return rank_key(float(relevance), float(distance), int(business_id))
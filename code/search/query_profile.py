@@ -0,0 +1,464 @@
+"""
+Perfil de consultas por forma. Cada consulta de las conexiones del pool se
+agrupa por su huella (tracing.fingerprint: la SQL sin valores y con las
+listas IN/FIELD colapsadas), de modo que las combinaciones de fragmentos
+opcionales de search_businesses (ciudad, distancia, MATCH AGAINST, EXISTS
+sobre business_hours/business_service...) son formas distintas con su
+propia latencia.
+
+La primera vez que una ejecución de una forma SELECT supera QUERY_SLOW_MS
+se ejecuta EXPLAIN FORMAT=JSON con esa misma consulta en segundo plano y se
+guarda el plan junto con pistas de índices que faltan (scans completos,
+subconsultas dependientes, filesort, tablas temporales).
+
+Es opt-in (QUERY_PROFILE_ENABLED=true): envuelve todas las conexiones del
+pool y lanza EXPLAIN contra la base de datos real.
+
+Informe: GET /debug/queries (con DIAGNOSTICS_ENABLED=true) o, con
+QUERY_PROFILE_DIR (un fichero por worker),
+    python -m code.search.query_profile --dir /tmp/foodly-query-profile
+    python -m code.search.query_profile --url http://localhost:8000 --plans
+
+    QUERY_PROFILE_ENABLED=True
+    QUERY_SLOW_MS=200
+    QUERY_PROFILE_MAX_SHAPES=500
+    QUERY_PROFILE_DIR=/tmp/foodly-query-profile
+    QUERY_PROFILE_FLUSH_SECONDS=30
+"""
+from typing import Dict, List, Optional
+import threading
+import argparse
+import datetime
+import logging
+import atexit
+import queue
+import json
+import glob
+import sys
+import re
+import os
+
+from .sketches import TDigest
+from .tracing import add_statement_observer, statement_name
+
+SORT_KEYS = ('total', 'p95', 'max', 'mean', 'count', 'slow')
+
+# Tablas pequeñas (menos filas por scan) no merecen pista de índice
+MIN_SCAN_ROWS = int(os.environ.get('QUERY_PROFILE_MIN_SCAN_ROWS', 1000))
+
+
+def query_profile_enabled() -> bool:
+    return os.environ.get('QUERY_PROFILE_ENABLED', 'False').lower() == 'true'
+
+
+def _condition_columns(condition: str, table: str) -> List[str]:
+    """Columnas de la tabla (alias) usadas en la condición, primero las de igualdad"""
+    columns = re.findall(rf'`{re.escape(table)}`\.`(\w+)`\s*(=|<=|>=|<|>|like|in|between)?', condition or '', re.IGNORECASE)
+    equality = [column for column, operator in columns if operator == '=']
+    others = [column for column, operator in columns if operator != '=']
+    ordered = []
+    for column in equality + others:
+        if column not in ordered:
+            ordered.append(column)
+    return ordered
+
+
+def index_hints(plan: Dict) -> List[str]:
+    """
+    Pistas a partir de un plan de EXPLAIN FORMAT=JSON de MySQL. Son
+    heurísticas: señalan dónde mirar, no qué índice crear sin más.
+    """
+    hints: List[str] = []
+
+    def add(hint: str):
+        if hint not in hints:
+            hints.append(hint)
+
+    def walk(node, dependent: bool = False):
+        if isinstance(node, list):
+            for item in node:
+                walk(item, dependent)
+            return
+        if not isinstance(node, dict):
+            return
+
+        table = node.get('table')
+        if isinstance(table, dict):
+            name = table.get('table_name', '?')
+            access = table.get('access_type')
+            rows = table.get('rows_examined_per_scan') or 0
+            columns = _condition_columns(table.get('attached_condition', ''), name)
+            suggestion = f"; considerar INDEX ({', '.join(columns)})" if columns else ''
+            if access == 'ALL' and (rows >= MIN_SCAN_ROWS or dependent):
+                scope = " por cada fila de la consulta exterior" if dependent else ''
+                possible = f"; possible_keys {table['possible_keys']} sin usar" if table.get('possible_keys') else ''
+                add(f"{name}: scan completo de ~{rows} filas{scope}{possible}{suggestion}")
+            elif access == 'index' and rows >= MIN_SCAN_ROWS:
+                add(f"{name}: recorrido completo del índice {table.get('key')} (~{rows} filas){suggestion}")
+            elif table.get('key') is None and table.get('possible_keys'):
+                add(f"{name}: no se usa ninguno de {table['possible_keys']}{suggestion}")
+            if table.get('using_join_buffer'):
+                add(f"{name}: join sin índice (join buffer {table['using_join_buffer']}){suggestion}")
+
+        if node.get('using_filesort'):
+            add("ORDER BY con filesort")
+        if node.get('using_temporary_table'):
+            add("tabla temporal para GROUP BY/DISTINCT")
+
+        for key, value in node.items():
+            if key == 'table':
+                continue
+            if isinstance(value, list) and key.endswith('subqueries'):
+                for subquery in value:
+                    is_dependent = bool(isinstance(subquery, dict) and subquery.get('dependent'))
+                    if is_dependent and isinstance(subquery, dict) and not subquery.get('cacheable', True):
+                        add("subconsulta dependiente (EXISTS/escalar) evaluada por fila")
+                    walk(subquery, dependent or is_dependent)
+            elif isinstance(value, (dict, list)):
+                walk(value, dependent)
+
+    walk(plan)
+    return hints
+
+
+class ShapeProfile:
+    """Latencias de una forma de consulta y, si fue lenta, su plan"""
+
+    def __init__(self, shape: str):
+        self.shape = shape
+        self.name = statement_name(shape)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.latency = TDigest()
+        self.first_seen = datetime.datetime.now().isoformat(timespec='seconds')
+        self.last_seen = self.first_seen
+        self.plan: Optional[Dict] = None
+        self.hints: List[str] = []
+        self.explained_at: Optional[str] = None
+        self.explain_error: Optional[str] = None
+
+    def add(self, elapsed_ms: float, slow: bool):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.slow += 1 if slow else 0
+        self.latency.add(elapsed_ms)
+
+    def merge(self, other: 'ShapeProfile'):
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.slow += other.slow
+        self.latency.merge(other.latency)
+        self.first_seen = min(self.first_seen, other.first_seen)
+        self.last_seen = max(self.last_seen, other.last_seen)
+        if self.plan is None and other.plan is not None:
+            self.plan, self.hints, self.explained_at = other.plan, other.hints, other.explained_at
+        if self.plan is None and self.explain_error is None:
+            self.explain_error = other.explain_error
+
+    def summary(self, include_plan: bool = False) -> Dict:
+        result = {
+            'shape': self.shape,
+            'name': self.name,
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.latency.quantile(0.5) or 0.0, 3),
+            'p95_ms': round(self.latency.quantile(0.95) or 0.0, 3),
+            'p99_ms': round(self.latency.quantile(0.99) or 0.0, 3),
+            'max_ms': round(self.max_ms, 3),
+            'slow': self.slow,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'explained': self.plan is not None,
+            'hints': self.hints
+        }
+        if self.explain_error:
+            result['explain_error'] = self.explain_error
+        if include_plan:
+            result['plan'] = self.plan
+        return result
+
+    def to_dict(self) -> Dict:
+        return {
+            'shape': self.shape,
+            'count': self.count,
+            'total_ms': self.total_ms,
+            'max_ms': self.max_ms,
+            'slow': self.slow,
+            'latency': self.latency.to_dict(),
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'plan': self.plan,
+            'hints': self.hints,
+            'explained_at': self.explained_at,
+            'explain_error': self.explain_error
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ShapeProfile':
+        profile = cls(data['shape'])
+        profile.count = data['count']
+        profile.total_ms = data['total_ms']
+        profile.max_ms = data['max_ms']
+        profile.slow = data['slow']
+        profile.latency = TDigest.from_dict(data['latency'])
+        profile.first_seen = data['first_seen']
+        profile.last_seen = data['last_seen']
+        profile.plan = data.get('plan')
+        profile.hints = data.get('hints') or []
+        profile.explained_at = data.get('explained_at')
+        profile.explain_error = data.get('explain_error')
+        return profile
+
+
+def _sort_value(summary: Dict, sort: str) -> float:
+    return summary['slow'] if sort == 'slow' else summary['count'] if sort == 'count' else summary[f"{sort}_ms"]
+
+
+def top_shapes(profiles: List[ShapeProfile], limit: int = 20, sort: str = 'total', include_plan: bool = False) -> List[Dict]:
+    """Formas ordenadas de peor a mejor según sort (total, p95, max, mean, count, slow)"""
+    summaries = [profile.summary(include_plan) for profile in profiles]
+    summaries.sort(key=lambda summary: -_sort_value(summary, sort))
+    return summaries[:limit] if limit else summaries
+
+
+class QueryProfiler:
+    """
+    Observador de todas las consultas del pool (ver tracing.add_statement_observer).
+    observe() solo actualiza contadores bajo un lock; el EXPLAIN de una forma
+    lenta lo ejecuta un hilo daemon con su propia conexión del pool, una sola
+    vez por forma y proceso.
+    """
+
+    def __init__(
+        self,
+        slow_ms: Optional[float] = None,
+        max_shapes: Optional[int] = None,
+        directory: Optional[str] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self.enabled = query_profile_enabled()
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.environ.get('QUERY_SLOW_MS', 200))
+        self.max_shapes = max_shapes or int(os.environ.get('QUERY_PROFILE_MAX_SHAPES', 500))
+        self.directory = directory if directory is not None else os.environ.get('QUERY_PROFILE_DIR')
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else float(os.environ.get('QUERY_PROFILE_FLUSH_SECONDS', 30))
+        )
+        self.pool = None
+
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, ShapeProfile] = {}
+        self._explain_requested = set()
+        self._explain_queue: queue.Queue = queue.Queue(maxsize=100)
+        self._thread = None
+        self._pid = None
+
+        self.untracked = 0
+        self.explain_dropped = 0
+
+        if self.enabled:
+            add_statement_observer(self.observe)
+
+    def attach(self, pool):
+        """Pool con el que se ejecutan los EXPLAIN"""
+        self.pool = pool
+
+    def _ensure_started(self):
+        """Arranca el hilo de EXPLAIN y volcado (una vez por proceso, también tras un fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Proceso hijo: empieza con su propio perfil
+                self._shapes = {}
+                self._explain_requested = set()
+                self._explain_queue = queue.Queue(maxsize=100)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='query-profiler', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def observe(self, shape: str, sql: str, params, elapsed_ms: float):
+        if shape.startswith('EXPLAIN'):
+            return
+        self._ensure_started()
+        slow = elapsed_ms >= self.slow_ms
+        with self._lock:
+            profile = self._shapes.get(shape)
+            if profile is None:
+                if len(self._shapes) >= self.max_shapes:
+                    self.untracked += 1
+                    return
+                profile = self._shapes[shape] = ShapeProfile(shape)
+            profile.add(elapsed_ms, slow)
+            profile.last_seen = datetime.datetime.now().isoformat(timespec='seconds')
+            explain = (
+                slow and shape.upper().startswith('SELECT') and self.pool is not None
+                and shape not in self._explain_requested
+            )
+            if explain:
+                self._explain_requested.add(shape)
+        if explain:
+            try:
+                self._explain_queue.put_nowait((shape, sql, params))
+            except queue.Full:
+                self.explain_dropped += 1
+                with self._lock:
+                    self._explain_requested.discard(shape)
+
+    def _run(self):
+        while True:
+            try:
+                shape, sql, params = self._explain_queue.get(timeout=self.flush_interval)
+                self._explain(shape, sql, params)
+            except queue.Empty:
+                self.flush()
+
+    def _explain(self, shape: str, sql: str, params):
+        """EXPLAIN FORMAT=JSON de la consulta lenta con sus mismos parámetros"""
+        plan, error = None, None
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("EXPLAIN FORMAT=JSON " + sql, params)
+                row = cursor.fetchone()
+                cursor.close()
+            plan = json.loads(row[0]) if row else None
+        except Exception as e:
+            error = str(e)
+            logging.warning(f"Error en EXPLAIN de la consulta lenta {statement_name(shape)}: {e}")
+
+        with self._lock:
+            profile = self._shapes.get(shape)
+            if profile is None:
+                return
+            profile.plan = plan
+            profile.explain_error = error
+            profile.hints = index_hints(plan) if plan else []
+            profile.explained_at = datetime.datetime.now().isoformat(timespec='seconds')
+        if plan is not None:
+            logging.warning(
+                f"Consulta lenta {profile.name} ({profile.max_ms:.0f}ms): "
+                f"{'; '.join(profile.hints) or 'sin pistas de índice'}"
+            )
+
+    def profiles(self) -> List[ShapeProfile]:
+        with self._lock:
+            return [ShapeProfile.from_dict(profile.to_dict()) for profile in self._shapes.values()]
+
+    def flush(self):
+        """Vuelca el perfil del proceso a QUERY_PROFILE_DIR/query-profile-<pid>.json"""
+        if not self.directory or self._pid != os.getpid():
+            return
+        path = os.path.join(self.directory, f"query-profile-{self._pid}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with self._lock:
+                snapshot = [profile.to_dict() for profile in self._shapes.values()]
+            with open(path + '.tmp', 'w') as profile_file:
+                json.dump(snapshot, profile_file, default=str)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            logging.error(f"Error volcando el perfil de consultas a {path}: {e}")
+
+    def collect(self) -> List[ShapeProfile]:
+        """Perfil del proceso o, con QUERY_PROFILE_DIR, el de todos los workers"""
+        if not self.directory:
+            return self.profiles()
+        self.flush()
+        return load_profiles(self.directory)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'slow_ms': self.slow_ms,
+                'shapes': len(self._shapes),
+                'explained': sum(1 for profile in self._shapes.values() if profile.plan is not None),
+                'untracked': self.untracked,
+                'explain_dropped': self.explain_dropped
+            }
+
+
+def load_profiles(directory: str) -> List[ShapeProfile]:
+    """Suma los perfiles volcados por cada worker"""
+    merged: Dict[str, ShapeProfile] = {}
+    for path in sorted(glob.glob(os.path.join(directory, 'query-profile-*.json'))):
+        try:
+            with open(path) as profile_file:
+                snapshot = json.load(profile_file)
+        except Exception as e:
+            logging.warning(f"Perfil de consultas ilegible {path}: {e}")
+            continue
+        for data in snapshot:
+            profile = ShapeProfile.from_dict(data)
+            if profile.shape in merged:
+                merged[profile.shape].merge(profile)
+            else:
+                merged[profile.shape] = profile
+    return list(merged.values())
+
+
+PROFILER = QueryProfiler()
+
+
+def _print_report(shapes: List[Dict], plans: bool):
+    if not shapes:
+        print("Sin consultas registradas")
+        return
+    print(f"{'#':>3} {'total ms':>10} {'count':>7} {'mean':>8} {'p95':>8} {'max':>8} {'slow':>5}  consulta")
+    for position, shape in enumerate(shapes, 1):
+        print(
+            f"{position:>3} {shape['total_ms']:>10.1f} {shape['count']:>7} {shape['mean_ms']:>8.2f} "
+            f"{shape['p95_ms']:>8.2f} {shape['max_ms']:>8.2f} {shape['slow']:>5}  {shape['name']}"
+        )
+        print(f"      {shape['shape'][:400]}")
+        for hint in shape['hints']:
+            print(f"      -> {hint}")
+        if shape.get('explain_error'):
+            print(f"      EXPLAIN falló: {shape['explain_error']}")
+        if plans and shape.get('plan'):
+            print('      ' + json.dumps(shape['plan'], indent=2).replace('\n', '\n      '))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Formas de consulta más costosas, sus planes y pistas de índices")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--dir', default=os.environ.get('QUERY_PROFILE_DIR'), help="directorio con los perfiles de los workers")
+    source.add_argument('--url', help="instancia en marcha (lee GET /debug/queries)")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+    parser.add_argument('--plans', action='store_true', help="muestra el plan de EXPLAIN completo")
+    parser.add_argument('--json', action='store_true', help="salida en JSON")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        import requests
+        response = requests.get(
+            args.url.rstrip('/') + '/debug/queries',
+            params={'limit': args.limit, 'sort': args.sort, 'plans': str(args.plans).lower()},
+            timeout=30
+        )
+        response.raise_for_status()
+        shapes = response.json()['queries']
+    elif args.dir:
+        shapes = top_shapes(load_profiles(args.dir), args.limit, args.sort, include_plan=args.plans)
+    else:
+        parser.error("indica --dir (o QUERY_PROFILE_DIR) o --url")
+
+    if args.json:
+        print(json.dumps(shapes, indent=2, default=str))
+    else:
+        _print_report(shapes, args.plans)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,4 +31,151 @@ HOURLY_DISTRIBUTION_QUERY = """
     WHERE created_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
     GROUP BY HOUR(created_at)
     ORDER BY hour
-"""
\ No newline at end of file
+"""
+
+BUSINESS_SEARCH_COLUMNS = """
+    b.id,
+    b.business_name as name,
+    b.business_about_us,
+    b.business_address as address,
+    b.business_email as email,
+    b.business_phone as phone,
+    b.business_latitude as latitude,
+    b.business_longitude as longitude,
+    b.user_id,
+    b.business_uuid,
+    b.business_logo,
+    b.business_additional_info,
+    b.business_zipcode,
+    b.business_city,
+    b.business_country,
+    b.business_website,
+    c.id as category_id,
+    c.category_name as category_name
+"""
+
+# Detalles de una página de negocios ya rankeada en memoria, en el orden dado
+BUSINESSES_BY_IDS_QUERY = """
+    SELECT
+        """ + BUSINESS_SEARCH_COLUMNS + """
+        , (SELECT GROUP_CONCAT(DISTINCT service_id)
+           FROM business_service
+           WHERE business_id = b.id) as service_ids
+    FROM
+        businesses b
+        LEFT JOIN categories c ON b.category_id = c.id
+    WHERE
+        b.deleted_at IS NULL
+        AND b.id IN ({placeholders})
+    ORDER BY FIELD(b.id, {placeholders})
+"""
+
+# Rollups horarios de search_logs (ver rollups.py)
+ROLLUP_TABLES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS search_stats_hourly (
+        bucket_start DATETIME NOT NULL PRIMARY KEY,
+        searches INT UNSIGNED NOT NULL DEFAULT 0,
+        zero_results INT UNSIGNED NOT NULL DEFAULT 0,
+        results_sum BIGINT UNSIGNED NOT NULL DEFAULT 0,
+        execution_time_sum BIGINT UNSIGNED NOT NULL DEFAULT 0,
+        execution_time_min INT UNSIGNED NULL,
+        execution_time_max INT UNSIGNED NULL,
+        users_sketch BLOB NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS search_stats_hourly_queries (
+        bucket_start DATETIME NOT NULL,
+        query VARCHAR(255) NOT NULL,
+        searches INT UNSIGNED NOT NULL DEFAULT 0,
+        results_sum BIGINT UNSIGNED NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket_start, query)
+    )
+    """
+]
+
+# Tablas de rollups creadas antes de users_sketch (error 1060 si ya existe la columna)
+ROLLUP_MIGRATIONS = [
+    "ALTER TABLE search_stats_hourly ADD COLUMN users_sketch BLOB NULL"
+]
+
+ROLLUP_STATS_GENERAL_QUERY = """
+    SELECT
+        COALESCE(SUM(searches), 0) as total_searches,
+        SUM(results_sum) / SUM(searches) as avg_results,
+        SUM(execution_time_sum) / SUM(searches) as avg_execution_time,
+        MIN(execution_time_min) as min_execution_time,
+        MAX(execution_time_max) as max_execution_time,
+        COALESCE(SUM(zero_results), 0) as zero_results_searches
+    FROM search_stats_hourly
+    WHERE bucket_start >= %s
+"""
+
+ROLLUP_USERS_SKETCH_QUERY = """
+    SELECT users_sketch
+    FROM search_stats_hourly
+    WHERE bucket_start >= %s AND users_sketch IS NOT NULL
+"""
+
+ROLLUP_TOP_SEARCHES_QUERY = """
+    SELECT
+        query,
+        SUM(searches) as frequency,
+        SUM(results_sum) / SUM(searches) as avg_results
+    FROM search_stats_hourly_queries
+    WHERE bucket_start >= %s
+    GROUP BY query
+    ORDER BY frequency DESC
+    LIMIT 10
+"""
+
+ROLLUP_HOURLY_DISTRIBUTION_QUERY = """
+    SELECT
+        HOUR(bucket_start) as hour,
+        SUM(searches) as searches
+    FROM search_stats_hourly
+    WHERE bucket_start >= %s
+    GROUP BY HOUR(bucket_start)
+    ORDER BY hour
+"""
+
+# Sketches de analítica por hora y worker (ver analytics.py)
+SKETCH_TABLES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS search_stats_sketches (
+        bucket_start DATETIME NOT NULL,
+        worker_id VARCHAR(128) NOT NULL,
+        payload MEDIUMTEXT NOT NULL,
+        updated_at DATETIME NOT NULL,
+        PRIMARY KEY (bucket_start, worker_id)
+    )
+    """
+]
+
+SKETCH_WINDOW_QUERY = """
+    SELECT bucket_start, worker_id, payload
+    FROM search_stats_sketches
+    WHERE bucket_start >= %s
+"""
+
+SKETCH_PURGE_QUERY = """
+    DELETE FROM search_stats_sketches
+    WHERE bucket_start < %s
+"""
+
+# Negocios para el almacén de documentos (ver snapshot.py); {where} filtra
+# los activos (carga completa) o los modificados desde la marca de agua
+SNAPSHOT_BUSINESSES_QUERY = """
+    SELECT
+        """ + BUSINESS_SEARCH_COLUMNS + """
+        , (SELECT GROUP_CONCAT(DISTINCT service_id)
+           FROM business_service
+           WHERE business_id = b.id) as service_ids
+        , b.deleted_at
+        , b.updated_at
+    FROM
+        businesses b
+        LEFT JOIN categories c ON b.category_id = c.id
+    WHERE {where}
+"""
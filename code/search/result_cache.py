@@ -0,0 +1,215 @@
+from typing import Any, Dict, Optional
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+
+try:
+    import redis
+except ImportError:  # Sin cliente Redis solo se usa la caché local
+    redis = None
+
+from .cache import LRUCache
+from .geo_index import KM_PER_DEGREE
+from .serialization import dumps, loads
+
+
+def invalidation_enabled() -> bool:
+    """POST /cache/invalidate es opt-in mediante CACHE_INVALIDATION_ENABLED=true"""
+    return os.environ.get('CACHE_INVALIDATION_ENABLED', 'False').lower() == 'true'
+
+
+def invalidation_authorized(token: Optional[str]) -> bool:
+    """
+    Comprueba el token compartido (CACHE_INVALIDATION_TOKEN) en tiempo
+    constante. Sin token configurado nadie puede invalidar.
+    """
+    expected = os.environ.get('CACHE_INVALIDATION_TOKEN')
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8'))
+
+
+class ResultCache:
+    """
+    Caché de resultados de búsqueda en dos niveles: LRU en proceso y,
+    opcionalmente, un nivel compartido en un servidor compatible con Redis
+    (RESULT_CACHE_REDIS_URL).
+
+    La clave combina la consulta normalizada, los filtros, el radio, la
+    paginación (página o cursor) y la celda de la rejilla
+    (RESULT_CACHE_CELL_KM) en la que caen las coordenadas, de modo que
+    usuarios a pocos cientos de metros comparten entrada. La invalidación incrementa una generación: las entradas de
+    generaciones anteriores se ignoran sin tener que recorrerlas. Las
+    invalidaciones hechas desde otro proceso se ven en la siguiente lectura
+    del nivel compartido (y como mucho tras el TTL del nivel local).
+
+    El nivel compartido guarda JSON (el mismo codificador que las respuestas),
+    nunca pickle: quien pueda escribir en Redis no debe poder ejecutar código.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None,
+        cell_size_km: Optional[float] = None,
+        redis_url: Optional[str] = None
+    ):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('RESULT_CACHE_TTL_SECONDS', 60))
+        self.cell_size_km = cell_size_km or float(os.environ.get('RESULT_CACHE_CELL_KM', 0.25))
+        self.cell_deg = self.cell_size_km / KM_PER_DEGREE
+        self.local = LRUCache(
+            max_size=max_size if max_size is not None else int(os.environ.get('RESULT_CACHE_SIZE', 2048)),
+            ttl=self.ttl
+        )
+
+        self.prefix = os.environ.get('RESULT_CACHE_PREFIX', 'foodly:search:')
+        self.generation = 0
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.shared_errors = 0
+        self.invalidations = 0
+
+        self.shared = None
+        redis_url = redis_url or os.environ.get('RESULT_CACHE_REDIS_URL')
+        if redis_url:
+            if redis is None:
+                logging.warning("RESULT_CACHE_REDIS_URL definido pero el paquete redis no está instalado")
+            else:
+                try:
+                    self.shared = redis.Redis.from_url(redis_url, socket_timeout=0.2)
+                except Exception as e:
+                    logging.error(f"Error configurando la caché compartida de resultados: {e}")
+
+    @property
+    def _generation_key(self) -> str:
+        return f"{self.prefix}generation"
+
+    def geocell(self, coordinates: Optional[Dict]) -> Optional[tuple]:
+        """Celda de la rejilla que contiene las coordenadas"""
+        if not coordinates:
+            return None
+        return (
+            int(math.floor(float(coordinates['latitude']) / self.cell_deg)),
+            int(math.floor(float(coordinates['longitude']) / self.cell_deg))
+        )
+
+    def make_key(
+        self,
+        query: str,
+        filters: Optional[Dict],
+        coordinates: Optional[Dict],
+        radius: float,
+        page: int,
+        per_page: int,
+        cursor: Optional[str] = None
+    ) -> str:
+        """Clave estable de una búsqueda"""
+        raw = json.dumps(
+            [
+                ' '.join((query or '').lower().split()),
+                filters or {},
+                self.geocell(coordinates),
+                round(float(radius), 3),
+                page,
+                per_page,
+                cursor
+            ],
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Busca en la caché local y después en la compartida"""
+        entry = self.local.get(key)
+        if entry is not None and entry[0] == self.generation:
+            return entry[1]
+
+        if self.shared is None:
+            return None
+
+        try:
+            generation, payload = self.shared.mget(self._generation_key, self.prefix + key)
+        except Exception as e:
+            self.shared_errors += 1
+            logging.error(f"Error leyendo la caché compartida de resultados: {e}")
+            return None
+
+        generation = int(generation or 0)
+        if generation != self.generation:
+            # Otro proceso ha invalidado: se descarta lo local
+            self.generation = generation
+            self.local.clear()
+
+        if payload is None:
+            self.shared_misses += 1
+            return None
+
+        try:
+            stored_generation, value = loads(payload)
+        except Exception as e:
+            self.shared_errors += 1
+            logging.error(f"Entrada ilegible en la caché compartida de resultados: {e}")
+            return None
+        if stored_generation != generation:
+            self.shared_misses += 1
+            return None
+
+        self.shared_hits += 1
+        self.local.set(key, (generation, value))
+        return value
+
+    def set(self, key: str, value: Any):
+        """Guarda el resultado en ambos niveles"""
+        self.local.set(key, (self.generation, value))
+        if self.shared is None:
+            return
+
+        try:
+            self.shared.set(
+                self.prefix + key,
+                dumps([self.generation, value]),
+                ex=max(1, int(self.ttl)) if self.ttl else None
+            )
+        except Exception as e:
+            self.shared_errors += 1
+            logging.error(f"Error escribiendo en la caché compartida de resultados: {e}")
+
+    def invalidate(self, reason: str = ''):
+        """Invalida todas las entradas (locales y compartidas)"""
+        self.invalidations += 1
+        self.local.clear()
+        if self.shared is not None:
+            try:
+                self.generation = int(self.shared.incr(self._generation_key))
+            except Exception as e:
+                self.shared_errors += 1
+                logging.error(f"Error invalidando la caché compartida de resultados: {e}")
+                self.generation += 1
+        else:
+            self.generation += 1
+        logging.info(f"Caché de resultados invalidada{': ' + reason if reason else ''}")
+
+    def invalidate_business(self, business_id: int):
+        """
+        Hook para cuando se crea, modifica o borra un negocio. Un cambio puede
+        añadir el negocio a búsquedas en las que antes no aparecía, así que se
+        invalida todo en lugar de solo las entradas que lo contienen.
+        """
+        self.invalidate(f"negocio {business_id} modificado")
+
+    def stats(self) -> Dict:
+        stats = self.local.stats()
+        stats.update({
+            'cell_size_km': self.cell_size_km,
+            'generation': self.generation,
+            'invalidations': self.invalidations,
+            'shared': self.shared is not None,
+            'shared_hits': self.shared_hits,
+            'shared_misses': self.shared_misses,
+            'shared_errors': self.shared_errors
+        })
+        return stats
@@ -0,0 +1,269 @@
+"""
+Rollups horarios de search_logs.
+
+Cada hora tiene una fila en search_stats_hourly (número de búsquedas,
+búsquedas sin resultados, sumas/mín/máx de latencia y un HyperLogLog de
+los usuarios de esa hora), y contadores por consulta en
+search_stats_hourly_queries. El escritor de search_logs los mantiene de
+forma incremental en cada lote, de modo que get_search_stats responde
+cualquier ventana de N días con como mucho 24 x N filas horarias (los
+usuarios únicos fusionando sus HyperLogLog) en lugar de recorrer
+search_logs.
+
+El mismo módulo sirve como job programado para crear las tablas y
+reconstruir (o reparar) los rollups a partir de search_logs:
+
+    python -m code.search.rollups --create-tables --rebuild --hours 48
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import datetime
+import logging
+import os
+import sys
+
+from .querys import ROLLUP_TABLES_DDL, ROLLUP_MIGRATIONS, SKETCH_TABLES_DDL
+from .sketches import HyperLogLog
+
+# Longitud máxima de la consulta en search_stats_hourly_queries
+MAX_QUERY_LENGTH = 255
+
+# Precisión del HyperLogLog de usuarios por hora (2^p bytes por fila)
+USERS_HLL_PRECISION = int(os.environ.get('SEARCH_ROLLUPS_HLL_PRECISION', 12))
+
+# Error de MySQL al añadir una columna que ya existe (migraciones idempotentes)
+ER_DUP_FIELDNAME = 1060
+
+
+def rollups_enabled() -> bool:
+    return os.environ.get('SEARCH_ROLLUPS_ENABLED', 'True').lower() == 'true'
+
+
+def bucket_start(moment: datetime.datetime) -> datetime.datetime:
+    """Inicio de la hora a la que pertenece un instante"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def window_start(days: int) -> datetime.datetime:
+    """Primer bucket horario de una ventana de N días"""
+    return bucket_start(datetime.datetime.now() - datetime.timedelta(days=days))
+
+
+def users_sketch_from_bytes(registers: Optional[bytes]) -> Optional[HyperLogLog]:
+    """HyperLogLog guardado en users_sketch (los 2^p registros tal cual)"""
+    if not registers:
+        return None
+    sketch = HyperLogLog(len(registers).bit_length() - 1)
+    sketch.registers = bytearray(registers)
+    return sketch
+
+
+def count_unique_users(stored_sketches: Iterable[bytes]) -> int:
+    """Usuarios únicos de una ventana fusionando los HyperLogLog de sus horas"""
+    merged = None
+    for registers in stored_sketches:
+        sketch = users_sketch_from_bytes(registers)
+        if sketch is None:
+            continue
+        if merged is None:
+            merged = sketch
+        elif sketch.p == merged.p:
+            merged.merge(sketch)
+        else:
+            logging.warning(f"users_sketch con precisión {sketch.p} distinta de {merged.p}: se ignora")
+    return merged.count() if merged is not None else 0
+
+
+def aggregate_rows(rows: List[tuple]) -> Tuple[Dict, Dict, Dict]:
+    """
+    Agrega registros (query, filters, results_count, execution_time_ms,
+    user_id, created_at) por hora y por (hora, consulta), con un HyperLogLog
+    de usuarios por hora
+    """
+    hourly: Dict[datetime.datetime, Dict] = {}
+    queries: Dict[Tuple[datetime.datetime, str], Dict] = {}
+    users: Dict[datetime.datetime, HyperLogLog] = {}
+
+    for query, _, results_count, execution_time, user_id, created_at in rows:
+        bucket = bucket_start(created_at)
+        results_count = results_count or 0
+        execution_time = execution_time or 0
+
+        hour = hourly.setdefault(bucket, {
+            'searches': 0, 'zero_results': 0, 'results_sum': 0,
+            'execution_time_sum': 0, 'execution_time_min': execution_time,
+            'execution_time_max': execution_time
+        })
+        hour['searches'] += 1
+        hour['zero_results'] += 1 if results_count == 0 else 0
+        hour['results_sum'] += results_count
+        hour['execution_time_sum'] += execution_time
+        hour['execution_time_min'] = min(hour['execution_time_min'], execution_time)
+        hour['execution_time_max'] = max(hour['execution_time_max'], execution_time)
+
+        counter = queries.setdefault((bucket, (query or '')[:MAX_QUERY_LENGTH]), {'searches': 0, 'results_sum': 0})
+        counter['searches'] += 1
+        counter['results_sum'] += results_count
+
+        if user_id is not None:
+            sketch = users.get(bucket)
+            if sketch is None:
+                sketch = users[bucket] = HyperLogLog(USERS_HLL_PRECISION)
+            sketch.add(str(user_id))
+
+    return hourly, queries, users
+
+
+def apply_rollups(cursor, rows: List[tuple]):
+    """Suma un lote de registros a los rollups (INSERT ... ON DUPLICATE KEY UPDATE)"""
+    hourly, queries, users = aggregate_rows(rows)
+
+    if hourly:
+        cursor.execute(
+            """
+            INSERT INTO search_stats_hourly
+                (bucket_start, searches, zero_results, results_sum,
+                 execution_time_sum, execution_time_min, execution_time_max)
+            VALUES """ + ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(hourly)) + """
+            ON DUPLICATE KEY UPDATE
+                searches = searches + VALUES(searches),
+                zero_results = zero_results + VALUES(zero_results),
+                results_sum = results_sum + VALUES(results_sum),
+                execution_time_sum = execution_time_sum + VALUES(execution_time_sum),
+                execution_time_min = LEAST(COALESCE(execution_time_min, VALUES(execution_time_min)), VALUES(execution_time_min)),
+                execution_time_max = GREATEST(COALESCE(execution_time_max, VALUES(execution_time_max)), VALUES(execution_time_max))
+            """,
+            [
+                value
+                for bucket, hour in hourly.items()
+                for value in (
+                    bucket, hour['searches'], hour['zero_results'], hour['results_sum'],
+                    hour['execution_time_sum'], hour['execution_time_min'], hour['execution_time_max']
+                )
+            ]
+        )
+
+    if queries:
+        cursor.execute(
+            """
+            INSERT INTO search_stats_hourly_queries (bucket_start, query, searches, results_sum)
+            VALUES """ + ', '.join(['(%s, %s, %s, %s)'] * len(queries)) + """
+            ON DUPLICATE KEY UPDATE
+                searches = searches + VALUES(searches),
+                results_sum = results_sum + VALUES(results_sum)
+            """,
+            [
+                value
+                for (bucket, query), counter in queries.items()
+                for value in (bucket, query, counter['searches'], counter['results_sum'])
+            ]
+        )
+
+    if users:
+        # Fusión del HyperLogLog de cada hora: la fila ya está bloqueada por
+        # el INSERT anterior, FOR UPDATE lee su última versión
+        buckets = sorted(users)
+        cursor.execute(
+            f"""
+            SELECT bucket_start, users_sketch FROM search_stats_hourly
+            WHERE bucket_start IN ({', '.join(['%s'] * len(buckets))})
+            FOR UPDATE
+            """,
+            buckets
+        )
+        stored = {bucket: registers for bucket, registers in cursor.fetchall()}
+        for bucket in buckets:
+            sketch = users[bucket]
+            previous = users_sketch_from_bytes(stored.get(bucket))
+            if previous is not None and previous.p == sketch.p:
+                sketch.merge(previous)
+            elif previous is not None:
+                logging.warning(f"users_sketch de {bucket} con otra precisión: la hora empieza de cero")
+        cursor.executemany(
+            "UPDATE search_stats_hourly SET users_sketch = %s WHERE bucket_start = %s",
+            [(bytes(users[bucket].registers), bucket) for bucket in buckets]
+        )
+
+
+def create_tables(pool):
+    """
+    Crea las tablas de rollups (y de sketches de analytics.py) si no existen
+    y añade a las ya creadas las columnas nuevas. La antigua
+    search_stats_hourly_users ya no se usa y puede borrarse.
+    """
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        for ddl in ROLLUP_TABLES_DDL + SKETCH_TABLES_DDL:
+            cursor.execute(ddl)
+        for migration in ROLLUP_MIGRATIONS:
+            try:
+                cursor.execute(migration)
+            except Exception as e:
+                if getattr(e, 'errno', None) != ER_DUP_FIELDNAME:
+                    raise
+        cursor.close()
+
+
+def rebuild(pool, since: datetime.datetime, batch_size: int = 10000) -> int:
+    """
+    Recalcula los rollups desde search_logs a partir de since (redondeado a
+    la hora). Es idempotente: borra los buckets afectados y los vuelve a sumar.
+    """
+    since = bucket_start(since)
+    rebuilt = 0
+    with pool.connection() as conn:
+        conn.start_transaction()
+        cursor = conn.cursor()
+        for table in ('search_stats_hourly', 'search_stats_hourly_queries'):
+            cursor.execute(f"DELETE FROM {table} WHERE bucket_start >= %s", (since,))
+
+        read_cursor = conn.cursor(buffered=True)
+        read_cursor.execute(
+            """
+            SELECT query, filters, results_count, execution_time_ms, user_id, created_at
+            FROM search_logs
+            WHERE created_at >= %s
+            """,
+            (since,)
+        )
+        while True:
+            rows = read_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            apply_rollups(cursor, rows)
+            rebuilt += len(rows)
+
+        conn.commit()
+        read_cursor.close()
+        cursor.close()
+
+    logging.info(f"Rollups reconstruidos desde {since}: {rebuilt} registros de search_logs")
+    return rebuilt
+
+
+def main(argv=None):
+    from .db_pool import get_pool, load_db_config
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de los rollups horarios de search_logs")
+    parser.add_argument('--create-tables', action='store_true', help="crea las tablas si no existen")
+    parser.add_argument('--rebuild', action='store_true', help="recalcula los rollups desde search_logs")
+    parser.add_argument('--hours', type=int, default=48, help="horas hacia atrás a recalcular (por defecto 48)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    pool = get_pool(load_db_config())
+
+    if args.create_tables:
+        create_tables(pool)
+        print("Tablas de rollups creadas")
+    if args.rebuild:
+        since = datetime.datetime.now() - datetime.timedelta(hours=args.hours)
+        print(f"Registros procesados: {rebuild(pool, since)}")
+    if not (args.create_tables or args.rebuild):
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
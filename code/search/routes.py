@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from mysql.connector import Error
 from .engine import SearchEngine
+from .pagination import InvalidCursorError
 from . import DB_CONFIG
 
 search_bp = Blueprint('search', __name__)
@@ -31,6 +32,8 @@ def search():
         
         return jsonify(result)
         
+    except InvalidCursorError as e:
+        return _handle_error(e, 400)
     except Exception as e:
         return _handle_error(e)
 
@@ -63,16 +66,23 @@ def _get_filters_from_request():
         filters['category_id'] = int(request.args.get('category_id'))
     if request.args.get('service_id'):
         filters['service_id'] = int(request.args.get('service_id'))
+    # Listas separadas por comas; service_match=any para OR (AND por defecto)
+    for key in ('category_ids', 'service_ids'):
+        if request.args.get(key):
+            filters[key] = [int(value) for value in request.args.get(key).split(',') if value.strip()]
+    if request.args.get('service_match'):
+        filters['service_match'] = request.args.get('service_match').lower()
     return filters
 
 def _get_pagination_from_request():
-    """Extrae parámetros de paginación"""
+    """Extrae parámetros de paginación (page o cursor de stats.next_cursor)"""
     return {
         'page': int(request.args.get('page', 1)),
-        'per_page': int(request.args.get('per_page', 20))
+        'per_page': int(request.args.get('per_page', 20)),
+        'cursor': request.args.get('cursor') or None
     }
 
-def _handle_error(error: Exception):
+def _handle_error(error: Exception, status: int = 500):
     """Maneja errores de forma consistente"""
     return jsonify({
         'error': str(error),
@@ -82,4 +92,4 @@ def _handle_error(error: Exception):
             'page': 1,
             'per_page': 20
         }
-    }), 500
\ No newline at end of file
+    }), status
\ No newline at end of file
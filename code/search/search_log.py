@@ -0,0 +1,218 @@
+from typing import Dict, List, Optional
+import threading
+import datetime
+import logging
+import atexit
+import queue
+import json
+import time
+import os
+
+from .rollups import apply_rollups, rollups_enabled
+
+SEARCH_LOG_COLUMNS = ('query', 'filters', 'results_count', 'execution_time_ms', 'user_id', 'created_at')
+
+# InnoDB deshace la transacción entera ante un deadlock
+ER_LOCK_DEADLOCK = 1213
+
+
+def search_log_enabled() -> bool:
+    return os.environ.get('SEARCH_LOG_ENABLED', 'True').lower() == 'true'
+
+
+class SearchLogWriter:
+    """
+    Escritor en segundo plano de la tabla search_logs.
+
+    El hilo de la petición solo encola el registro (nunca bloquea: si la cola
+    está llena el registro se descarta y se cuenta). Un hilo daemon agrupa
+    los registros y los escribe con INSERTs multi-fila cada batch_size
+    registros o cada flush_interval_ms, lo que ocurra antes, y en la misma
+    transacción suma el lote a los rollups horarios. Al cerrar el proceso
+    se vacía la cola.
+    """
+
+    def __init__(
+        self,
+        pool,
+        queue_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_interval_ms: Optional[float] = None
+    ):
+        self.pool = pool
+        self.enabled = search_log_enabled()
+        self.rollups = rollups_enabled()
+        self.batch_size = batch_size or int(os.environ.get('SEARCH_LOG_BATCH_SIZE', 100))
+        self.flush_interval = (
+            flush_interval_ms if flush_interval_ms is not None
+            else float(os.environ.get('SEARCH_LOG_FLUSH_MS', 1000))
+        ) / 1000.0
+        self._queue_size = queue_size or int(os.environ.get('SEARCH_LOG_QUEUE_SIZE', 10000))
+
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.rollup_failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0
+
+    def _ensure_started(self):
+        """Arranca el hilo escritor (una vez por proceso, también tras un fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Proceso hijo (fork): el hilo del padre no existe aquí, se empieza con cola nueva
+                self._queue = queue.Queue(maxsize=self._queue_size)
+                self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='search-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def record(
+        self,
+        query: str,
+        filters: Optional[Dict],
+        results_count: int,
+        execution_time_ms: int,
+        user_id: Optional[str] = None
+    ):
+        """Encola un registro de búsqueda sin bloquear la petición"""
+        if not self.enabled:
+            return
+        self._ensure_started()
+
+        row = (
+            query,
+            json.dumps(filters, default=str) if filters else None,
+            results_count,
+            execution_time_ms,
+            user_id,
+            datetime.datetime.now()
+        )
+        try:
+            self._queue.put_nowait(row)
+            self.enqueued += 1
+        except queue.Full:
+            # Back-pressure: preferimos perder analítica a añadir latencia
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logging.warning(f"Cola de search_logs llena: {self.dropped} registros descartados")
+
+    def _next_batch(self) -> List[tuple]:
+        """Espera hasta batch_size registros o hasta que venza el intervalo"""
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                # Esperas cortas para atender enseguida una parada ordenada
+                batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+            except queue.Empty:
+                if self._stop.is_set():
+                    break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[tuple]):
+        """Un único INSERT multi-fila por lote"""
+        start_time = time.time()
+        placeholders = '(' + ', '.join(['%s'] * len(SEARCH_LOG_COLUMNS)) + ')'
+        sql = (
+            f"INSERT INTO search_logs ({', '.join(SEARCH_LOG_COLUMNS)}) VALUES "
+            + ', '.join([placeholders] * len(batch))
+        )
+        params = [value for row in batch for value in row]
+        try:
+            with self.pool.connection() as conn:
+                conn.start_transaction()
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(sql, params)
+                    if self.rollups:
+                        self._apply_rollups(cursor, batch)
+                    conn.commit()
+                finally:
+                    cursor.close()
+            # Solo cuenta lo que llegó a confirmarse
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(batch)
+            logging.error(f"Error escribiendo {len(batch)} registros en search_logs: {e}")
+        finally:
+            self.last_flush_ms = int((time.time() - start_time) * 1000)
+
+    def _apply_rollups(self, cursor, batch: List[tuple]):
+        """
+        Suma el lote a los rollups dentro de un SAVEPOINT: si falla se deshace
+        solo esa parte (los rollups nunca quedan a medias) y los registros se
+        guardan igualmente; el job de rebuild repara el hueco. Un deadlock
+        deshace toda la transacción, INSERT incluido, y se propaga.
+        """
+        cursor.execute("SAVEPOINT search_log_rollups")
+        try:
+            apply_rollups(cursor, batch)
+        except Exception as e:
+            if getattr(e, 'errno', None) == ER_LOCK_DEADLOCK:
+                raise
+            # Si la transacción ya no existe, ROLLBACK TO falla y el lote cuenta como fallido
+            cursor.execute("ROLLBACK TO SAVEPOINT search_log_rollups")
+            self.rollup_failed += len(batch)
+            logging.error(f"Error actualizando rollups de search_logs: {e}")
+        else:
+            cursor.execute("RELEASE SAVEPOINT search_log_rollups")
+
+    def flush(self):
+        """Escribe de inmediato todo lo encolado (desde el hilo que llama)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self, timeout: float = 5.0):
+        """Parada ordenada: detiene el hilo y vacía la cola"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'queued': self._queue.qsize(),
+            'queue_size': self._queue_size,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'rollups': self.rollups,
+            'rollup_failed': self.rollup_failed,
+            'batches': self.batches,
+            'last_flush_ms': self.last_flush_ms
+        }
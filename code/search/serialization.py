@@ -0,0 +1,55 @@
+from typing import Any
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # Sin orjson se usa el módulo json de la librería estándar
+    orjson = None
+
+
+def json_default(obj: Any) -> Any:
+    """
+    Tipos no nativos de JSON con el mismo formato que se ha enviado siempre
+    a Laravel: fechas como 'YYYY-MM-DD HH:MM:SS' y Decimal/timedelta como texto
+    """
+    if isinstance(obj, datetime.datetime):
+        return obj.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(obj, datetime.date):
+        return obj.strftime('%Y-%m-%d')
+    if isinstance(obj, datetime.time):
+        return obj.strftime('%H:%M:%S')
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', errors='replace')
+    return str(obj)
+
+
+def backend() -> str:
+    """Codificador en uso"""
+    return 'orjson' if orjson is not None else 'json'
+
+
+def stdlib_dumps(obj: Any) -> bytes:
+    """Serialización con la librería estándar (fallback y referencia)"""
+    return json.dumps(
+        obj,
+        default=json_default,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """Serializa a bytes JSON en una sola pasada"""
+        return orjson.dumps(obj, default=json_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    dumps = stdlib_dumps
+    loads = json.loads
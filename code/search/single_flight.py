@@ -0,0 +1,100 @@
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+import threading
+import logging
+import os
+
+
+class _Call:
+    """Cálculo en curso para una clave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalescencia de peticiones idénticas concurrentes (single-flight).
+
+    La primera petición de una clave (líder) ejecuta el cálculo; las que
+    llegan mientras está en curso esperan a ese mismo cálculo y comparten su
+    resultado (o su excepción). Si el líder tarda más que el timeout, cada
+    seguidor deja de esperar y calcula por su cuenta, de modo que un líder
+    bloqueado no bloquea a los demás. Funciona dentro del proceso; entre
+    workers el nivel compartido de la caché de resultados evita el resto.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, enabled: Optional[bool] = None):
+        self.timeout = timeout if timeout is not None else float(os.environ.get('SINGLE_FLIGHT_TIMEOUT_SECONDS', 10))
+        self.enabled = (
+            enabled if enabled is not None
+            else os.environ.get('SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+        )
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.shared_errors = 0
+        self.max_waiters = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Ejecuta fn una sola vez por clave entre las llamadas concurrentes.
+        Devuelve (resultado, compartido) donde compartido indica que el
+        resultado lo calculó otra petición.
+        """
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            logging.warning("Single-flight: timeout esperando a la petición en curso, se calcula de nuevo")
+            return fn(), False
+
+        with self._lock:
+            self.coalesced += 1
+            if call.error is not None:
+                self.shared_errors += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'timeout_seconds': self.timeout,
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+                'shared_errors': self.shared_errors,
+                'max_waiters': self.max_waiters
+            }
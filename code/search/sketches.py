@@ -0,0 +1,232 @@
+"""
+Sketches de streaming para la analítica de búsquedas.
+
+- HyperLogLog: usuarios únicos con memoria fija (2^p registros)
+- SpaceSaving: consultas más frecuentes (heavy hitters) con k contadores
+- TDigest: percentiles de latencia (p50/p95/p99)
+
+Los tres se pueden fusionar (merge) entre workers y serializar a dict
+(JSON) para persistirlos.
+"""
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import base64
+import math
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Estimador de cardinalidad (error típico 1.04 / sqrt(2^p))"""
+
+    def __init__(self, p: int = 12):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(self.m)
+
+    def add(self, value: str):
+        x = _hash64(str(value))
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Corrección para cardinalidades pequeñas (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other: 'HyperLogLog'):
+        if other.p != self.p:
+            raise ValueError("HyperLogLog con distinta precisión")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_dict(self) -> Dict:
+        return {'p': self.p, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HyperLogLog':
+        sketch = cls(data['p'])
+        sketch.registers = bytearray(base64.b64decode(data['registers']))
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Top-k aproximado (Metwally et al.). Cada elemento guarda su cuenta, la
+    sobreestimación máxima (error) y la suma de resultados observada desde
+    que se sigue, para calcular la media de resultados de la consulta.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        # item -> [count, error, results_sum, observed]
+        self.counters: Dict[str, List[int]] = {}
+
+    def add(self, item: str, results: int = 0, weight: int = 1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+            counter[2] += results
+            counter[3] += weight
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0, results, weight]
+            return
+        # Se reemplaza el menos frecuente y se hereda su cuenta como error
+        victim = min(self.counters, key=lambda key: self.counters[key][0])
+        floor = self.counters.pop(victim)[0]
+        self.counters[item] = [floor + weight, floor, results, weight]
+
+    def _floor(self) -> int:
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def merge(self, other: 'SpaceSaving'):
+        """Fusión de resúmenes (Agarwal et al.): los ausentes suman el mínimo del otro"""
+        own_floor, other_floor = self._floor(), other._floor()
+        merged: Dict[str, List[int]] = {}
+        for item in set(self.counters) | set(other.counters):
+            a = self.counters.get(item, [own_floor, own_floor, 0, 0])
+            b = other.counters.get(item, [other_floor, other_floor, 0, 0])
+            merged[item] = [a[0] + b[0], a[1] + b[1], a[2] + b[2], a[3] + b[3]]
+        top = sorted(merged.items(), key=lambda entry: entry[1][0], reverse=True)[:self.capacity]
+        self.counters = dict(top)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int, int, Optional[float]]]:
+        """[(item, cuenta, error, media de resultados)] ordenado por frecuencia"""
+        ranked = sorted(self.counters.items(), key=lambda entry: (-entry[1][0], entry[0]))[:n]
+        return [
+            (item, count, error, results_sum / observed if observed else None)
+            for item, (count, error, results_sum, observed) in ranked
+        ]
+
+    def to_dict(self) -> Dict:
+        return {'capacity': self.capacity, 'counters': self.counters}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SpaceSaving':
+        sketch = cls(data['capacity'])
+        sketch.counters = {item: list(counter) for item, counter in data['counters'].items()}
+        return sketch
+
+
+class TDigest:
+    """t-digest con fusión por lotes y función de escala k1 (Dunning)"""
+
+    def __init__(self, compression: float = 100, buffer_size: int = 500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.centroids: List[List[float]] = []  # [media, peso] ordenados por media
+        self._buffer: List[float] = []
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float):
+        value = float(value)
+        self._buffer.append(value)
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _q(self, k: float) -> float:
+        return (math.sin(min(k, self.compression / 4) * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self, extra: Optional[List[List[float]]] = None):
+        points = self.centroids + [[value, 1.0] for value in self._buffer] + (extra or [])
+        self._buffer = []
+        if not points:
+            return
+        points.sort(key=lambda centroid: centroid[0])
+        weight = sum(centroid[1] for centroid in points)
+
+        merged = [list(points[0])]
+        q0 = 0.0
+        q_limit = self._q(self._k(q0) + 1)
+        for mean, w in points[1:]:
+            current = merged[-1]
+            if q0 + (current[1] + w) / weight <= q_limit:
+                current[0] += (mean - current[0]) * w / (current[1] + w)
+                current[1] += w
+            else:
+                q0 += current[1] / weight
+                q_limit = self._q(self._k(q0) + 1)
+                merged.append([mean, w])
+        self.centroids = merged
+
+    def merge(self, other: 'TDigest'):
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress(
+            [list(centroid) for centroid in other.centroids] + [[value, 1.0] for value in other._buffer]
+        )
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self._buffer:
+            self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        weight = sum(centroid[1] for centroid in self.centroids)
+        target = q * weight
+        # Cada centroide se sitúa en el centro de su masa acumulada
+        cumulative = 0.0
+        previous_mean, previous_center = self.min, 0.0
+        for mean, w in self.centroids:
+            center = cumulative + w / 2
+            if target < center:
+                if center == previous_center:
+                    return mean
+                fraction = (target - previous_center) / (center - previous_center)
+                return previous_mean + fraction * (mean - previous_mean)
+            previous_mean, previous_center = mean, center
+            cumulative += w
+        if weight == previous_center:
+            return self.max
+        fraction = (target - previous_center) / (weight - previous_center)
+        return previous_mean + fraction * (self.max - previous_mean)
+
+    def to_dict(self) -> Dict:
+        if self._buffer:
+            self._compress()
+        return {
+            'compression': self.compression,
+            'centroids': self.centroids,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TDigest':
+        sketch = cls(data['compression'])
+        sketch.centroids = [list(centroid) for centroid in data['centroids']]
+        sketch.count = data['count']
+        sketch.total = data['total']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
@@ -0,0 +1,347 @@
+"""
+Almacén de documentos de negocio desnormalizados.
+
+Cada documento es el dict con el formato de Laravel que emite /search
+(servicios, categoría, horarios, menús e imágenes de portada), sin los campos
+que dependen de la búsqueda (distance y score). Se construye fuera de línea
+desde MySQL y se guarda en dos ficheros dentro de BUSINESS_SNAPSHOT_DIR:
+
+- businesses-<marca>.dat: documentos JSON concatenados (se lee con mmap)
+- businesses.idx: cabecera con metadatos y registros (id, offset, longitud)
+
+El refresco incremental añade al final del .dat las nuevas versiones de los
+negocios modificados desde la marca de agua de updated_at y reescribe el
+índice de forma atómica; los huecos se compactan con una reconstrucción
+completa (--full, o automáticamente si superan a los datos vivos).
+
+    python -m code.search.snapshot --dir /var/lib/foodly/snapshot [--full]
+
+Los cambios en tablas hijas (horarios, menús, imágenes, servicios) solo se
+recogen si actualizan businesses.updated_at o con --full.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import argparse
+import datetime
+import logging
+import struct
+import mmap
+import json
+import time
+import sys
+import os
+
+from .querys import SNAPSHOT_BUSINESSES_QUERY
+from .serialization import dumps, loads
+
+INDEX_FILE = 'businesses.idx'
+INDEX_MAGIC = b'FBSI'
+INDEX_VERSION = 1
+# id, offset, longitud
+RECORD = struct.Struct('<qQI')
+HEADER = struct.Struct('<4sBI')
+
+# Campos del documento que se calculan en cada búsqueda
+SEARCH_FIELDS = ('distance', 'score')
+
+
+def read_index(directory: str) -> Tuple[Dict, Dict[int, Tuple[int, int]]]:
+    """Metadatos y entradas {id: (offset, longitud)} del índice"""
+    with open(os.path.join(directory, INDEX_FILE), 'rb') as index_file:
+        raw = index_file.read()
+    magic, version, meta_length = HEADER.unpack_from(raw, 0)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        raise ValueError(f"Índice de snapshot no reconocido en {directory}")
+    meta = json.loads(raw[HEADER.size:HEADER.size + meta_length].decode('utf-8'))
+    entries = {
+        business_id: (offset, length)
+        for business_id, offset, length in RECORD.iter_unpack(raw[HEADER.size + meta_length:])
+    }
+    return meta, entries
+
+
+def write_index(directory: str, meta: Dict, entries: Dict[int, Tuple[int, int]]):
+    """Escribe el índice en un temporal y lo sustituye de forma atómica"""
+    meta_raw = json.dumps(meta, default=str).encode('utf-8')
+    path = os.path.join(directory, INDEX_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(meta_raw)))
+        index_file.write(meta_raw)
+        index_file.write(b''.join(
+            RECORD.pack(business_id, offset, length)
+            for business_id, (offset, length) in sorted(entries.items())
+        ))
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    os.replace(tmp_path, path)
+
+
+class BusinessSnapshot:
+    """
+    Lector del almacén: índice en un dict y datos mapeados en memoria, así
+    que cada documento es una búsqueda por id y un loads de sus bytes.
+    Vuelve a abrir los ficheros cuando el índice cambia en disco.
+    """
+
+    def __init__(self, directory: str, check_interval: Optional[float] = None):
+        self.directory = directory
+        self.check_interval = (
+            check_interval if check_interval is not None
+            else float(os.environ.get('BUSINESS_SNAPSHOT_CHECK_SECONDS', 5))
+        )
+        self._lock = threading.Lock()
+        self._state = None  # (entries, mmap, meta)
+        self._index_mtime = None
+        self._last_check = 0.0
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        """Abre (o vuelve a abrir) el índice y el fichero de datos"""
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        mtime = os.path.getmtime(index_path)
+        meta, entries = read_index(self.directory)
+        with open(os.path.join(self.directory, meta['data_file']), 'rb') as data_file:
+            data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(data_file.fileno()).st_size else b''
+        # El mmap anterior se libera cuando ningún lector lo usa
+        self._state = (entries, data, meta)
+        self._index_mtime = mtime
+        self.loaded = True
+        logging.info(f"Snapshot de negocios abierto: {len(entries)} documentos (marca de agua {meta.get('watermark')})")
+
+    def maybe_reload(self):
+        """Comprueba cada check_interval segundos si el índice ha cambiado"""
+        now = time.time()
+        if now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                if not self.loaded or os.path.getmtime(os.path.join(self.directory, INDEX_FILE)) != self._index_mtime:
+                    self.open()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.error(f"Error abriendo el snapshot de negocios: {e}")
+
+    def get(self, business_id: int) -> Optional[Dict]:
+        """Documento de un negocio (None si no está en el snapshot)"""
+        state = self._state
+        if state is None:
+            return None
+        entries, data, _ = state
+        entry = entries.get(business_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        offset, length = entry
+        self.hits += 1
+        return loads(data[offset:offset + length])
+
+    def get_many(self, business_ids: Iterable[int]) -> Dict[int, Dict]:
+        documents = {}
+        for business_id in business_ids:
+            document = self.get(business_id)
+            if document is not None:
+                documents[business_id] = document
+        return documents
+
+    def stats(self) -> Dict:
+        state = self._state
+        lookups = self.hits + self.misses
+        return {
+            'directory': self.directory,
+            'loaded': self.loaded,
+            'documents': len(state[0]) if state else 0,
+            'watermark': state[2].get('watermark') if state else None,
+            'built_at': state[2].get('built_at') if state else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[BusinessSnapshot]:
+    """Snapshot del proceso si BUSINESS_SNAPSHOT_DIR está configurado y existe"""
+    global _snapshot
+    directory = os.environ.get('BUSINESS_SNAPSHOT_DIR')
+    if not directory:
+        return None
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = BusinessSnapshot(directory)
+    _snapshot.maybe_reload()
+    return _snapshot if _snapshot.loaded else None
+
+
+def build_documents(cursor, rows: List[Dict]) -> List[Tuple[int, bytes]]:
+    """
+    Documentos serializados de un lote de negocios (una consulta por tabla).
+    Los errores de consulta se propagan: un documento sin servicios, horarios
+    o menús se serviría como acierto hasta el siguiente cambio del negocio.
+    """
+    from .hydration import (
+        build_business_data, fetch_services, fetch_categories, fetch_hours,
+        fetch_menus, fetch_cover_images, parse_service_ids
+    )
+
+    business_ids = [row['id'] for row in rows]
+    service_ids = set()
+    for row in rows:
+        service_ids.update(parse_service_ids(row.get('service_ids')))
+
+    services = fetch_services(cursor, service_ids)
+    categories = fetch_categories(cursor, [row.get('category_id') for row in rows])
+    hours = fetch_hours(cursor, business_ids)
+    menus = fetch_menus(cursor, {row['id']: row.get('business_uuid') for row in rows})
+    cover_images = fetch_cover_images(cursor, business_ids)
+
+    documents = []
+    for row in rows:
+        document = build_business_data(row, services, categories, hours, menus, cover_images)
+        for field in SEARCH_FIELDS:
+            document.pop(field, None)
+        documents.append((row['id'], dumps(document)))
+    return documents
+
+
+def _write_documents(
+    pool,
+    directory: str,
+    data_file: str,
+    watermark: Optional[str],
+    entries: Dict[int, Tuple[int, int]],
+    batch_size: int
+) -> Tuple[Optional[str], int, int]:
+    """
+    Añade al fichero de datos los negocios modificados desde watermark y
+    actualiza entries. Devuelve (nueva marca de agua, escritos, borrados).
+    """
+    written = deleted = 0
+    with pool.connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        if watermark:
+            cursor.execute(SNAPSHOT_BUSINESSES_QUERY.format(where="b.updated_at >= %s"), (watermark,))
+        else:
+            cursor.execute(SNAPSHOT_BUSINESSES_QUERY.format(where="b.deleted_at IS NULL"))
+        rows = cursor.fetchall()
+
+        new_watermark = watermark
+        live = []
+        for row in rows:
+            updated_at = row.get('updated_at')
+            if updated_at is not None and (new_watermark is None or str(updated_at) > str(new_watermark)):
+                new_watermark = str(updated_at)
+            if row.get('deleted_at') is not None:
+                if entries.pop(row['id'], None) is not None:
+                    deleted += 1
+            else:
+                live.append(row)
+
+        with open(os.path.join(directory, data_file), 'ab') as data:
+            offset = data.tell()
+            for start in range(0, len(live), batch_size):
+                for business_id, document in build_documents(cursor, live[start:start + batch_size]):
+                    data.write(document)
+                    entries[business_id] = (offset, len(document))
+                    offset += len(document)
+                    written += 1
+            data.flush()
+            os.fsync(data.fileno())
+        cursor.close()
+    return new_watermark, written, deleted
+
+
+def build_snapshot(pool, directory: str, full: bool = False, batch_size: Optional[int] = None) -> Dict:
+    """
+    Construye (full) o actualiza el snapshot. Devuelve un resumen con los
+    documentos escritos y borrados.
+    """
+    batch_size = batch_size or int(os.environ.get('BUSINESS_SNAPSHOT_BATCH_SIZE', 500))
+    os.makedirs(directory, exist_ok=True)
+
+    meta, entries = {}, {}
+    if not full:
+        try:
+            meta, entries = read_index(directory)
+        except FileNotFoundError:
+            full = True
+        else:
+            # Compactación automática cuando las versiones viejas superan a las vivas
+            live_bytes = sum(length for _, length in entries.values())
+            data_size = os.path.getsize(os.path.join(directory, meta['data_file']))
+            if data_size > 2 * max(live_bytes, 1):
+                logging.info("Snapshot con más huecos que datos: reconstrucción completa")
+                full = True
+    if full:
+        meta, entries = {}, {}
+
+    start_time = time.time()
+    previous_data_file = meta.get('data_file')
+    data_file = previous_data_file or f"businesses-{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}.dat"
+    watermark = meta.get('watermark')
+
+    try:
+        new_watermark, written, deleted = _write_documents(
+            pool, directory, data_file, watermark, entries, batch_size
+        )
+    except Exception:
+        # El índice anterior sigue en vigor; solo sobra el fichero de datos nuevo
+        if data_file != previous_data_file:
+            try:
+                os.remove(os.path.join(directory, data_file))
+            except OSError:
+                pass
+        raise
+
+    write_index(directory, {
+        'data_file': data_file,
+        'watermark': new_watermark,
+        'built_at': datetime.datetime.now().isoformat(),
+        'count': len(entries)
+    }, entries)
+
+    # Ficheros de datos de reconstrucciones anteriores (los lectores abiertos conservan su mmap)
+    for name in os.listdir(directory):
+        if name.startswith('businesses-') and name.endswith('.dat') and name != data_file:
+            os.remove(os.path.join(directory, name))
+
+    summary = {
+        'full': full,
+        'written': written,
+        'deleted': deleted,
+        'documents': len(entries),
+        'watermark': new_watermark,
+        'elapsed_ms': int((time.time() - start_time) * 1000)
+    }
+    logging.info(f"Snapshot de negocios actualizado: {summary}")
+    return summary
+
+
+def main(argv=None):
+    from .db_pool import get_pool, load_db_config
+
+    parser = argparse.ArgumentParser(description="Construye el snapshot de documentos de negocio")
+    parser.add_argument('--dir', default=os.environ.get('BUSINESS_SNAPSHOT_DIR'), help="directorio del snapshot")
+    parser.add_argument('--full', action='store_true', help="reconstrucción completa (compacta el fichero de datos)")
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("indica --dir o BUSINESS_SNAPSHOT_DIR")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    summary = build_snapshot(get_pool(load_db_config()), args.dir, full=args.full)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
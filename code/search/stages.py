@@ -0,0 +1,82 @@
+from typing import Dict, Optional
+from contextlib import contextmanager
+import contextvars
+import time
+
+from .tracing import span
+
+_current: contextvars.ContextVar = contextvars.ContextVar('search_stage_timer', default=None)
+
+
+class StageTimer:
+    """
+    Tiempos por etapa de una petición de búsqueda (parse, search, hydrate,
+    serialize...). El handler lo activa con start() y el código del motor
+    marca sus etapas con stage() sin depender de Flask: si no hay ninguno
+    activo en el contexto, stage() no hace nada.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, elapsed_ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def server_timing(self) -> str:
+        """Cabecera Server-Timing con cada etapa y el total"""
+        entries = [f"{name};dur={elapsed:.2f}" for name, elapsed in self.stages.items()]
+        entries.append(f"total;dur={self.total_ms():.2f}")
+        return ', '.join(entries)
+
+
+def start() -> StageTimer:
+    """Activa un temporizador nuevo para la petición en curso"""
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def current() -> Optional[StageTimer]:
+    return _current.get()
+
+
+def activate(timer: Optional[StageTimer]):
+    """
+    Reactiva el temporizador de una petición en código que corre después del
+    handler (el generador de una respuesta en streaming)
+    """
+    _current.set(timer)
+
+
+def finish():
+    _current.set(None)
+
+
+def record(name: str, started: float):
+    """
+    Suma a la etapa name el tiempo desde started (time.perf_counter()), para
+    tramos de código que no caben en un with
+    """
+    timer = _current.get()
+    if timer is not None:
+        timer.add(name, (time.perf_counter() - started) * 1000)
+
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa en el temporizador activo (si lo hay)"""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        # Con traza activa la etapa es además un span (padre de sus consultas)
+        with span(name):
+            yield
+    finally:
+        timer.add(name, (time.perf_counter() - start_time) * 1000)
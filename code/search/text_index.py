@@ -0,0 +1,229 @@
+from typing import Callable, Dict, List, Optional
+from collections import Counter
+import threading
+import logging
+import math
+import time
+import os
+
+# Peso de cada campo en el scoring BM25F
+DEFAULT_FIELD_WEIGHTS = {
+    'business_name': 3.0,
+    'category_name': 2.0,
+    'service_names': 1.5,
+    'business_about_us': 1.0
+}
+
+
+class InvertedIndex:
+    """
+    Índice invertido en memoria con scoring BM25F sobre business_name,
+    business_about_us, el nombre de la categoría y los nombres de servicios.
+
+    Usa el mismo analizador que el procesamiento de voz (tokenizador de NLTK,
+    stopwords y Snowball stemmer de TextProcessor), de modo que la relevancia
+    es coherente con el parseo de las consultas. Sustituye a
+    MATCH(...) AGAINST(...) y se actualiza de forma incremental.
+    """
+
+    def __init__(
+        self,
+        analyzer: Callable[[str], List[str]],
+        field_weights: Optional[Dict[str, float]] = None,
+        k1: Optional[float] = None,
+        b: Optional[float] = None,
+        refresh_interval: Optional[float] = None
+    ):
+        self.analyzer = analyzer
+        self.field_weights = field_weights or DEFAULT_FIELD_WEIGHTS
+        self.k1 = k1 if k1 is not None else float(os.environ.get('TEXT_INDEX_BM25_K1', 1.2))
+        self.b = b if b is not None else float(os.environ.get('TEXT_INDEX_BM25_B', 0.75))
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.environ.get('TEXT_INDEX_REFRESH_SECONDS', 300))
+        )
+
+        self._lock = threading.RLock()
+        self._docs: Dict[int, Dict[str, Counter]] = {}
+        self._lengths: Dict[int, Dict[str, int]] = {}
+        self._postings: Dict[str, set] = {}
+        self._field_length_sums = {field: 0 for field in self.field_weights}
+        self._watermark = None
+        self._last_refresh = 0.0
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add_document(self, business_id: int, fields: Dict[str, str]):
+        """Indexa (o reindexa) un negocio"""
+        analyzed = {
+            field: Counter(self.analyzer(fields.get(field) or ''))
+            for field in self.field_weights
+        }
+        lengths = {field: sum(counts.values()) for field, counts in analyzed.items()}
+        with self._lock:
+            self.remove_document(business_id)
+            self._docs[business_id] = analyzed
+            self._lengths[business_id] = lengths
+            for field, counts in analyzed.items():
+                self._field_length_sums[field] += lengths[field]
+                for term in counts:
+                    self._postings.setdefault(term, set()).add(business_id)
+
+    def remove_document(self, business_id: int):
+        """Elimina un negocio del índice (si existe)"""
+        with self._lock:
+            analyzed = self._docs.pop(business_id, None)
+            if analyzed is None:
+                return
+            lengths = self._lengths.pop(business_id)
+            for field, counts in analyzed.items():
+                self._field_length_sums[field] -= lengths[field]
+                for term in counts:
+                    docs = self._postings.get(term)
+                    if docs is not None:
+                        docs.discard(business_id)
+                        if not docs:
+                            del self._postings[term]
+
+    def _read_rows(self, pool, since=None) -> List[Dict]:
+        """Lee negocios con su categoría y los nombres de sus servicios"""
+        with pool.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            sql = """
+                SELECT b.id, b.business_name, b.business_about_us, c.category_name,
+                       b.deleted_at, b.updated_at
+                FROM businesses b
+                LEFT JOIN categories c ON b.category_id = c.id
+            """
+            if since is None:
+                cursor.execute(sql + " WHERE b.deleted_at IS NULL")
+            else:
+                cursor.execute(sql + " WHERE b.updated_at >= %s", (since,))
+            rows = cursor.fetchall()
+
+            services = {}
+            business_ids = [row['id'] for row in rows]
+            if business_ids:
+                sql = """
+                    SELECT bs.business_id, s.service_name
+                    FROM business_service bs
+                    JOIN services s ON s.id = bs.service_id
+                """
+                if since is None:
+                    cursor.execute(sql)
+                else:
+                    cursor.execute(
+                        sql + f" WHERE bs.business_id IN ({', '.join(['%s'] * len(business_ids))})",
+                        business_ids
+                    )
+                for link in cursor.fetchall():
+                    services.setdefault(link['business_id'], []).append(link['service_name'] or '')
+            cursor.close()
+
+        for row in rows:
+            row['service_names'] = ' '.join(services.get(row['id'], []))
+        return rows
+
+    def _apply_rows(self, rows: List[Dict]):
+        for row in rows:
+            if row.get('deleted_at') is not None:
+                self.remove_document(row['id'])
+            else:
+                self.add_document(row['id'], row)
+
+            updated_at = row.get('updated_at')
+            if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+                self._watermark = updated_at
+
+    def load(self, pool):
+        """Construcción completa del índice"""
+        start_time = time.time()
+        rows = self._read_rows(pool)
+
+        with self._lock:
+            self._docs = {}
+            self._lengths = {}
+            self._postings = {}
+            self._field_length_sums = {field: 0 for field in self.field_weights}
+            self._watermark = None
+            self._apply_rows(rows)
+            self._last_refresh = time.time()
+            self.loaded = True
+
+        logging.info(
+            f"Índice de texto cargado: {len(self._docs)} negocios, {len(self._postings)} términos "
+            f"({int((time.time() - start_time) * 1000)}ms)"
+        )
+
+    def refresh(self, pool):
+        """Actualización incremental por marca de agua de updated_at"""
+        if not self.loaded or self._watermark is None:
+            return self.load(pool)
+
+        rows = self._read_rows(pool, since=self._watermark)
+        with self._lock:
+            self._apply_rows(rows)
+            self._last_refresh = time.time()
+
+    def mark_stale(self):
+        """Fuerza el refresco en la siguiente llamada a maybe_refresh"""
+        self._last_refresh = 0.0
+
+    def maybe_refresh(self, pool):
+        """Refresca el índice si ha pasado el intervalo configurado"""
+        if self.refresh_interval and time.time() - self._last_refresh >= self.refresh_interval:
+            self._last_refresh = time.time()
+            try:
+                self.refresh(pool)
+            except Exception as e:
+                self._last_refresh = time.time()
+                logging.error(f"Error refrescando el índice de texto: {e}")
+
+    def search(self, query: str, limit: Optional[int] = None) -> Dict[int, float]:
+        """
+        Devuelve {business_id: score BM25F} de los negocios que contienen algún
+        término de la consulta (semántica OR, como NATURAL LANGUAGE MODE)
+        """
+        terms = set(self.analyzer(query or ''))
+        if not terms:
+            return {}
+
+        scores: Dict[int, float] = {}
+        with self._lock:
+            total_docs = len(self._docs)
+            if total_docs == 0:
+                return {}
+            avg_lengths = {
+                field: (length_sum / total_docs) or 1.0
+                for field, length_sum in self._field_length_sums.items()
+            }
+
+            for term in terms:
+                docs = self._postings.get(term)
+                if not docs:
+                    continue
+                df = len(docs)
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+
+                for business_id in docs:
+                    analyzed = self._docs[business_id]
+                    lengths = self._lengths[business_id]
+                    weighted_tf = 0.0
+                    for field, weight in self.field_weights.items():
+                        counts = analyzed[field]
+                        tf = counts.get(term)
+                        if not tf:
+                            continue
+                        norm = 1 - self.b + self.b * (lengths[field] / avg_lengths[field])
+                        weighted_tf += weight * tf / norm
+
+                    scores[business_id] = scores.get(business_id, 0.0) + (
+                        idf * weighted_tf / (self.k1 + weighted_tf)
+                    )
+
+        if limit and len(scores) > limit:
+            top = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return dict(top)
+        return scores
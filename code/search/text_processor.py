@@ -1,12 +1,29 @@
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 import nltk
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import SnowballStemmer
+import copy
 import json
+import logging
 import os
 import re
+import time
 import unicodedata
+from .gazetteer import CityGazetteer
+from .keyword_matcher import KeywordMatcher
+from .cache import LRUCache
+from .stages import stage
+
+# Frases que indican que se quiere buscar alrededor de la ubicación del usuario
+USER_LOCATION_INDICATORS = [
+    'near me', 'close to me', 'around me', 'nearby me',
+    'current location', 'my location', 'here', 'nearby',
+    'walking distance', 'close', 'around'
+]
+
+# Palabras específicas que indican ubicación actual
+CURRENT_LOCATION_INDICATORS = ['me', 'my location', 'current location', 'here']
 
 class TextProcessor:
     def __init__(self):
@@ -20,22 +37,46 @@ class TextProcessor:
 
         self.stemmer = SnowballStemmer('english')
         self.stop_words = set(stopwords.words('english'))
+        self._mappings_mtime = None
+        self._mappings_checked_at = time.time()
+        self.mappings_check_interval = float(os.environ.get('MAPPINGS_CHECK_SECONDS', 5))
         self.mappings = self._load_mappings()
+        self._prepare_keywords()
+
+        # Gazetteer de ciudades en memoria (lo carga el motor de búsqueda al arrancar)
+        self.gazetteer = CityGazetteer(self._normalize_city_name)
+
+        # Caché de consultas ya parseadas (sin coordenadas; se sustituyen al leer)
+        self.parse_cache = LRUCache(
+            max_size=int(os.environ.get('PARSE_CACHE_SIZE', 1024)),
+            ttl=float(os.environ.get('PARSE_CACHE_TTL_SECONDS', 300))
+        )
+        self._parse_cache_generation = (self._mappings_mtime, self.gazetteer.version)
 
+    def _prepare_keywords(self):
+        """Prepara stems y autómatas de keywords a partir de los mapeos"""
         # Preparar stems de keywords
         self.category_stems = self._prepare_categories_stems()
         self.service_stems = self._prepare_services_stems()
 
+        # Autómatas de keywords: una sola pasada por consulta para todos los grupos
+        self._build_keyword_matchers()
+
+    @staticmethod
+    def _mappings_path() -> str:
+        return os.path.join(
+            os.path.dirname(os.path.dirname(__file__)),
+            'cfg',
+            'search_map.json'
+        )
+
     def _load_mappings(self) -> Dict:
         """
         Carga los mapeos desde el json
         """
         try:
-            config_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'cfg',
-                'search_map.json'
-            )
+            config_path = self._mappings_path()
+            self._mappings_mtime = os.path.getmtime(config_path)
             with open(config_path, 'r') as f:
                 return json.load(f)
 
@@ -59,19 +100,162 @@ class TextProcessor:
             for service_name, info in self.mappings['services'].items()
         }
 
+    def _keyword_tokens(self, keyword: str) -> List[str]:
+        return word_tokenize(keyword.lower(), preserve_line=True)
+
+    def _build_keyword_matchers(self):
+        """
+        Compila las keywords de search_map.json en dos autómatas Aho-Corasick:
+        uno sobre tokens tal cual (comidas, ubicación, horarios) y otro sobre
+        stems (categorías y servicios). El payload es (grupo, orden, valor);
+        el orden conserva la prioridad del fichero de configuración.
+        """
+        raw_matcher = KeywordMatcher()
+        stem_matcher = KeywordMatcher()
+
+        for order, (meal, info) in enumerate(self.mappings['meal_times'].items()):
+            for keyword in info['keywords']:
+                raw_matcher.add(self._keyword_tokens(keyword), ('meal_time', order, meal))
+
+        for keyword in self.mappings['location']['keywords']:
+            raw_matcher.add(self._keyword_tokens(keyword), ('location', 0, keyword))
+
+        time_keywords = self.mappings['time']['keywords']
+        for group in ('open_from', 'open_until'):
+            for keyword in time_keywords[group]:
+                raw_matcher.add(self._keyword_tokens(keyword), (group, 0, keyword))
+
+        for indicator in USER_LOCATION_INDICATORS:
+            raw_matcher.add(self._keyword_tokens(indicator), ('user_location', 0, indicator))
+        for indicator in CURRENT_LOCATION_INDICATORS:
+            raw_matcher.add(self._keyword_tokens(indicator), ('current_location', 0, indicator))
+
+        for group, section in (('category', 'categories'), ('service', 'services')):
+            for order, info in enumerate(self.mappings[section].values()):
+                for keyword in info['keywords']:
+                    stems = [self.stemmer.stem(token) for token in self._keyword_tokens(keyword)]
+                    stem_matcher.add(stems, (group, order, info['id']))
+
+        raw_matcher.build()
+        stem_matcher.build()
+        self._raw_matcher = raw_matcher
+        self._stem_matcher = stem_matcher
+
+    @staticmethod
+    def _group_matches(found: List[Tuple[int, int, Any]], matches: Dict) -> Dict:
+        for start, end, (group, order, value) in found:
+            matches.setdefault(group, []).append((start, end, order, value))
+        return matches
+
+    def _scan_keywords(self, tokens: List[str], stems: Optional[List[str]] = None) -> Dict[str, List[Tuple]]:
+        """
+        Busca todas las keywords en una sola pasada. Devuelve
+        {grupo: [(inicio, fin, orden, valor), ...]}; las posiciones de
+        categorías/servicios son relativas a stems.
+        """
+        matches = self._group_matches(self._raw_matcher.find_all(tokens), {})
+        if stems is not None:
+            self._group_matches(self._stem_matcher.find_all(stems), matches)
+        return matches
+
+    @staticmethod
+    def _first_match(matches: Dict, group: str):
+        """Valor de la coincidencia del grupo que aparece antes en la configuración"""
+        found = matches.get(group)
+        if not found:
+            return None
+        return min(found, key=lambda match: (match[2], match[0]))[3]
+
+    def analyze(self, text: str) -> List[str]:
+        """
+        Tokeniza, elimina stopwords y aplica stemming.
+        Es el analizador del índice de texto: documentos y consultas se procesan igual.
+        """
+        tokens = word_tokenize(text.lower(), preserve_line=True)
+        return [
+            self.stemmer.stem(token)
+            for token in tokens
+            if re.search(r'\w', token) and token not in self.stop_words
+        ]
+
+    def _maybe_reload_mappings(self):
+        """Recarga search_map.json si ha cambiado en disco (comprobación periódica)"""
+        now = time.time()
+        if now - self._mappings_checked_at < self.mappings_check_interval:
+            return
+        self._mappings_checked_at = now
+
+        try:
+            mtime = os.path.getmtime(self._mappings_path())
+        except OSError as e:
+            logging.error(f"Error comprobando search_map.json: {e}")
+            return
+        if mtime == self._mappings_mtime:
+            return
+
+        mappings = self._load_mappings()
+        if not mappings:
+            return
+        self.mappings = mappings
+        self._prepare_keywords()
+        logging.info("search_map.json modificado: mapeos y keywords recargados")
+
+    def _check_parse_cache(self):
+        """Invalida la caché de parseo si cambian los mapeos o el gazetteer"""
+        self._maybe_reload_mappings()
+
+        db_config = getattr(self, 'db_config', None)
+        if db_config:
+            from .db_pool import get_pool
+            self.gazetteer.maybe_refresh(get_pool(db_config))
+
+        generation = (self._mappings_mtime, self.gazetteer.version)
+        if generation != self._parse_cache_generation:
+            self._parse_cache_generation = generation
+            self.parse_cache.clear()
+
     def process_voice_query(self, text: str, coordinates: Optional[Dict] = None) -> Dict:
+        """
+        Procesa la consulta de voz usando la caché de parseo.
+        La clave es el texto normalizado más si hay coordenadas o no; las
+        coordenadas reales se sustituyen después de leer de la caché.
+        """
+        self._check_parse_cache()
+
+        key = (' '.join(text.lower().split()), coordinates is not None)
+        cached = self.parse_cache.get(key)
+        if cached is None:
+            parsed = self._parse_voice_query(text, coordinates)
+            template = copy.deepcopy(parsed)
+            template['coordinates'] = None
+            self.parse_cache.set(key, (parsed['coordinates'] is not None, template))
+            return parsed
+
+        uses_coordinates, template = cached
+        parsed = copy.deepcopy(template)
+        parsed['coordinates'] = coordinates if uses_coordinates else None
+        parsed['use_location'] = bool(parsed['coordinates'])
+        parsed['original_text'] = text
+        return parsed
+
+    def _parse_voice_query(self, text: str, coordinates: Optional[Dict] = None) -> Dict:
         """
         Procesa la consulta de voz con sistema de prioridades para ubicación
         MANTIENE TODOS LOS FILTROS EXISTENTES
         """
         # Tokenización y normalización básica
         tokens = word_tokenize(text.lower())
+        matches = self._scan_keywords(tokens)
         
         # 1. PRIORIDAD ALTA: Verificar si hay una ubicación específica mencionada
         specific_location_info = self._extract_location_from_text(tokens)
         
         # 2. PRIORIDAD MEDIA: Verificar si debe usar ubicación del usuario
-        use_user_location = self._should_use_user_location(tokens)
+        use_user_location = self._should_use_user_location(
+            tokens,
+            has_specific_location=specific_location_info is not None,
+            matches=matches
+        )
         
         # 3. Determinar qué coordenadas usar y estrategia de búsqueda
         final_coordinates = None
@@ -108,12 +292,19 @@ class TextProcessor:
             if token not in self.stop_words
         ]
         
+        # Categorías y servicios se buscan por stem sobre los tokens limpios
+        # (sin quitar stopwords, para que frases como "to go" sigan encajando)
+        self._group_matches(
+            self._stem_matcher.find_all([self.stemmer.stem(token) for token in cleaned_tokens]),
+            matches
+        )
+
         # MANTENER: Identificar categoría y servicio usando stems
-        category_id = self._identify_category(stemmed_tokens)
-        service_id = self._identify_service(stemmed_tokens)
-        location_context = self._check_location_context(tokens)
-        time_info = self._extract_time_info(tokens)  # MANTENER
-        meal_time = self._identify_meal_time(tokens)  # MANTENER
+        category_id = self._identify_category(stemmed_tokens, matches)
+        service_id = self._identify_service(stemmed_tokens, matches)
+        location_context = self._check_location_context(tokens, matches)
+        time_info = self._extract_time_info(tokens, matches)  # MANTENER
+        meal_time = self._identify_meal_time(tokens, matches)  # MANTENER
         
         # MANTENER: Construir filtros existentes
         filters = {}
@@ -133,7 +324,7 @@ class TextProcessor:
                 filters['city_not_found_in_db'] = True
         
         return {
-            'query': self._clean_search_text(cleaned_tokens, stemmed_tokens),
+            'query': self._clean_search_text(cleaned_tokens, stemmed_tokens, self._time_tokens() if time_info else None),
             'filters': filters,
             'use_location': bool(final_coordinates),
             'coordinates': final_coordinates,
@@ -142,28 +333,32 @@ class TextProcessor:
             'original_text': text
         }
 
-    def _identify_meal_time(self, tokens: List[str]) -> Optional[Dict]:
+    def _identify_meal_time(self, tokens: List[str], matches: Optional[Dict] = None) -> Optional[Dict]:
         """
         Identifica si se está buscando un momento específico de comida
         """
-        text = ' '.join(tokens)
-        meal_times = self.mappings['meal_times']
-
-        for  meal, info in meal_times.items():
-            if any(keyword in text for keyword in info['keywords']):
-                return {
-                    'type': meal,
-                    'typical_hours': info['typical_hours']
-                }
+        if matches is None:
+            matches = self._scan_keywords(tokens)
+
+        meal = self._first_match(matches, 'meal_time')
+        if meal:
+            return {
+                'type': meal,
+                'typical_hours': self.mappings['meal_times'][meal]['typical_hours']
+            }
         return None
 
-    def _extract_time_info(self, tokens: List[str]) -> Optional[Dict]:
+    def _extract_time_info(self, tokens: List[str], matches: Optional[Dict] = None) -> Optional[Dict]:
         """
         Extrae información de horarios del texto.
         Ejemplo: "open from 7 PM" -> {'open_from': '19:00'}
         """
-        time_keywords = self.mappings['time']['keywords']
-        text = ' '.join(tokens).lower()
+        if matches is None:
+            matches = self._scan_keywords(tokens)
+
+        def in_context(group: str, start: int, end: int) -> bool:
+            """Hay una keyword del grupo completa dentro de tokens[start:end]"""
+            return any(s >= start and e <= end for s, e, _, _ in matches.get(group, ()))
 
         time_info = {}
 
@@ -190,11 +385,10 @@ class TextProcessor:
                     period = tokens[i + 1].lower()
 
                 context_star = max(0, i - 3)
-                context_text = ' '.join(tokens[context_star:i])
 
-                if any(keyword in context_text for keyword in time_keywords['open_from']):
+                if in_context('open_from', context_star, i):
                     time_info['open_from'] = convert_to_24(hour, period or 'am')
-                elif any(keyword in context_text for keyword in time_keywords['open_until']):
+                elif in_context('open_until', context_star, i):
                     time_info['open_until'] = convert_to_24(hour, period or 'pm')
 
                 elif not time_info:
@@ -202,49 +396,48 @@ class TextProcessor:
 
         return time_info if time_info else None
 
-    def _check_location_context(self, tokens: List[str]) -> bool:
+    def _check_location_context(self, tokens: List[str], matches: Optional[Dict] = None) -> bool:
         """
         Revisa si el texto contiene información de localización
         """
-        location_keywords = self.mappings['location']['keywords']
-        has_location_keyword = any(keyword in ' '.join(tokens) for keyword in location_keywords)
-
-        # Palabras específicas que indican ubicación actual
-        current_location_indicators = ['me', 'my location', 'current location', 'me', 'here']
-        has_current_location = any(indicator in tokens for indicator in current_location_indicators)
+        if matches is None:
+            matches = self._scan_keywords(tokens)
 
-        return has_location_keyword or has_current_location
+        return bool(matches.get('location') or matches.get('current_location'))
 
-    def _identify_service(self, stemmed_tokens: List[str]) -> Optional[int]:
+    def _identify_service(self, stemmed_tokens: List[str], matches: Optional[Dict] = None) -> Optional[int]:
         """
-        Identifica el servicio en el texto
+        Identifica el servicio en el texto (frases completas, comparadas por stem)
         """
-        # Convertir tokens a texto para buscar frases completas
-        text = ' '.join(stemmed_tokens)
-
-        for service_name, service_info in self.mappings['services'].items():
-            # Buscar coincidencias exactas de frases
-            if any(keyword in text for keyword in service_info['keywords']):
-                return service_info['id']
-
-            # Buscar coincidencias de palabras compuestas
-            compound_matches = [
-                keyword for keyword in service_info['keywords']
-                if all(word in stemmed_tokens for word in keyword.split())
-            ]
-            if compound_matches:
-                return service_info['id']
-
-        return None
+        if matches is None:
+            matches = self._group_matches(self._stem_matcher.find_all(stemmed_tokens), {})
+        return self._first_match(matches, 'service')
 
-    def _identify_category(self, stemmed_tokens: List[str]) -> Optional[int]:
+    def _identify_category(self, stemmed_tokens: List[str], matches: Optional[Dict] = None) -> Optional[int]:
         """Identifica la categoría usando stems"""
-        for category_name, stems in self.category_stems.items():
-            if any(token in stems for token in stemmed_tokens):
-                return self.mappings['categories'][category_name]['id']
-        return None
+        if matches is None:
+            matches = self._group_matches(self._stem_matcher.find_all(stemmed_tokens), {})
+        return self._first_match(matches, 'category')
 
-    def _clean_search_text(self, tokens: List[str], stemmed_tokens: List[str]) -> str:
+    def _time_tokens(self) -> set:
+        """
+        Palabras de una franja horaria ya convertida en filtro ("open after
+        9 pm"): no deben quedar en el texto de búsqueda
+        """
+        time_keywords = self.mappings['time']['keywords']
+        words = {'open', 'opens', 'opened', 'close', 'closes', 'closed', 'one', 'two', 'three', 'four',
+                 'five', 'six', 'seven', 'eight', 'nine', 'ten', 'eleven', 'twelve'}
+        for group in ('open_from', 'open_until', 'time_indicators', 'hours'):
+            for keyword in time_keywords.get(group, []):
+                words.update(keyword.lower().split())
+        return words
+
+    def _clean_search_text(
+        self,
+        tokens: List[str],
+        stemmed_tokens: List[str],
+        time_tokens: Optional[set] = None
+    ) -> str:
         """Limpia el texto manteniendo términos relevantes"""
         # Obtener todos los stems a remover
         remove_stems = set()
@@ -267,6 +460,8 @@ class TextProcessor:
         # Mantener solo palabras relevantes
         clean_tokens = []
         for token, stem in zip(tokens, stemmed_tokens):
+            if time_tokens and (token in time_tokens or token.isdigit()):
+                continue
             if stem not in remove_stems and token not in self.stop_words:
                 clean_tokens.append(token)
 
@@ -309,7 +504,8 @@ class TextProcessor:
                     clean_city_name = self._clean_city_name(location_name)
                     
                     # Verificar si la ciudad existe en la base de datos
-                    verified_city = self._verify_city_exists_in_db(clean_city_name)
+                    with stage('city'):
+                        verified_city = self._verify_city_exists_in_db(clean_city_name)
                     
                     if verified_city:
                         print(f"Ciudad verificada en DB: '{verified_city}' (detectada: '{clean_city_name}')")
@@ -352,29 +548,25 @@ class TextProcessor:
         
         return ' '.join(cleaned_words).strip()
     
-    def _should_use_user_location(self, tokens: List[str]) -> bool:
+    def _should_use_user_location(
+        self,
+        tokens: List[str],
+        has_specific_location: Optional[bool] = None,
+        matches: Optional[Dict] = None
+    ) -> bool:
         """
-        Determina si debe usar la ubicación del usuario basándose en el texto
+        Determina si debe usar la ubicación del usuario basándose en el texto.
+        has_specific_location evita volver a extraer la ubicación si ya se hizo.
         """
-        user_location_indicators = [
-            'near me', 'close to me', 'around me', 'nearby me',
-            'current location', 'my location', 'here', 'nearby',
-            'walking distance', 'close', 'around'
-        ]
-        
-        text = ' '.join(tokens).lower()
-        
-        # Verificar palabras clave del mapping existente
-        location_keywords = self.mappings.get('location', {}).get('keywords', [])
-        
-        # Combinar ambas listas
-        all_indicators = user_location_indicators + location_keywords
-        
-        # Verificar si alguna palabra clave está presente
-        has_user_keywords = any(indicator in text for indicator in all_indicators)
+        if matches is None:
+            matches = self._scan_keywords(tokens)
+
+        # Indicadores de ubicación del usuario o keywords de ubicación del mapping
+        has_user_keywords = bool(matches.get('user_location') or matches.get('location'))
         
         # Verificar si NO hay ubicación específica mencionada
-        has_specific_location = self._extract_location_from_text(tokens) is not None
+        if has_specific_location is None:
+            has_specific_location = self._extract_location_from_text(tokens) is not None
         
         return has_user_keywords and not has_specific_location
     
@@ -468,18 +660,33 @@ class TextProcessor:
 
     def _verify_city_exists_in_db(self, city_name: str) -> Optional[str]:
         """
-        Verifica si la ciudad existe en la base de datos y retorna el nombre exacto
+        Verifica si la ciudad existe en la base de datos y retorna el nombre exacto.
+        Se resuelve contra el gazetteer en memoria; solo si no se pudo cargar se
+        consulta la base de datos.
         """
+        discard = False
         try:
-            import mysql.connector
+            from .db_pool import get_pool, is_disconnect
             
             # Usar configuración de DB del motor de búsqueda
             db_config = getattr(self, 'db_config', None)
+
+            if db_config:
+                self.gazetteer.maybe_refresh(get_pool(db_config))
+            if self.gazetteer.loaded:
+                city = self.gazetteer.lookup(city_name, self._get_city_variations(city_name))
+                if city:
+                    print(f"Ciudad encontrada en gazetteer: '{city}' (buscando: '{city_name}')")
+                else:
+                    print(f"Ciudad no encontrada en gazetteer: '{city_name}'")
+                return city
+
             if not db_config:
                 print("Warning: No hay configuración de DB disponible para verificar ciudad")
                 return city_name
             
-            conn = mysql.connector.connect(**db_config)
+            pool = get_pool(db_config)
+            conn = pool.acquire()
             cursor = conn.cursor()
             
             # Generar variaciones de la ciudad
@@ -513,8 +720,10 @@ class TextProcessor:
             
         except Exception as e:
             print(f"Error verificando ciudad en DB: {e}")
+            discard = is_disconnect(e)
             return city_name
         finally:
-            if 'conn' in locals() and conn.is_connected():
-                cursor.close()
-                conn.close()
\ No newline at end of file
+            if 'conn' in locals():
+                if 'cursor' in locals():
+                    cursor.close()
+                pool.release(conn, discard=discard)
\ No newline at end of file
@@ -0,0 +1,525 @@
+"""
+Trazas por petición: un árbol de spans (petición -> etapas -> consultas SQL)
+en un ContextVar, sin dependencias de OpenTelemetry. Las conexiones del pool
+envuelven sus cursores (TracedConnection) para que cada consulta sea un span
+con su huella (la SQL sin valores), filas y duración.
+
+Es opt-in (TRACING_ENABLED=true). Las peticiones que superan TRACE_SLOW_MS
+se guardan en un buffer circular (GET /debug/slow, por worker, con
+DIAGNOSTICS_ENABLED=true) y, con TRACE_OTLP_ENDPOINT, se envían en OTLP/JSON
+a un colector de OpenTelemetry (p. ej. http://localhost:4318/v1/traces).
+
+    TRACING_ENABLED=True
+    TRACE_SLOW_MS=1000
+    TRACE_SLOW_BUFFER_SIZE=50
+    TRACE_MAX_SPANS=2000
+    TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+    TRACE_EXPORT_SAMPLE_RATE=0
+    TRACE_SERVICE_NAME=foodly-search
+"""
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager
+from collections import deque
+from functools import lru_cache
+import contextvars
+import threading
+import logging
+import datetime
+import atexit
+import random
+import queue
+import time
+import os
+import re
+
+_current: contextvars.ContextVar = contextvars.ContextVar('search_trace', default=None)
+
+SLOW_TRACE_MS = float(os.environ.get('TRACE_SLOW_MS', 1000))
+MAX_SPANS = int(os.environ.get('TRACE_MAX_SPANS', 2000))
+SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'foodly-search')
+
+# Códigos de estado y tipos de span de OTLP
+STATUS_OK, STATUS_ERROR = 1, 2
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+
+def tracing_enabled() -> bool:
+    return os.environ.get('TRACING_ENABLED', 'False').lower() == 'true'
+
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_PLACEHOLDER_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+_VALUES_LIST = re.compile(r'(\(\?\+?\))(?:\s*,\s*\(\?\+?\))+')
+_WHITESPACE = re.compile(r'\s+')
+_PARENTHESES = re.compile(r'\([^()]*\)')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+`?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """
+    Forma de una consulta sin valores: literales y %s pasan a ?, y las listas
+    de longitud variable (IN, FIELD, VALUES) se colapsan en ?+ para que la
+    misma consulta con otra página de ids tenga la misma huella
+    """
+    shape = _STRING.sub('?', sql)
+    shape = shape.replace('%s', '?')
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('IN (?+)', shape)
+    shape = _PLACEHOLDER_LIST.sub('?+', shape)
+    shape = _VALUES_LIST.sub(r'\1+', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+@lru_cache(maxsize=2048)
+def statement_name(shape: str) -> str:
+    """Nombre de span al estilo de OpenTelemetry: operación y tabla principal"""
+    operation = shape.split(' ', 1)[0].upper() if shape else 'SQL'
+    # La tabla de la consulta exterior, no la de sus subconsultas
+    outer = shape
+    while True:
+        stripped = _PARENTHESES.sub('', outer)
+        if stripped == outer:
+            break
+        outer = stripped
+    table = _TABLE.search(outer)
+    return f"{operation} {table.group(1)}" if table else operation
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns', 'attributes', 'status', 'message')
+
+    def __init__(self, name: str, parent_id: Optional[str], kind: int = KIND_INTERNAL, attributes: Optional[Dict] = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = None
+        self.message = None
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def set_error(self, error: Exception):
+        self.status = STATUS_ERROR
+        self.message = f"{type(error).__name__}: {error}"
+
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans de una petición. Solo la usa el hilo de la petición"""
+
+    def __init__(self, name: str, attributes: Optional[Dict] = None):
+        self.trace_id = os.urandom(16).hex()
+        self.root = Span(name, None, KIND_SERVER, attributes)
+        self.spans: List[Span] = [self.root]
+        self.stack: List[Span] = [self.root]
+        self.dropped = 0
+
+    def start_span(self, name: str, kind: int = KIND_INTERNAL, attributes: Optional[Dict] = None) -> Optional[Span]:
+        """Span hijo del span abierto más interno (None si se superó TRACE_MAX_SPANS)"""
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        span = Span(name, self.stack[-1].span_id, kind, attributes)
+        self.spans.append(span)
+        return span
+
+    def duration_ms(self) -> float:
+        return self.root.duration_ms()
+
+    def db_summary(self) -> Dict:
+        """Consultas agrupadas por huella, de más a menos tiempo total"""
+        shapes: Dict[str, Dict] = {}
+        for span in self.spans:
+            statement = span.attributes.get('db.statement')
+            if statement is None:
+                continue
+            entry = shapes.setdefault(statement, {'statement': statement, 'count': 0, 'total_ms': 0.0, 'rows': 0})
+            entry['count'] += 1
+            entry['total_ms'] += span.duration_ms() + span.attributes.get('db.fetch_ms', 0.0)
+            entry['rows'] += span.attributes.get('db.rows', 0)
+        ordered = sorted(shapes.values(), key=lambda entry: -entry['total_ms'])
+        for entry in ordered:
+            entry['total_ms'] = round(entry['total_ms'], 3)
+        return {
+            'queries': sum(entry['count'] for entry in ordered),
+            'total_ms': round(sum(entry['total_ms'] for entry in ordered), 3),
+            'statements': ordered
+        }
+
+    def tree(self) -> Dict:
+        """Árbol de spans anidado (para /debug/slow)"""
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+
+        def node(span: Span) -> Dict:
+            entry = {
+                'name': span.name,
+                'offset_ms': round((span.start_ns - self.root.start_ns) / 1e6, 3),
+                'duration_ms': round(span.duration_ms(), 3)
+            }
+            if span.attributes:
+                entry['attributes'] = span.attributes
+            if span.status == STATUS_ERROR:
+                entry['error'] = span.message
+            if span.span_id in children:
+                entry['children'] = [node(child) for child in children[span.span_id]]
+            return entry
+
+        return node(self.root)
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'started_at': datetime.datetime.fromtimestamp(self.root.start_ns / 1e9).isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.duration_ms(), 3),
+            'spans': len(self.spans),
+            'dropped_spans': self.dropped,
+            'db': self.db_summary(),
+            'tree': self.tree()
+        }
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def to_otlp(traces: List[Trace]) -> Dict:
+    """ExportTraceServiceRequest en OTLP/JSON (ids en hexadecimal, tiempos en ns como texto)"""
+    spans = []
+    for trace in traces:
+        for span in trace.spans:
+            otlp_span = {
+                'traceId': trace.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': span.kind,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns or span.start_ns),
+                'attributes': _otlp_attributes(span.attributes)
+            }
+            if span.parent_id:
+                otlp_span['parentSpanId'] = span.parent_id
+            if span.status is not None:
+                otlp_span['status'] = {'code': span.status}
+                if span.message:
+                    otlp_span['status']['message'] = span.message
+            spans.append(otlp_span)
+    return {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME, 'process.pid': os.getpid()})},
+            'scopeSpans': [{'scope': {'name': 'foodly.search.tracing'}, 'spans': spans}]
+        }]
+    }
+
+
+class SlowTraceBuffer:
+    """Buffer circular con las últimas trazas lentas del proceso"""
+
+    def __init__(self, size: Optional[int] = None):
+        self._traces = deque(maxlen=size or int(os.environ.get('TRACE_SLOW_BUFFER_SIZE', 50)))
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+            self.recorded += 1
+
+    def traces(self, limit: Optional[int] = None) -> List[Trace]:
+        """Las más recientes primero"""
+        with self._lock:
+            traces = list(reversed(self._traces))
+        return traces[:limit] if limit else traces
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+class OtlpExporter:
+    """
+    Envío de trazas a un colector OTLP/HTTP en segundo plano. Como el
+    registro de búsquedas, la petición solo encola: con la cola llena la
+    traza se descarta y se cuenta.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, queue_size: int = 1000, batch_size: int = 50):
+        self.endpoint = endpoint if endpoint is not None else os.environ.get('TRACE_OTLP_ENDPOINT')
+        self.sample_rate = float(os.environ.get('TRACE_EXPORT_SAMPLE_RATE', 0))
+        self.batch_size = batch_size
+        self._queue_size = queue_size
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        """Arranca el hilo de envío (una vez por proceso, también tras un fork)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue(maxsize=self._queue_size)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def submit(self, trace: Trace):
+        if not self.endpoint:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _batch(self, block: bool = True) -> List[Trace]:
+        batch = []
+        try:
+            if block:
+                batch.append(self._queue.get())
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while True:
+            self._send(self._batch())
+
+    def _send(self, batch: List[Trace]):
+        if not batch:
+            return
+        try:
+            import requests
+            response = requests.post(self.endpoint, json=to_otlp(batch), timeout=5)
+            response.raise_for_status()
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logging.warning(f"Error exportando {len(batch)} trazas a {self.endpoint}: {e}")
+
+    def flush(self):
+        """Envía lo que quede en la cola (al cerrar el proceso)"""
+        while True:
+            batch = self._batch(block=False)
+            if not batch:
+                return
+            self._send(batch)
+
+    def stats(self) -> Dict:
+        return {
+            'endpoint': self.endpoint,
+            'sample_rate': self.sample_rate,
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+
+SLOW_TRACES = SlowTraceBuffer()
+EXPORTER = OtlpExporter()
+
+
+def start(name: str, **attributes) -> Optional[Trace]:
+    """Abre la traza de la petición en curso (None con TRACING_ENABLED=false)"""
+    if not tracing_enabled():
+        return None
+    trace = Trace(name, attributes)
+    _current.set(trace)
+    return trace
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def finish(**attributes) -> Optional[Trace]:
+    """
+    Cierra la traza en curso; si es lenta la guarda en SLOW_TRACES y la
+    exporta (las demás se exportan con probabilidad TRACE_EXPORT_SAMPLE_RATE)
+    """
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    trace.root.attributes.update(attributes)
+    trace.root.end()
+    if trace.duration_ms() >= SLOW_TRACE_MS:
+        trace.root.attributes['slow'] = True
+        SLOW_TRACES.add(trace)
+        EXPORTER.submit(trace)
+    elif EXPORTER.sample_rate and random.random() < EXPORTER.sample_rate:
+        EXPORTER.submit(trace)
+    return trace
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Span hijo del actual mientras dura el bloque (no hace nada sin traza activa)"""
+    trace = _current.get()
+    current_span = trace.start_span(name, kind, attributes) if trace is not None else None
+    if current_span is None:
+        yield None
+        return
+    trace.stack.append(current_span)
+    try:
+        yield current_span
+    except Exception as e:
+        current_span.set_error(e)
+        raise
+    finally:
+        current_span.end()
+        trace.stack.pop()
+
+
+# Funciones (huella, sql, parámetros, ms) llamadas tras cada consulta, con o sin traza
+_statement_observers: List[Callable] = []
+
+
+def add_statement_observer(observer: Callable):
+    """Registra un observador de todas las consultas de las conexiones del pool"""
+    if observer not in _statement_observers:
+        _statement_observers.append(observer)
+
+
+def instrumentation_enabled() -> bool:
+    """Si las conexiones del pool deben envolverse (trazas u observadores de consultas)"""
+    return tracing_enabled() or bool(_statement_observers)
+
+
+class TracedCursor:
+    """
+    Cursor que registra cada execute como span de base de datos. El span
+    mide la ejecución; las filas y el tiempo de lectura se le añaden al
+    hacer fetch. También avisa a los observadores de consultas. Sin traza
+    activa ni observadores solo delega.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._span: Optional[Span] = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _traced(self, method, operation, params, *args, **kwargs):
+        trace = _current.get()
+        if trace is None and not _statement_observers:
+            self._span = None
+            return method(operation, params, *args, **kwargs)
+
+        shape = fingerprint(operation)
+        self._span = None
+        if trace is not None:
+            self._span = trace.start_span(statement_name(shape), KIND_CLIENT, {
+                'db.system': 'mysql',
+                'db.statement': shape,
+                'db.rows': 0
+            })
+        started = time.perf_counter()
+        try:
+            return method(operation, params, *args, **kwargs)
+        except Exception as e:
+            if self._span is not None:
+                self._span.set_error(e)
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if self._span is not None:
+                self._span.end()
+                if not shape.upper().startswith('SELECT'):
+                    self._span.attributes['db.rows'] = max(getattr(self._cursor, 'rowcount', 0) or 0, 0)
+            for observer in _statement_observers:
+                try:
+                    observer(shape, operation, params, elapsed_ms)
+                except Exception as e:
+                    logging.error(f"Error en el observador de consultas {observer}: {e}")
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._traced(self._cursor.execute, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        return self._traced(self._cursor.executemany, operation, seq_params, *args, **kwargs)
+
+    def _fetched(self, started: float, rows: int):
+        if self._span is not None:
+            self._span.attributes['db.rows'] += rows
+            self._span.attributes['db.fetch_ms'] = round(
+                self._span.attributes.get('db.fetch_ms', 0.0) + (time.perf_counter() - started) * 1000, 3
+            )
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(started, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def close(self):
+        self._span = None
+        return self._cursor.close()
+
+
+class TracedConnection:
+    """Conexión del pool cuyos cursores se trazan; el resto de atributos se delegan"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._connection.cursor(*args, **kwargs))